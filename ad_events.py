@@ -0,0 +1,264 @@
+import atexit
+import io
+import os
+import threading
+import time
+from datetime import datetime
+import db
+import data_cache
+
+# Flush the buffer once it holds this many events or this many seconds have passed
+EVENT_BATCH_SIZE = int(os.environ.get('AD_EVENT_BATCH_SIZE', '5000'))
+EVENT_FLUSH_INTERVAL = float(os.environ.get('AD_EVENT_FLUSH_INTERVAL', '1.0'))
+# Events kept in memory while the database is unavailable before new ones are dropped
+EVENT_MAX_BUFFER = int(os.environ.get('AD_EVENT_MAX_BUFFER', '500000'))
+# How often buffered events are folded into campaigns.views/impressions/spent
+ROLLUP_INTERVAL = float(os.environ.get('AD_EVENT_ROLLUP_INTERVAL', '5.0'))
+# Minimum seconds between campaign list reloads caused by rolled-up metrics
+CAMPAIGN_METRICS_RELOAD_INTERVAL = float(os.environ.get('CAMPAIGN_METRICS_RELOAD_INTERVAL', '30'))
+
+# Advisory lock key so only one process runs the rollup at a time
+ROLLUP_LOCK_ID = 7416002
+
+_COPY_SQL = """
+    COPY ad_events (campaign_id, driver_id, event_type, views, impressions, spent, occurred_at)
+    FROM STDIN
+"""
+
+# Events from transactions with txid in [last_xmin, snapshot xmin) have all
+# committed or aborted, so each rollup folds in exactly the events that the
+# previous one could not yet see.
+_ROLLUP_SQL = """
+    WITH daily AS (
+        SELECT campaign_id,
+               occurred_at::date AS day,
+               SUM(views) AS views,
+               SUM(impressions) AS impressions,
+               SUM(spent) AS spent
+        FROM ad_events
+        WHERE txid >= %(low)s AND txid < %(high)s
+        GROUP BY campaign_id, occurred_at::date
+    ), daily_upsert AS (
+        INSERT INTO campaign_daily_stats (campaign_id, day, views, impressions, spent)
+        SELECT campaign_id, day, views, impressions, spent FROM daily
+        ORDER BY campaign_id, day
+        ON CONFLICT (campaign_id, day) DO UPDATE SET
+            views = campaign_daily_stats.views + EXCLUDED.views,
+            impressions = campaign_daily_stats.impressions + EXCLUDED.impressions,
+            spent = campaign_daily_stats.spent + EXCLUDED.spent
+    ), totals AS (
+        SELECT campaign_id,
+               SUM(views) AS views,
+               SUM(impressions) AS impressions,
+               SUM(spent) AS spent
+        FROM daily
+        GROUP BY campaign_id
+    )
+    UPDATE campaigns c SET
+        views = c.views + t.views,
+        impressions = c.impressions + t.impressions,
+        spent = c.spent + t.spent
+    FROM totals t
+    WHERE c.id = t.campaign_id
+    RETURNING c.id, c.advertiser_id, c.name, c.status, c.budget,
+              c.spent, c.views, c.impressions
+"""
+
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+class AdEventWriter:
+    """
+    In-process buffer for ad events, written to ad_events in batches with COPY.
+
+    record() only appends to a list, so callers never wait on the database.
+    A background thread flushes the buffer on size or time thresholds and
+    periodically runs the rollup into the campaigns table.
+    """
+
+    def __init__(self, batch_size=EVENT_BATCH_SIZE, flush_interval=EVENT_FLUSH_INTERVAL,
+                 rollup_interval=ROLLUP_INTERVAL, max_buffer=EVENT_MAX_BUFFER):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rollup_interval = rollup_interval
+        self.max_buffer = max_buffer
+
+        self._buffer = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._thread = None
+        self._stats = {"recorded": 0, "flushed": 0, "batches": 0, "dropped": 0, "errors": 0}
+
+    def record(self, campaign_id, event_type="impression", views=0, impressions=0, spent=0,
+               driver_id=None, occurred_at=None):
+        """
+        Buffer one ad event
+
+        Parameters:
+        - campaign_id: Campaign the event belongs to
+        - event_type: Event type (impression, view, metrics)
+        - views / impressions / spent: Amounts to add to the campaign
+        - driver_id: Cab that displayed the ad (optional)
+        - occurred_at: Event time (defaults to now)
+        """
+        event = (
+            campaign_id, driver_id, event_type, views, impressions, spent,
+            occurred_at or datetime.now()
+        )
+        with self._cond:
+            if len(self._buffer) >= self.max_buffer:
+                self._stats["dropped"] += 1
+                return False
+            self._buffer.append(event)
+            self._stats["recorded"] += 1
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+        self._ensure_worker()
+        return True
+
+    def flush(self):
+        """
+        Write all buffered events in a single COPY
+
+        Returns:
+        - The number of events written, or None if the write failed (the
+          events stay buffered for the next flush)
+        """
+        with self._flush_lock:
+            with self._cond:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return 0
+
+            data = io.StringIO()
+            for event in batch:
+                data.write("\t".join(_copy_value(v) for v in event))
+                data.write("\n")
+            data.seek(0)
+
+            written = False
+            with db.get_db_connection() as conn:
+                if conn:
+                    try:
+                        with conn.cursor() as cur:
+                            cur.copy_expert(_COPY_SQL, data)
+                        conn.commit()
+                        written = True
+                    except Exception as e:
+                        conn.rollback()
+                        print(f"Error writing ad events: {e}")
+
+            if not written:
+                # Put the batch back in front of anything recorded meanwhile
+                with self._cond:
+                    self._stats["errors"] += 1
+                    self._buffer[:0] = batch
+                return None
+
+            with self._cond:
+                self._stats["flushed"] += len(batch)
+                self._stats["batches"] += 1
+            return len(batch)
+
+    def pending(self):
+        """Number of events waiting to be flushed"""
+        with self._cond:
+            return len(self._buffer)
+
+    def stats(self):
+        """Counters for recorded, flushed, dropped and failed events"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._buffer)
+        return stats
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._thread_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="ad-event-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        last_flush = last_rollup = time.monotonic()
+        while True:
+            with self._cond:
+                timeout = self.flush_interval - (time.monotonic() - last_flush)
+                if len(self._buffer) < self.batch_size and timeout > 0:
+                    self._cond.wait(timeout)
+            try:
+                self.flush()
+                last_flush = time.monotonic()
+                if last_flush - last_rollup >= self.rollup_interval:
+                    rollup_events()
+                    last_rollup = last_flush
+            except Exception as e:
+                print(f"Ad event writer error: {e}")
+                time.sleep(self.flush_interval)
+
+
+def rollup_events():
+    """
+    Fold newly committed ad events into campaigns.views/impressions/spent
+    and the per-day totals in campaign_daily_stats
+
+    Returns:
+    - List of updated campaign rows (empty if nothing moved or another process holds the rollup lock)
+    """
+    with db.get_db_connection() as conn:
+        if not conn:
+            return []
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_xact_lock(%s) AS locked", (ROLLUP_LOCK_ID,))
+                if not cur.fetchone()['locked']:
+                    conn.rollback()
+                    return []
+
+                cur.execute("SELECT last_xmin FROM ad_event_rollup_state WHERE id = 1 FOR UPDATE")
+                low = cur.fetchone()['last_xmin']
+                cur.execute("SELECT txid_snapshot_xmin(txid_current_snapshot()) AS xmin")
+                high = cur.fetchone()['xmin']
+                if high <= low:
+                    conn.rollback()
+                    return []
+
+                cur.execute(_ROLLUP_SQL, {"low": low, "high": high})
+                updated = cur.fetchall()
+                cur.execute("UPDATE ad_event_rollup_state SET last_xmin = %s WHERE id = 1", (high,))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"Error rolling up ad events: {e}")
+            return []
+
+    if updated:
+        # Counters move on every rollup; sessions see them at most one reload interval late
+        data_cache.expire(data_cache.CAMPAIGNS, within=CAMPAIGN_METRICS_RELOAD_INTERVAL)
+        try:
+            import milestones
+            milestones.check_milestones(updated)
+        except Exception as e:
+            print(f"Error checking campaign milestones: {e}")
+    return updated
+
+
+event_writer = AdEventWriter()
+atexit.register(event_writer.flush)
+
+def record_event(campaign_id, event_type="impression", views=0, impressions=0, spent=0,
+                 driver_id=None, occurred_at=None):
+    """Buffer an ad event for batched ingestion"""
+    return event_writer.record(campaign_id, event_type, views, impressions, spent, driver_id, occurred_at)
+
+def record_impression(campaign_id, driver_id=None, spent=0):
+    """Buffer a single ad impression"""
+    return event_writer.record(campaign_id, "impression", impressions=1, spent=spent, driver_id=driver_id)
+
+def record_view(campaign_id, driver_id=None):
+    """Buffer a single ad view"""
+    return event_writer.record(campaign_id, "view", views=1, driver_id=driver_id)
@@ -0,0 +1,196 @@
+import os
+import threading
+import time
+from datetime import date, datetime
+import numpy as np
+import data_cache
+import budget_pacing
+
+# Rebuild candidate lists at least this often even without campaign writes (seconds)
+SCHEDULER_REFRESH_INTERVAL = float(os.environ.get('AD_SCHEDULER_REFRESH_INTERVAL', '60'))
+# Seconds to wait before retrying after campaigns failed to load
+SCHEDULER_RETRY_INTERVAL = 5
+
+def _to_date(value):
+    if value is None or (isinstance(value, date) and not isinstance(value, datetime)):
+        return value
+    if isinstance(value, datetime):
+        return value.date()
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+
+class AdScheduler:
+    """
+    Decides which campaign each cab displays.
+
+    Eligible campaigns (Active, inside their date window, budget left) are
+    precomputed into per-region candidate lists weighted by remaining budget.
+    Campaigns without target regions are eligible everywhere. A decision is
+    then a region lookup plus a weighted draw, vectorized per region for batches.
+    """
+
+    def __init__(self, seed=None):
+        self._lock = threading.RLock()
+        self._rng = np.random.default_rng(seed)
+        self._by_region = {}  # region -> (campaign ids, cumulative weights, id set)
+        self._anywhere = None
+        self._built_version = None
+        self._built_at = 0.0
+        self._retry_at = 0.0
+        self._refresh_lock = threading.Lock()
+
+    def _compile(self, candidates):
+        if not candidates:
+            return None
+        ids = np.array([campaign_id for campaign_id, _ in candidates], dtype=np.int64)
+        weights = np.cumsum([float(weight) for _, weight in candidates])
+        return ids, weights, frozenset(ids.tolist())
+
+    def build(self, campaigns, today=None):
+        """
+        Precompute per-region candidate lists from a campaign snapshot
+
+        Parameters:
+        - campaigns: Campaign dicts with id, status, budget, spent, start_date, end_date, regions
+        - today: Date used for the date window (defaults to today)
+        """
+        today = today or date.today()
+        by_region = {}
+        anywhere = []
+        for campaign in campaigns:
+            if campaign.get("status") != "Active":
+                continue
+            start_date = _to_date(campaign.get("start_date"))
+            end_date = _to_date(campaign.get("end_date"))
+            if (start_date and start_date > today) or (end_date and end_date < today):
+                continue
+            remaining = (campaign.get("budget") or 0) - (campaign.get("spent") or 0)
+            if remaining <= 0 or budget_pacing.is_exhausted(campaign["id"]):
+                continue
+
+            regions = campaign.get("regions") or []
+            if regions:
+                for region in regions:
+                    by_region.setdefault(region, []).append((campaign["id"], remaining))
+            else:
+                anywhere.append((campaign["id"], remaining))
+
+        with self._lock:
+            self._by_region = {
+                region: self._compile(candidates + anywhere) for region, candidates in by_region.items()
+            }
+            self._anywhere = self._compile(anywhere)
+            self._built_at = time.monotonic()
+
+    def refresh(self, force=False):
+        """
+        Rebuild the candidate lists if campaigns changed or the snapshot is stale
+
+        Campaigns are loaded outside the scheduler lock, so decisions keep
+        using the current lists meanwhile. If the load fails or returns no
+        campaigns, the last good lists are kept and the load is retried after
+        SCHEDULER_RETRY_INTERVAL seconds.
+        """
+        version = data_cache.get_version(data_cache.CAMPAIGNS)
+        now = time.monotonic()
+        with self._lock:
+            stale = now - self._built_at > SCHEDULER_REFRESH_INTERVAL
+            if not force and (now < self._retry_at or (version == self._built_version and not stale)):
+                return
+        # One session reloads; the others keep deciding from the current lists
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        try:
+            import db
+            campaigns = db.get_campaigns()
+            if not campaigns:
+                # get_campaigns() returns [] on a database error as well
+                with self._lock:
+                    self._retry_at = time.monotonic() + SCHEDULER_RETRY_INTERVAL
+                return
+            self.build(campaigns)
+            with self._lock:
+                self._built_version = version
+        finally:
+            self._refresh_lock.release()
+
+    def candidates(self, area):
+        """Campaign ids eligible for a region"""
+        entry = self._by_region.get(area, self._anywhere)
+        return entry[0].tolist() if entry else []
+
+    def decide(self, driver_id, area, current_ad=None):
+        """Pick the campaign a single cab should display (None if nothing is eligible)"""
+        return self.decide_batch([driver_id], [area], [current_ad])[0]
+
+    def decide_batch(self, driver_ids, areas, current_ads=None, refresh=True):
+        """
+        Pick campaigns for many cabs at once
+
+        Parameters:
+        - driver_ids: Cab ids
+        - areas: Current region name of each cab
+        - current_ads: Campaign each cab is displaying (drivers.current_ad_displaying);
+          a cab keeps it while it is still eligible in its region. None draws afresh.
+        - refresh: Rebuild stale candidate lists first; callers holding a
+          database connection refresh() beforehand and pass False
+
+        Returns:
+        - List of campaign ids (None where no campaign is eligible)
+        """
+        if refresh:
+            self.refresh()
+        if current_ads is None:
+            current_ads = [None] * len(driver_ids)
+        result = [None] * len(driver_ids)
+        with self._lock:
+            by_region = self._by_region
+            anywhere = self._anywhere
+            groups = {}
+            for i, (area, current) in enumerate(zip(areas, current_ads)):
+                entry = by_region.get(area, anywhere)
+                if entry is None:
+                    continue
+                if current in entry[2]:
+                    result[i] = current
+                    continue
+                groups.setdefault(area, []).append(i)
+
+            for area, indexes in groups.items():
+                ids, weights, _ = by_region.get(area, anywhere)
+                draws = self._rng.random(len(indexes)) * weights[-1]
+                picks = ids[np.searchsorted(weights, draws, side="right")]
+                for i, campaign_id in zip(indexes, picks.tolist()):
+                    result[i] = campaign_id
+        return result
+
+    def run_tick(self):
+        """
+        Rotate ads for every active cab and persist the assignments
+
+        Returns:
+        - Number of cabs assigned
+        """
+        import db
+        drivers = [d for d in db.get_drivers() if d.get("status") == "Active"]
+        if not drivers:
+            return 0
+        driver_ids = [d["id"] for d in drivers]
+        decisions = self.decide_batch(driver_ids, [d.get("current_location_area") for d in drivers])
+        db.update_driver_ads(list(zip(driver_ids, decisions)))
+        return len(drivers)
+
+
+ad_scheduler = AdScheduler()
+
+def refresh():
+    """Rebuild the process-wide scheduler's candidate lists if they are stale"""
+    ad_scheduler.refresh()
+
+def decide_ads(driver_ids, areas, current_ads=None, refresh=True):
+    """Pick campaigns for cabs using the process-wide scheduler"""
+    return ad_scheduler.decide_batch(driver_ids, areas, current_ads, refresh)
+
+def run_tick():
+    """Rotate ads across the active fleet"""
+    return ad_scheduler.run_tick()
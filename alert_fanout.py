@@ -0,0 +1,132 @@
+import argparse
+import os
+import sys
+import db
+import sms_alerts
+import sms_outbox
+
+# Recipients already sent the same alert within this window are skipped (seconds)
+FANOUT_DEDUP_WINDOW = float(os.environ.get('FANOUT_DEDUP_WINDOW', str(24 * 3600)))
+
+# Each audience is a query returning phone, recipient_key and the keyword
+# arguments of its message builder, plus the builder itself. Query parameters
+# are passed by name from fan_out(**params).
+AUDIENCES = {
+    # Drivers with a document expiring within %(days)s days
+    "document_expiry": ("""
+        SELECT u.phone,
+               'driver:' || d.id || ':' || dd.document_type AS recipient_key,
+               u.name AS driver_name,
+               replace(dd.document_type, '_', ' ') AS document_type,
+               dd.expiry_date - CURRENT_DATE AS days_remaining
+        FROM driver_documents dd
+        JOIN drivers d ON d.id = dd.driver_id
+        JOIN users u ON u.id = d.user_id
+        WHERE dd.expiry_date BETWEEN CURRENT_DATE AND CURRENT_DATE + %(days)s
+          AND u.phone IS NOT NULL
+    """, sms_alerts.get_document_expiry_alert, {"days": 30}),
+
+    # Advertisers of campaigns that went Active in the last %(minutes)s minutes
+    "campaign_activated": ("""
+        SELECT u.phone,
+               'campaign:' || c.id AS recipient_key,
+               c.name AS campaign_name,
+               c.status
+        FROM campaigns c
+        JOIN users u ON u.id = c.advertiser_id
+        WHERE c.status = 'Active'
+          AND c.status_changed_at >= CURRENT_TIMESTAMP - %(minutes)s * INTERVAL '1 minute'
+          AND u.phone IS NOT NULL
+    """, sms_alerts.get_campaign_status_alert, {"minutes": 60}),
+
+    # Drivers paid in payout run %(run_id)s
+    "payout_earnings": ("""
+        SELECT u.phone,
+               'payout:' || p.payout_run_id || ':' || u.id AS recipient_key,
+               u.name AS driver_name,
+               p.amount,
+               'this week' AS period
+        FROM payments p
+        JOIN users u ON u.id = p.user_id
+        WHERE p.payout_run_id = %(run_id)s
+          AND u.phone IS NOT NULL
+    """, sms_alerts.get_driver_earnings_alert, {}),
+
+    # Advertisers of campaigns in %(campaign_ids)s, about their last announced milestone
+    "campaign_milestone": ("""
+        SELECT u.phone,
+               'campaign:' || c.id || ':' || m.milestone AS recipient_key,
+               c.name AS campaign_name,
+               c.views AS views_count
+        FROM campaign_milestones m
+        JOIN campaigns c ON c.id = m.campaign_id
+        JOIN users u ON u.id = c.advertiser_id
+        WHERE m.campaign_id = ANY(%(campaign_ids)s)
+          AND u.phone IS NOT NULL
+    """, sms_alerts.get_viewership_alert_message, {}),
+}
+
+def get_recipients(audience, cur=None, **params):
+    """Rows for an audience query (phone, recipient_key and template fields)"""
+    query, _, defaults = AUDIENCES[audience]
+    if cur is not None:
+        cur.execute(query, {**defaults, **params})
+        return cur.fetchall()
+    with db.get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(query, {**defaults, **params})
+                    return cur.fetchall()
+            except Exception as e:
+                print(f"Error loading recipients for {audience}: {e}")
+                return []
+    return []
+
+def fan_out(audience, dedup_window=FANOUT_DEDUP_WINDOW, cur=None, **params):
+    """
+    Send one alert to every recipient of an audience in a single outbox batch
+
+    Parameters:
+    - audience: Key of AUDIENCES
+    - dedup_window: Seconds within which a recipient is not alerted again for the same event
+    - cur: Optional cursor; recipients are read and alerts queued in the caller's
+      transaction, errors are raised and the caller commits
+    - params: Query parameters (e.g. days=30, minutes=60, run_id=...)
+
+    Returns:
+    - Dictionary with the number of recipients and of messages queued
+    """
+    _, render, _ = AUDIENCES[audience]
+    recipients = get_recipients(audience, cur=cur, **params)
+
+    messages = []
+    for row in recipients:
+        fields = dict(row)
+        phone = fields.pop("phone")
+        dedup_key = f"{audience}:{fields.pop('recipient_key')}"
+        messages.append((phone, render(**fields), dedup_key))
+
+    queued = sms_outbox.enqueue_sms_batch(messages, dedup_window=dedup_window, cur=cur)
+    return {"audience": audience, "recipients": len(recipients), "queued": len(queued)}
+
+def main(argv=None):
+    """Command line entry point: python alert_fanout.py AUDIENCE [--days N] [--minutes N] [--run-id N]"""
+    parser = argparse.ArgumentParser(description="Flow Ads Cab batch SMS alerts")
+    parser.add_argument("audience", choices=sorted(AUDIENCES))
+    parser.add_argument("--days", type=int)
+    parser.add_argument("--minutes", type=int)
+    parser.add_argument("--run-id", type=int)
+    args = parser.parse_args(argv)
+
+    params = {
+        name: value for name, value in
+        (("days", args.days), ("minutes", args.minutes), ("run_id", args.run_id))
+        if value is not None
+    }
+    result = fan_out(args.audience, **params)
+    print(f"{result['audience']}: {result['recipients']} recipients, {result['queued']} queued")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,11 +2,18 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 import random
-from utils import load_css, initialize_session_state
+import time
+from utils import load_css, initialize_session_state, get_session_user_id
 import folium
 from streamlit_folium import folium_static
 import plotly.express as px
-import plotly.graph_objects as go
+import fleet_map
+import dashboard_stats
+import data_index
+import panel_timing
+import position_store
+
+script_started = time.perf_counter()
 
 # Set page configuration
 st.set_page_config(
@@ -331,7 +338,7 @@ def welcome_dashboard():
     if st.sidebar.button("Logout", key="sidebar_logout_btn"):
         for key in list(st.session_state.keys()):
             if key in ["active_campaigns", "drivers", "ad_templates", "high_viewership_locations", 
-                      "notifications", "help_tickets", "payment_records", "invoices"]:
+                      "notifications", "help_tickets"]:
                 continue  
             del st.session_state[key]
         st.session_state.logged_in = False
@@ -344,118 +351,105 @@ def display_advertiser_summary():
     col1, col2 = st.columns([3, 2])
 
     with col1:
-        # Filter campaigns for this advertiser (using email as identifier)
-        advertiser_campaigns = [c for c in st.session_state.active_campaigns 
-                               if c.get("advertiser", "").lower() == st.session_state.user_name.lower()]
-
-        if advertiser_campaigns:
-            # Calculate metrics
-            total_active = sum(1 for c in advertiser_campaigns if c.get("status") == "Active")
-            total_impressions = sum(c.get("impressions", 0) for c in advertiser_campaigns)
-            total_views = sum(c.get("views", 0) for c in advertiser_campaigns)
-            total_spent = sum(c.get("spent", 0) for c in advertiser_campaigns)
-
-            # Display metrics
-            metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
-
-            with metric_col1:
-                st.metric("Active Campaigns", total_active)
-
-            with metric_col2:
-                st.metric("Total Impressions", f"{total_impressions:,}")
-
-            with metric_col3:
-                st.metric("Total Views", f"{total_views:,}")
-
-            with metric_col4:
-                st.metric("Total Spent", f"Rs.{total_spent:,}")
-
-            # Display campaign list
-            st.write("##### Your Campaigns")
-            for campaign in advertiser_campaigns:
-                with st.container():
-                    status_color = '#28a745' if campaign['status'] == 'Active' else '#ffc107' if campaign['status'] == 'Scheduled' else '#6c757d'
-                    advertiser_campaign_html = f"""
-                    <div style="padding:15px; border-radius:5px; background-color:#f8f9fa; margin-bottom:10px; border-left:3px solid {status_color}">
-                        <h5>{campaign['name']}</h5>
-                        <p><strong>Status:</strong> {campaign['status']} | <strong>Budget:</strong> Rs.{campaign['budget']:,} | <strong>Spent:</strong> Rs.{campaign['spent']:,}</p>
-                        <p><strong>Views:</strong> {campaign['views']:,} | <strong>Impressions:</strong> {campaign['impressions']:,}</p>
-                    </div>
-                    """
-                    st.markdown(advertiser_campaign_html, unsafe_allow_html=True)
-        else:
-            st.info("You don't have any campaigns yet. Create your first campaign from the Campaigns page.")
-            st.button("Create Your First Campaign")
+        advertiser_campaigns_panel()
 
     with col2:
-        st.write("##### Campaign Performance Metrics")
-
-        # Create performance chart
-        if advertiser_campaigns:
-            # Get campaign names and performance metrics
-            campaign_names = [c['name'] for c in advertiser_campaigns[:3]]
-            campaign_views = [c['views'] for c in advertiser_campaigns[:3]]
-            campaign_impressions = [c['impressions'] for c in advertiser_campaigns[:3]]
-
-            # Create a bar chart using Plotly
-            fig = go.Figure()
-
-            # Add bars for views
-            fig.add_trace(go.Bar(
-                x=campaign_names,
-                y=campaign_views,
-                name='Views',
-                marker_color='#4A6FE3',
-                hovertemplate='Campaign: %{x}<br>Views: %{y:,}<extra></extra>'
-            ))
-
-            # Add bars for impressions
-            fig.add_trace(go.Bar(
-                x=campaign_names,
-                y=campaign_impressions,
-                name='Impressions',
-                marker_color='#52D726',
-                hovertemplate='Campaign: %{x}<br>Impressions: %{y:,}<extra></extra>'
-            ))
-
-            # Update layout
-            fig.update_layout(
-                title="Campaign Performance",
-                xaxis_title="",
-                yaxis_title="Count",
-                barmode='group',
-                legend=dict(
-                    orientation="h",
-                    yanchor="bottom",
-                    y=1.02,
-                    xanchor="right",
-                    x=1
-                )
-            )
+        advertiser_performance_panel()
+
+def _advertiser_campaigns():
+    # Campaigns for this advertiser, by user id (name for demo accounts)
+    return data_index.index.campaigns_for_advertiser(
+        st.session_state.active_campaigns,
+        advertiser_id=get_session_user_id(),
+        advertiser_name=st.session_state.user_name
+    )
+
+@panel_timing.panel("advertiser_campaigns")
+def advertiser_campaigns_panel():
+    advertiser_campaigns = _advertiser_campaigns()
+
+    if advertiser_campaigns:
+        # Calculate metrics
+        total_active = sum(1 for c in advertiser_campaigns if c.get("status") == "Active")
+        total_impressions = sum(c.get("impressions", 0) for c in advertiser_campaigns)
+        total_views = sum(c.get("views", 0) for c in advertiser_campaigns)
+        total_spent = sum(c.get("spent", 0) for c in advertiser_campaigns)
+
+        # Display metrics
+        metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
 
-            # Display the chart
-            st.plotly_chart(fig, use_container_width=True)
+        with metric_col1:
+            st.metric("Active Campaigns", total_active)
 
-            # Add text explanation
-            explanation_html = """
-            <div style='background-color: #f8f9fa; padding: 10px; border-radius:5px;'>
-                <p style='margin:0; font-size:0.9em;'><strong>Views</strong>: Number of times your ad was viewed by passengers</p>
-                <p style='margin:0; font-size:0.9em;'><strong>Impressions</strong>: Total ad displays, including repeat views</p>
-            </div>
-            """
-            st.markdown(explanation_html, unsafe_allow_html=True)
-        else:
-            st.info("Create your first campaign to see performance metrics.")
+        with metric_col2:
+            st.metric("Total Impressions", f"{total_impressions:,}")
+
+        with metric_col3:
+            st.metric("Total Views", f"{total_views:,}")
+
+        with metric_col4:
+            st.metric("Total Spent", f"Rs.{total_spent:,}")
+
+        # Display campaign list
+        st.write("##### Your Campaigns")
+        for campaign in advertiser_campaigns:
+            with st.container():
+                status_color = '#28a745' if campaign['status'] == 'Active' else '#ffc107' if campaign['status'] == 'Scheduled' else '#6c757d'
+                advertiser_campaign_html = f"""
+                <div style="padding:15px; border-radius:5px; background-color:#f8f9fa; margin-bottom:10px; border-left:3px solid {status_color}">
+                    <h5>{campaign['name']}</h5>
+                    <p><strong>Status:</strong> {campaign['status']} | <strong>Budget:</strong> Rs.{campaign['budget']:,} | <strong>Spent:</strong> Rs.{campaign['spent']:,}</p>
+                    <p><strong>Views:</strong> {campaign['views']:,} | <strong>Impressions:</strong> {campaign['impressions']:,}</p>
+                </div>
+                """
+                st.markdown(advertiser_campaign_html, unsafe_allow_html=True)
+    else:
+        st.info("You don't have any campaigns yet. Create your first campaign from the Campaigns page.")
+        st.button("Create Your First Campaign")
+
+@panel_timing.panel("advertiser_performance")
+def advertiser_performance_panel():
+    st.write("##### Campaign Performance Metrics")
+    advertiser_campaigns = _advertiser_campaigns()
+
+    # Create performance chart
+    if advertiser_campaigns:
+        # Built once per advertiser and data version
+        fig = dashboard_stats.stats.campaign_performance_figure(st.session_state.active_campaigns, advertiser_campaigns)
+
+        # Display the chart
+        st.plotly_chart(fig, use_container_width=True)
+
+        # Add text explanation
+        explanation_html = """
+        <div style='background-color: #f8f9fa; padding: 10px; border-radius:5px;'>
+            <p style='margin:0; font-size:0.9em;'><strong>Views</strong>: Number of times your ad was viewed by passengers</p>
+            <p style='margin:0; font-size:0.9em;'><strong>Impressions</strong>: Total ad displays, including repeat views</p>
+        </div>
+        """
+        st.markdown(explanation_html, unsafe_allow_html=True)
+    else:
+        st.info("Create your first campaign to see performance metrics.")
 
 def display_driver_summary():
     st.subheader("Driver Dashboard Summary")
 
-    # Find driver data (using email as identifier)
-    driver = None
-    for d in st.session_state.drivers:
-        if d.get("name", "").lower() == st.session_state.user_name.lower():
-            driver = d
-            break
+    # Create columns for metrics and map
+    col1, col2 = st.columns([3, 2])
+
+    with col1:
+        driver_status_panel()
+
+    with col2:
+        driver_location_panel()
+
+def _session_driver():
+    # Find driver data by user id (name for demo accounts)
+    driver = data_index.index.driver_for_user(
+        st.session_state.drivers,
+        user_id=get_session_user_id(),
+        name=st.session_state.user_name
+    )
 
     if not driver:
         # If driver not found, create a mock driver for demonstration
@@ -477,67 +471,68 @@ def display_driver_summary():
             },
             "current_ad_displaying": 1
         }
-        st.session_state.drivers.append(driver)
 
-    # Create columns for metrics and map
-    col1, col2 = st.columns([3, 2])
+    return driver
 
-    with col1:
-        # Display driver metrics
-        metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
+@panel_timing.panel("driver_status")
+def driver_status_panel():
+    driver = _session_driver()
 
-        with metric_col1:
-            st.metric("Status", driver.get("status", "Inactive"))
+    # Display driver metrics
+    metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
 
-        with metric_col2:
-            st.metric("Today's Distance", f"{driver.get('kms_today', 0)} km")
+    with metric_col1:
+        st.metric("Status", driver.get("status", "Inactive"))
 
-        with metric_col3:
-            st.metric("Hours Active", f"{driver.get('hours_active', 0)} hrs")
+    with metric_col2:
+        st.metric("Today's Distance", f"{driver.get('kms_today', 0)} km")
 
-        with metric_col4:
-            st.metric("Today's Earnings", f"Rs.{driver.get('earnings', {}).get('today', 0)}")
-
-        # Display current ad information
-        current_ad_id = driver.get("current_ad_displaying")
-        current_ad = None
-
-        for campaign in st.session_state.active_campaigns:
-            if campaign.get("id") == current_ad_id:
-                current_ad = campaign
-                break
-
-        if current_ad:
-            st.write("##### Currently Displaying Advertisement")
-            current_ad_html = f"""
-            <div style="padding:15px; border-radius:5px; background-color:#f8f9fa; margin-bottom:10px; border-left:3px solid #0098DA">
-                <h5>{current_ad['name']}</h5>
-                <p><strong>Advertiser:</strong> {current_ad['advertiser']}</p>
-                <p><strong>Type:</strong> {current_ad['ad_type'].title()} Ad | <strong>Regions:</strong> {', '.join(current_ad['regions'][:2])}{' and more' if len(current_ad['regions']) > 2 else ''}</p>
-            </div>
-            """
-            st.markdown(current_ad_html, unsafe_allow_html=True)
-        else:
-            st.info("No advertisement currently assigned for display.")
+    with metric_col3:
+        st.metric("Hours Active", f"{driver.get('hours_active', 0)} hrs")
 
-    with col2:
-        st.write("##### Your Current Location")
+    with metric_col4:
+        st.metric("Today's Earnings", f"Rs.{driver.get('earnings', {}).get('today', 0)}")
 
-        # Initialize a map centered on driver location
-        driver_lat = driver.get("current_location", {}).get("lat", 22.7196)
-        driver_lon = driver.get("current_location", {}).get("lon", 75.8577)
+    # Display current ad information
+    current_ad = data_index.index.campaign(st.session_state.active_campaigns, driver.get("current_ad_displaying"))
 
-        m = folium.Map(location=[driver_lat, driver_lon], zoom_start=14)
+    if current_ad:
+        st.write("##### Currently Displaying Advertisement")
+        current_ad_html = f"""
+        <div style="padding:15px; border-radius:5px; background-color:#f8f9fa; margin-bottom:10px; border-left:3px solid #0098DA">
+            <h5>{current_ad['name']}</h5>
+            <p><strong>Advertiser:</strong> {current_ad['advertiser']}</p>
+            <p><strong>Type:</strong> {current_ad['ad_type'].title()} Ad | <strong>Regions:</strong> {', '.join(current_ad['regions'][:2])}{' and more' if len(current_ad['regions']) > 2 else ''}</p>
+        </div>
+        """
+        st.markdown(current_ad_html, unsafe_allow_html=True)
+    else:
+        st.info("No advertisement currently assigned for display.")
 
-        # Add marker for driver
-        folium.Marker(
-            [driver_lat, driver_lon],
-            tooltip=f"{driver['name']} - {driver.get('current_location', {}).get('area', 'Unknown')}",
-            icon=folium.Icon(color='green', icon='car', prefix='fa')
-        ).add_to(m)
+@panel_timing.panel("driver_location", run_every=position_store.LIVE_FLEET_REFRESH)
+def driver_location_panel():
+    st.write("##### Your Current Location")
+    driver = _session_driver()
 
-        # Display the map
-        folium_static(m, width=400)
+    # Latest position from the live store (O(1)), else the cached driver record
+    driver_lat = driver.get("current_location", {}).get("lat", 22.7196)
+    driver_lon = driver.get("current_location", {}).get("lon", 75.8577)
+    driver_area = driver.get('current_location', {}).get('area', 'Unknown')
+    live = position_store.get_position_store().get(driver.get("id"))
+    if live:
+        _, driver_lat, driver_lon, driver_area = live
+
+    m = folium.Map(location=[driver_lat, driver_lon], zoom_start=14)
+
+    # Add marker for driver
+    folium.Marker(
+        [driver_lat, driver_lon],
+        tooltip=f"{driver['name']} - {driver_area or 'Unknown'}",
+        icon=folium.Icon(color='green', icon='car', prefix='fa')
+    ).add_to(m)
+
+    # Display the map
+    folium_static(m, width=400)
 
 def display_admin_summary():
     st.subheader("Admin Dashboard Summary")
@@ -545,116 +540,139 @@ def display_admin_summary():
     # Create tabs for different summaries
     tab1, tab2, tab3 = st.tabs(["Campaigns", "Drivers", "Analytics"])
 
+    # Each panel is its own fragment, so widgets in one panel rerun only that panel
     with tab1:
-        # Campaign summary
-        active_campaigns = [c for c in st.session_state.active_campaigns if c.get("status") == "Active"]
-        scheduled_campaigns = [c for c in st.session_state.active_campaigns if c.get("status") == "Scheduled"]
+        admin_campaigns_panel()
 
-        metric_col1, metric_col2, metric_col3 = st.columns(3)
+    with tab2:
+        admin_drivers_panel()
+        fleet_map_panel()
+        live_fleet_panel()
 
-        with metric_col1:
-            st.metric("Active Campaigns", len(active_campaigns))
+    with tab3:
+        admin_analytics_panel()
 
-        with metric_col2:
-            st.metric("Scheduled Campaigns", len(scheduled_campaigns))
+    with st.expander("Render timings"):
+        render_timings_panel()
 
-        with metric_col3:
-            total_budget = sum(c.get("budget", 0) for c in st.session_state.active_campaigns)
-            st.metric("Total Campaign Budget", f"Rs.{total_budget:,}")
-
-        # List active campaigns
-        st.write("##### Active Campaigns")
-        for campaign in active_campaigns[:3]:  # Show top 3
-            campaign_html = f"""
-            <div style="padding:10px; border-radius:5px; background-color:#f8f9fa; margin-bottom:8px; border-left:3px solid #28a745">
-                <h6>{campaign['name']}</h6>
-                <p><strong>Advertiser:</strong> {campaign['advertiser']} | <strong>Budget:</strong> Rs.{campaign['budget']:,} | <strong>Views:</strong> {campaign['views']:,}</p>
-            </div>
-            """
-            st.markdown(campaign_html, unsafe_allow_html=True)
+@panel_timing.panel("admin_campaigns")
+def admin_campaigns_panel():
+    # Aggregates are memoized per version of the shared data
+    campaign_kpis = dashboard_stats.stats.campaign_kpis(st.session_state.active_campaigns)
 
-    with tab2:
-        # Driver summary
-        active_drivers = [d for d in st.session_state.drivers if d.get("status") == "Active"]
-        inactive_drivers = [d for d in st.session_state.drivers if d.get("status") != "Active"]
+    # Campaign summary
+    metric_col1, metric_col2, metric_col3 = st.columns(3)
 
-        metric_col1, metric_col2, metric_col3 = st.columns(3)
+    with metric_col1:
+        st.metric("Active Campaigns", campaign_kpis["active"])
 
-        with metric_col1:
-            st.metric("Active Drivers", len(active_drivers))
+    with metric_col2:
+        st.metric("Scheduled Campaigns", campaign_kpis["scheduled"])
 
-        with metric_col2:
-            st.metric("Inactive Drivers", len(inactive_drivers))
+    with metric_col3:
+        st.metric("Total Campaign Budget", f"Rs.{campaign_kpis['total_budget']:,}")
 
-        with metric_col3:
-            avg_distance = sum(d.get("kms_today", 0) for d in active_drivers) / max(len(active_drivers), 1)
-            st.metric("Avg. Distance Today", f"{avg_distance:.1f} km")
-
-        # List active drivers
-        st.write("##### Active Drivers")
-        driver_cols = st.columns(3)
-
-        for i, driver in enumerate(active_drivers[:3]):  # Show top 3
-            with driver_cols[i % 3]:
-                driver_html = f"""
-                <div style="padding:10px; border-radius:5px; background-color:#f8f9fa; margin-bottom:8px;">
-                    <h6>{driver['name']}</h6>
-                    <p><strong>Vehicle:</strong> {driver.get('vehicle_model', 'N/A')}</p>
-                    <p><strong>Today:</strong> {driver.get('kms_today', 0)} km | Rs.{driver.get('earnings', {}).get('today', 0)}</p>
-                </div>
-                """
-                st.markdown(driver_html, unsafe_allow_html=True)
+    # List active campaigns
+    st.write("##### Active Campaigns")
+    for campaign in campaign_kpis["active_preview"]:
+        campaign_html = f"""
+        <div style="padding:10px; border-radius:5px; background-color:#f8f9fa; margin-bottom:8px; border-left:3px solid #28a745">
+            <h6>{campaign['name']}</h6>
+            <p><strong>Advertiser:</strong> {campaign['advertiser']} | <strong>Budget:</strong> Rs.{campaign['budget']:,} | <strong>Views:</strong> {campaign['views']:,}</p>
+        </div>
+        """
+        st.markdown(campaign_html, unsafe_allow_html=True)
 
-    with tab3:
-        # Quick analytics
-        col1, col2 = st.columns(2)
+@panel_timing.panel("admin_drivers")
+def admin_drivers_panel():
+    driver_kpis = dashboard_stats.stats.driver_kpis(st.session_state.drivers)
 
-        with col1:
-            st.write("##### Campaign Performance")
-
-            # Create sample data for a chart
-            campaigns = st.session_state.active_campaigns[:5]  # Top 5 campaigns
-            campaign_names = [c['name'] for c in campaigns]
-            campaign_views = [c['views'] for c in campaigns]
-
-            # Create a bar chart using Plotly
-            fig = go.Figure(go.Bar(
-                x=campaign_names, 
-                y=campaign_views,
-                marker_color='#0098DA',
-                hovertemplate='Campaign: %{x}<br>Views: %{y}<extra></extra>'
-            ))
-
-            fig.update_layout(
-                title="Top Campaign Views",
-                xaxis_title="Campaign",
-                yaxis_title="Views"
-            )
-            fig.update_layout(height=300)
-            st.plotly_chart(fig, use_container_width=True)
+    # Driver summary
+    metric_col1, metric_col2, metric_col3 = st.columns(3)
 
-        with col2:
-            st.write("##### High Viewership Locations")
-
-            locations = st.session_state.high_viewership_locations
-            location_names = [loc['location'] for loc in locations]
-            location_views = [loc['views'] for loc in locations]
-
-            # Create a bar chart using go.Figure
-            fig = go.Figure(go.Bar(
-                x=location_names,
-                y=location_views,
-                marker_color='#FF6B6B',
-                hovertemplate='Location: %{x}<br>Views: %{y}<extra></extra>'
-            ))
-
-            fig.update_layout(
-                title="Views by Location",
-                xaxis_title="Location",
-                yaxis_title="Views"
-            )
-            fig.update_layout(height=300)
-            st.plotly_chart(fig, use_container_width=True)
+    with metric_col1:
+        st.metric("Active Drivers", driver_kpis["active"])
+
+    with metric_col2:
+        st.metric("Inactive Drivers", driver_kpis["inactive"])
+
+    with metric_col3:
+        st.metric("Avg. Distance Today", f"{driver_kpis['avg_distance_today']:.1f} km")
+
+    # List active drivers
+    st.write("##### Active Drivers")
+    driver_cols = st.columns(3)
+
+    for i, driver in enumerate(driver_kpis["active_preview"]):
+        with driver_cols[i % 3]:
+            driver_html = f"""
+            <div style="padding:10px; border-radius:5px; background-color:#f8f9fa; margin-bottom:8px;">
+                <h6>{driver['name']}</h6>
+                <p><strong>Vehicle:</strong> {driver.get('vehicle_model', 'N/A')}</p>
+                <p><strong>Today:</strong> {driver.get('kms_today', 0)} km | Rs.{driver.get('earnings', {}).get('today', 0)}</p>
+            </div>
+            """
+            st.markdown(driver_html, unsafe_allow_html=True)
+
+@panel_timing.panel("fleet_map")
+def fleet_map_panel():
+    # Whole-fleet map: clustered server-side, heatmap when zoomed out
+    st.write("##### Fleet Map")
+    fleet_zoom = st.slider("Map zoom", min_value=9, max_value=16, value=12, key="fleet_map_zoom")
+    folium_static(fleet_map.build_fleet_map(fleet_zoom), width=700)
+
+@panel_timing.panel("live_fleet", run_every=position_store.LIVE_FLEET_REFRESH)
+def live_fleet_panel():
+    # The fleet comes from the shared cluster layers; each refresh fetches only
+    # the cabs that moved since this session's last version and marks them on top
+    st.write("##### Live Fleet")
+    delta = position_store.changes_since(st.session_state.get("live_fleet_version", 0))
+    st.session_state.live_fleet_version = delta["version"]
+    moved = [] if delta["full"] else delta["positions"]
+    tracked = len(position_store.get_position_store())
+
+    metric_col1, metric_col2, metric_col3 = st.columns(3)
+
+    with metric_col1:
+        st.metric("Cabs Tracked", tracked)
+
+    with metric_col2:
+        st.metric("Moved Since Last Refresh", len(moved))
+
+    with metric_col3:
+        st.metric("Position Version", delta["version"])
+
+    if tracked:
+        m = fleet_map.build_fleet_map(12)
+        for driver_id, lat, lon, area in moved[:position_store.LIVE_FLEET_MAX_MARKERS]:
+            folium.CircleMarker(
+                [lat, lon], radius=4, color="#ffc107", fill=True,
+                tooltip=f"Cab #{driver_id} - {area or 'Unknown'} (moved)"
+            ).add_to(m)
+        folium_static(m, width=700)
+    else:
+        st.info("No cab positions have been recorded yet.")
+
+@panel_timing.panel("admin_analytics")
+def admin_analytics_panel():
+    # Quick analytics
+    col1, col2 = st.columns(2)
+
+    with col1:
+        st.write("##### Campaign Performance")
+        fig = dashboard_stats.stats.campaign_views_figure(st.session_state.active_campaigns)
+        st.plotly_chart(fig, use_container_width=True)
+
+    with col2:
+        st.write("##### High Viewership Locations")
+        fig = dashboard_stats.stats.location_views_figure(st.session_state.high_viewership_locations)
+        st.plotly_chart(fig, use_container_width=True)
+
+@panel_timing.panel("render_timings")
+def render_timings_panel():
+    # Full reruns are recorded as "script"; fragment reruns only under their panel
+    st.button("Refresh timings", key="refresh_render_timings")
+    st.dataframe(pd.DataFrame(panel_timing.get_panel_timings()), use_container_width=True, hide_index=True)
 
 # Configure sidebar
 def sidebar():
@@ -704,4 +722,5 @@ def admin_sidebar():
 
 # Run the app
 sidebar()
-display_home()
\ No newline at end of file
+display_home()
+panel_timing.timings.record("script", time.perf_counter() - script_started)
@@ -0,0 +1,263 @@
+import os
+import threading
+import time
+from datetime import date
+import db
+import data_cache
+import ad_events
+
+# How often in-memory reservations are reconciled with PostgreSQL (seconds)
+PACING_RECONCILE_INTERVAL = float(os.environ.get('PACING_RECONCILE_INTERVAL', '30'))
+# Seconds to wait before retrying a failed load of campaign budgets
+PACING_RETRY_INTERVAL = float(os.environ.get('PACING_RETRY_INTERVAL', '5'))
+# Bucket capacity in hours of target spend; caps how far a campaign can run ahead of pace
+PACING_BURST_HOURS = float(os.environ.get('PACING_BURST_HOURS', '1.0'))
+
+# Budget, spend already rolled up and spend still sitting in ad_events
+_RECONCILE_SQL = """
+    SELECT c.id, c.budget, c.end_date,
+           c.spent + COALESCE(e.spent, 0) AS spent
+    FROM campaigns c
+    LEFT JOIN (
+        SELECT campaign_id, SUM(spent) AS spent
+        FROM ad_events
+        WHERE txid >= (SELECT last_xmin FROM ad_event_rollup_state WHERE id = 1)
+        GROUP BY campaign_id
+    ) e ON e.campaign_id = c.id
+    WHERE c.status = 'Active'
+"""
+
+
+class BudgetPacer:
+    """
+    Paces campaign spend with in-memory token buckets.
+
+    Each active campaign gets a daily target (remaining budget spread over the
+    days left in its window) and a bucket that refills at the matching hourly
+    rate. reserve() only touches memory; reconcile() periodically reloads
+    budgets and spend from PostgreSQL, including events not yet rolled up, and
+    marks campaigns with no budget left as Completed.
+    """
+
+    def __init__(self, reconcile_interval=PACING_RECONCILE_INTERVAL, burst_hours=PACING_BURST_HOURS):
+        self.reconcile_interval = reconcile_interval
+        self.burst_hours = burst_hours
+        self._buckets = {}
+        self._exhausted = set()
+        self._refused = {}  # campaign_id -> smallest play refused for lack of budget
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._retry_at = 0.0  # time.monotonic() before which a failed load is not retried
+        self._thread = None
+        self._thread_lock = threading.Lock()
+
+    def _targets(self, budget, spent, end_date, today):
+        remaining = max(budget - spent, 0)
+        days_left = max((end_date - today).days + 1, 1) if end_date else 1
+        daily = remaining / days_left
+        return remaining, daily, daily / 24
+
+    def _refill(self, bucket, now):
+        rate = bucket["hourly_target"] / 3600
+        bucket["tokens"] = min(bucket["capacity"], bucket["tokens"] + (now - bucket["refilled_at"]) * rate)
+        bucket["refilled_at"] = now
+
+    def reserve(self, campaign_id, amount):
+        """
+        Reserve spend for one ad play without touching the database
+
+        Returns:
+        - True if the campaign has budget and is within its pace, False otherwise
+        """
+        self._ensure_started()
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(campaign_id)
+            if bucket is None:
+                return False
+            self._refill(bucket, now)
+            remaining = bucket["budget"] - bucket["spent"] - bucket["reserved"]
+            if amount > remaining:
+                self._exhausted.add(campaign_id)
+                self._refused[campaign_id] = min(amount, self._refused.get(campaign_id, amount))
+                return False
+            if amount > bucket["tokens"]:
+                return False
+            bucket["tokens"] -= amount
+            bucket["reserved"] += amount
+            return True
+
+    def charge(self, campaign_id, amount):
+        """
+        Charge spend that has already happened, such as reported metrics
+
+        Unlike reserve() this ignores the pace and only clamps the amount to
+        the budget left, so a campaign is never charged past its budget.
+
+        Returns:
+        - The amount charged, or None for campaigns the pacer does not track
+          (not Active, without a budget, or before budgets have loaded)
+        """
+        self._ensure_started()
+        with self._lock:
+            bucket = self._buckets.get(campaign_id)
+            if bucket is None:
+                return None
+            remaining = max(bucket["budget"] - bucket["spent"] - bucket["reserved"], 0)
+            charged = min(amount, remaining)
+            bucket["tokens"] = max(bucket["tokens"] - charged, 0)
+            bucket["reserved"] += charged
+            if charged == remaining:
+                self._exhausted.add(campaign_id)
+            return charged
+
+    def is_exhausted(self, campaign_id):
+        """Whether a campaign has run out of budget since the last reconcile"""
+        return campaign_id in self._exhausted
+
+    def remaining(self, campaign_id):
+        """Budget left for a campaign after local reservations (None if not tracked)"""
+        with self._lock:
+            bucket = self._buckets.get(campaign_id)
+            if bucket is None:
+                return None
+            return bucket["budget"] - bucket["spent"] - bucket["reserved"]
+
+    def reconcile(self):
+        """
+        Sync buckets with PostgreSQL and complete campaigns whose budget is spent
+
+        Reservations made while the event buffer is flushing may be counted twice
+        until the next reconcile; the error is always towards underspending.
+        If the flush fails, every reservation is kept, as none reached the database.
+
+        Returns:
+        - Ids of campaigns moved to Completed
+        """
+        with self._lock:
+            pending = {campaign_id: bucket["reserved"] for campaign_id, bucket in self._buckets.items()}
+            refused, self._refused = self._refused, {}
+
+        # Reservations are ad_events in the writer buffer; push them to the database first
+        if ad_events.event_writer.flush() is None:
+            pending = {}
+
+        completed = []
+        with db.get_db_connection() as conn:
+            if conn:
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute(_RECONCILE_SQL)
+                        rows = cur.fetchall()
+                        # Spent, or too little left for the cheapest play we had to refuse
+                        exhausted = sorted(
+                            row["id"] for row in rows
+                            if row["budget"] is not None
+                            and row["budget"] - row["spent"] < refused.get(row["id"], 1)
+                        )
+                        if exhausted:
+                            cur.execute("""
+                                UPDATE campaigns SET status = 'Completed', status_changed_at = CURRENT_TIMESTAMP
+                                WHERE id = ANY(%s) AND status = 'Active'
+                                RETURNING id
+                            """, (exhausted,))
+                            completed = [row["id"] for row in cur.fetchall()]
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    print(f"Error reconciling campaign budgets: {e}")
+                    self._retry_at = time.monotonic() + PACING_RETRY_INTERVAL
+                    return []
+            else:
+                self._retry_at = time.monotonic() + PACING_RETRY_INTERVAL
+                return []
+
+        today = date.today()
+        now = time.monotonic()
+        with self._lock:
+            buckets = {}
+            for row in rows:
+                # Campaigns without a budget are not paced (and cannot reserve spend)
+                if row["id"] in completed or row["budget"] is None:
+                    continue
+                budget = row["budget"]
+                spent = int(row["spent"])
+                _, daily, hourly = self._targets(budget, spent, row["end_date"], today)
+                previous = self._buckets.get(row["id"])
+                capacity = hourly * self.burst_hours
+                bucket = {
+                    "budget": budget,
+                    "spent": spent,
+                    # Keep only what was reserved after the snapshot above
+                    "reserved": previous["reserved"] - pending.get(row["id"], 0) if previous else 0,
+                    "daily_target": daily,
+                    "hourly_target": hourly,
+                    "capacity": capacity,
+                    "tokens": min(previous["tokens"], capacity) if previous else capacity,
+                    "refilled_at": previous["refilled_at"] if previous else now,
+                }
+                buckets[row["id"]] = bucket
+            self._buckets = buckets
+            self._exhausted = {
+                campaign_id for campaign_id, bucket in buckets.items()
+                if bucket["budget"] - bucket["spent"] - bucket["reserved"] <= 0
+            } | set(completed)
+            self._loaded = True
+
+        if completed:
+            data_cache.invalidate(data_cache.CAMPAIGNS)
+        return completed
+
+    def pacing_report(self):
+        """Per-campaign pacing state for dashboards"""
+        with self._lock:
+            return {
+                campaign_id: {
+                    "budget": bucket["budget"],
+                    "spent": bucket["spent"] + bucket["reserved"],
+                    "daily_target": round(bucket["daily_target"], 2),
+                    "hourly_target": round(bucket["hourly_target"], 2),
+                    "tokens": round(bucket["tokens"], 2),
+                }
+                for campaign_id, bucket in self._buckets.items()
+            }
+
+    def _ensure_started(self):
+        # Until budgets load, plays are refused; a failed load is retried only
+        # every PACING_RETRY_INTERVAL seconds instead of on every play
+        if not self._loaded and time.monotonic() >= self._retry_at:
+            with self._thread_lock:
+                if not self._loaded and time.monotonic() >= self._retry_at:
+                    self.reconcile()
+        if self._thread is None or not self._thread.is_alive():
+            with self._thread_lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="budget-pacer", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.reconcile_interval)
+            try:
+                self.reconcile()
+            except Exception as e:
+                print(f"Budget pacer error: {e}")
+
+
+pacer = BudgetPacer()
+
+def charge_ad_play(campaign_id, driver_id=None, cost=1):
+    """
+    Reserve budget for an ad play and record the impression
+
+    Returns:
+    - True if the play was charged, False if the campaign is out of budget or ahead of pace
+    """
+    if not pacer.reserve(campaign_id, cost):
+        return False
+    ad_events.record_impression(campaign_id, driver_id=driver_id, spent=cost)
+    return True
+
+def is_exhausted(campaign_id):
+    """Whether a campaign has no budget left according to the pacer"""
+    return pacer.is_exhausted(campaign_id)
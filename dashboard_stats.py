@@ -0,0 +1,152 @@
+import heapq
+from collections import Counter
+import numpy as np
+import plotly.graph_objects as go
+import data_cache
+
+# Campaigns shown in the "Top Campaign Views" chart
+TOP_CAMPAIGNS = 5
+# Cards listed under Active Campaigns / Active Drivers
+PREVIEW_ITEMS = 3
+
+
+class DashboardStats:
+    """
+    Dashboard aggregates, computed once per version of the shared data.
+
+    Campaigns, drivers and locations are read-only lists shared through
+    data_cache, and a list only changes by being reloaded under a new
+    version. So each aggregate (and each Plotly figure) is built on the first
+    rerun that sees a new list and reused by every later rerun and session
+    until the next invalidation, instead of being recomputed per widget
+    interaction.
+    """
+
+    def __init__(self):
+        self._memo = data_cache.VersionedMemo()
+
+    def campaign_kpis(self, campaigns):
+        """
+        Campaign aggregates for the admin summary
+
+        Returns:
+        - Dictionary with counts by status, total budget, total views, the
+          first PREVIEW_ITEMS active campaigns and the TOP_CAMPAIGNS by views
+        """
+        return self._memo.get("campaign_kpis", data_cache.CAMPAIGNS, campaigns, _campaign_kpis)
+
+    def driver_kpis(self, drivers):
+        """
+        Driver aggregates for the admin summary
+
+        Returns:
+        - Dictionary with active/inactive counts, average distance today of
+          active drivers and the first PREVIEW_ITEMS active drivers
+        """
+        return self._memo.get("driver_kpis", data_cache.DRIVERS, drivers, _driver_kpis)
+
+    def campaign_views_figure(self, campaigns):
+        """Bar chart of the top campaigns by views"""
+        return self._memo.get(
+            "campaign_views_figure", data_cache.CAMPAIGNS, campaigns,
+            lambda items: _bar_figure(
+                [(c["name"], c["views"]) for c in self.campaign_kpis(items)["top_campaigns"]],
+                title="Top Campaign Views", x_title="Campaign", hover_label="Campaign", color="#0098DA",
+            ),
+        )
+
+    def location_views_figure(self, locations):
+        """Bar chart of views by high-viewership location"""
+        return self._memo.get(
+            "location_views_figure", data_cache.LOCATIONS, locations,
+            lambda items: _bar_figure(
+                [(loc["location"], loc["views"]) for loc in items],
+                title="Views by Location", x_title="Location", hover_label="Location", color="#FF6B6B",
+            ),
+        )
+
+    def campaign_performance_figure(self, campaigns, advertiser_campaigns):
+        """Grouped views/impressions chart of an advertiser's first campaigns"""
+        shown = advertiser_campaigns[:PREVIEW_ITEMS]
+        name = ("campaign_performance_figure", tuple(c.get("id") for c in shown))
+        return self._memo.get(name, data_cache.CAMPAIGNS, campaigns, lambda items: _performance_figure(shown))
+
+
+def _campaign_kpis(campaigns):
+    by_status = Counter()
+    total_budget = 0
+    total_views = 0
+    active_preview = []
+    for campaign in campaigns:
+        status = campaign.get("status")
+        by_status[status] += 1
+        total_budget += campaign.get("budget", 0) or 0
+        total_views += campaign.get("views", 0) or 0
+        if status == "Active" and len(active_preview) < PREVIEW_ITEMS:
+            active_preview.append(campaign)
+    return {
+        "by_status": dict(by_status),
+        "active": by_status.get("Active", 0),
+        "scheduled": by_status.get("Scheduled", 0),
+        "total_budget": total_budget,
+        "total_views": total_views,
+        "active_preview": active_preview,
+        "top_campaigns": heapq.nlargest(TOP_CAMPAIGNS, campaigns, key=lambda c: c.get("views", 0) or 0),
+    }
+
+def _driver_kpis(drivers):
+    # drivers is a DriverTable: counts and averages are array operations
+    kpis = drivers.kpis()
+    active_rows = np.flatnonzero(drivers.status_mask("Active"))[:PREVIEW_ITEMS]
+    kpis["active_preview"] = drivers.rows(active_rows)
+    return kpis
+
+def _bar_figure(points, title, x_title, hover_label, color):
+    fig = go.Figure(go.Bar(
+        x=[p[0] for p in points],
+        y=[p[1] for p in points],
+        marker_color=color,
+        hovertemplate=f'{hover_label}: %{{x}}<br>Views: %{{y}}<extra></extra>'
+    ))
+    fig.update_layout(
+        title=title,
+        xaxis_title=x_title,
+        yaxis_title="Views",
+        height=300
+    )
+    return fig
+
+def _performance_figure(campaigns):
+    names = [c['name'] for c in campaigns]
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=names,
+        y=[c['views'] for c in campaigns],
+        name='Views',
+        marker_color='#4A6FE3',
+        hovertemplate='Campaign: %{x}<br>Views: %{y:,}<extra></extra>'
+    ))
+    fig.add_trace(go.Bar(
+        x=names,
+        y=[c['impressions'] for c in campaigns],
+        name='Impressions',
+        marker_color='#52D726',
+        hovertemplate='Campaign: %{x}<br>Impressions: %{y:,}<extra></extra>'
+    ))
+    fig.update_layout(
+        title="Campaign Performance",
+        xaxis_title="",
+        yaxis_title="Count",
+        barmode='group',
+        legend=dict(
+            orientation="h",
+            yanchor="bottom",
+            y=1.02,
+            xanchor="right",
+            x=1
+        )
+    )
+    return fig
+
+
+stats = DashboardStats()
@@ -0,0 +1,164 @@
+import os
+import threading
+import time
+
+# How long shared data stays fresh before the next read reloads it (seconds)
+DATA_CACHE_TTL = float(os.environ.get('DATA_CACHE_TTL', '60'))
+
+# Cache keys for the data shared by every dashboard session
+CAMPAIGNS = "campaigns"
+DRIVERS = "drivers"
+LOCATIONS = "high_viewership_locations"
+
+
+class SharedDataCache:
+    """
+    Process-level read-through cache shared by all Streamlit sessions.
+
+    Every session receives a reference to the same cached object, so values
+    must be treated as read-only. Entries expire after a TTL and can be
+    invalidated explicitly after writes, or marked stale by frequent writes
+    so that they reload at most once per interval. Each key carries a version
+    number that changes whenever its value is reloaded or invalidated.
+    """
+
+    def __init__(self, ttl=DATA_CACHE_TTL):
+        self.ttl = ttl
+        self._entries = {}  # key -> (value, loaded_at)
+        self._stale_at = {}  # key -> time after which a stale entry reloads
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._load_locks = {}
+
+    def _load_lock(self, key):
+        with self._lock:
+            if key not in self._load_locks:
+                self._load_locks[key] = threading.Lock()
+            return self._load_locks[key]
+
+    def _fresh(self, key, ttl):
+        entry = self._entries.get(key)
+        now = time.monotonic()
+        if entry and now - entry[1] < ttl and now < self._stale_at.get(key, now + 1):
+            return entry
+        return None
+
+    def get(self, key, loader, ttl=None):
+        """
+        Get a cached value, calling loader() to populate it when missing or expired
+
+        Parameters:
+        - key: Cache key
+        - loader: Zero-argument callable returning the value
+        - ttl: Override the default TTL for this key (seconds)
+        """
+        ttl = self.ttl if ttl is None else ttl
+        entry = self._fresh(key, ttl)
+        if entry:
+            return entry[0]
+
+        # Only one session loads a given key; the others wait and reuse its result
+        with self._load_lock(key):
+            entry = self._fresh(key, ttl)
+            if entry:
+                return entry[0]
+
+            with self._lock:
+                version = self._versions.get(key, 0)
+                # Writes made from here on mark the new value stale again
+                self._stale_at.pop(key, None)
+            value = loader()
+            with self._lock:
+                # Skip storing if the key was invalidated while we were loading
+                if self._versions.get(key, 0) == version:
+                    self._entries[key] = (value, time.monotonic())
+                    self._versions[key] = version + 1
+            return value
+
+    def invalidate(self, *keys):
+        """Drop cached entries so the next read reloads them"""
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+    def expire(self, *keys, within):
+        """
+        Mark entries stale without dropping them
+
+        A stale entry is still served until `within` seconds after it was
+        loaded; the first read after that reloads it. However often a key
+        is written, it is then reloaded at most once per interval.
+        """
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry and key not in self._stale_at:
+                    self._stale_at[key] = entry[1] + within
+
+    def version(self, key):
+        """Get the current version number of a key"""
+        return self._versions.get(key, 0)
+
+
+class VersionedMemo:
+    """
+    Values derived from shared data, computed once per version of it.
+
+    A derived value (an aggregate, a figure, an index) is stored with the
+    version of the key it was computed from and the list it was computed
+    over, and reused until either changes. Storing a value drops every
+    entry computed from an older version of the same key, so names that
+    embed ids (one per advertiser, say) do not accumulate across reloads.
+    """
+
+    def __init__(self):
+        self._entries = {}  # name -> (key, version, source list, value)
+        self._lock = threading.Lock()
+
+    def get(self, name, key, items, compute):
+        """
+        Get compute(items), reusing the stored value while it is current
+
+        Parameters:
+        - name: Name of the derived value
+        - key: Cache key items was read from
+        - items: The shared value read through get_cached
+        - compute: One-argument callable deriving the value from items
+        """
+        version = shared_cache.version(key)
+        with self._lock:
+            entry = self._entries.get(name)
+        # The list identity guards against a session still holding the previous list
+        if entry and entry[1] == version and entry[2] is items:
+            return entry[3]
+        value = compute(items)
+        with self._lock:
+            self._entries = {
+                other: other_entry for other, other_entry in self._entries.items()
+                if other_entry[0] != key or other_entry[1] == version
+            }
+            self._entries[name] = (key, version, items, value)
+        return value
+
+    def __len__(self):
+        return len(self._entries)
+
+
+shared_cache = SharedDataCache()
+
+def get_cached(key, loader, ttl=None):
+    """Read a shared value through the process-wide cache"""
+    return shared_cache.get(key, loader, ttl)
+
+def invalidate(*keys):
+    """Invalidate shared values after a write"""
+    shared_cache.invalidate(*keys)
+
+def expire(*keys, within):
+    """Mark shared values stale after frequent writes (reloaded at most once per interval)"""
+    shared_cache.expire(*keys, within=within)
+
+def get_version(key):
+    """Get the version number of a shared value"""
+    return shared_cache.version(key)
@@ -0,0 +1,76 @@
+import data_cache
+
+
+class SnapshotIndex:
+    """
+    Hash indexes over the shared campaign list and driver table.
+
+    Indexes are built once per data_cache version of the list they cover, on
+    the first lookup after a load, and shared by every session. Writes
+    invalidate the cached list, so the next lookup rebuilds from the fresh
+    snapshot; between writes every lookup is a dictionary access (or a
+    binary search over the driver table's sorted user ids).
+    """
+
+    def __init__(self):
+        self._indexes = data_cache.VersionedMemo()
+
+    def _campaigns(self, campaigns):
+        return self._indexes.get("campaigns", data_cache.CAMPAIGNS, campaigns, _build_campaign_index)
+
+    def _drivers(self, drivers):
+        return self._indexes.get("drivers", data_cache.DRIVERS, drivers, _build_driver_index)
+
+    def campaign(self, campaigns, campaign_id):
+        """Campaign with the given id, or None"""
+        return self._campaigns(campaigns)["by_id"].get(campaign_id)
+
+    def campaigns_for_advertiser(self, campaigns, advertiser_id=None, advertiser_name=None):
+        """
+        Campaigns of one advertiser, in list order
+
+        Parameters:
+        - advertiser_id: User id of the advertiser (preferred)
+        - advertiser_name: Case-insensitive advertiser name, used when no id is known
+        """
+        index = self._campaigns(campaigns)
+        if advertiser_id is not None:
+            return index["by_advertiser_id"].get(advertiser_id, [])
+        return index["by_advertiser_name"].get((advertiser_name or "").lower(), [])
+
+    def driver_for_user(self, drivers, user_id=None, name=None):
+        """
+        Driver record of a user, or None
+
+        Parameters:
+        - user_id: User id of the driver (preferred)
+        - name: Case-insensitive driver name, used when no id is known
+        """
+        if user_id is not None:
+            row = drivers.row_of("user_id", user_id)
+        else:
+            row = self._drivers(drivers)["by_name"].get((name or "").lower())
+        return drivers[row] if row is not None else None
+
+
+def _build_campaign_index(campaigns):
+    by_id = {}
+    by_advertiser_id = {}
+    by_advertiser_name = {}
+    for campaign in campaigns:
+        by_id[campaign.get("id")] = campaign
+        if campaign.get("advertiser_id") is not None:
+            by_advertiser_id.setdefault(campaign["advertiser_id"], []).append(campaign)
+        by_advertiser_name.setdefault(campaign.get("advertiser", "").lower(), []).append(campaign)
+    return {"by_id": by_id, "by_advertiser_id": by_advertiser_id, "by_advertiser_name": by_advertiser_name}
+
+def _build_driver_index(drivers):
+    # User ids are looked up in the DriverTable itself; only names need a hash
+    by_name = {}
+    for row, name in enumerate(drivers.column("name")):
+        # First match wins, as with the linear scan this replaces
+        by_name.setdefault((name or "").lower(), row)
+    return {"by_name": by_name}
+
+
+index = SnapshotIndex()
@@ -1,125 +1,287 @@
+import base64
+import io
 import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
 import streamlit as st
+import data_cache
+import driver_table
+import geofence
+import spatial_index
+import position_store
 
 # Get database credentials from environment variables
 DATABASE_URL = os.environ.get('DATABASE_URL')
 
-def get_db_connection():
-    """Create a database connection"""
-    try:
-        conn = psycopg2.connect(DATABASE_URL, cursor_factory=RealDictCursor)
+# Connection pool sizing, tunable per deployment
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '1'))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '10'))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '10'))
+DB_POOL_MAX_AGE = float(os.environ.get('DB_POOL_MAX_AGE', '1800'))
+DB_POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', '300'))
+DB_POOL_CHECK_AFTER = float(os.environ.get('DB_POOL_CHECK_AFTER', '30'))
+
+# Days until a document expires when a driver registers without its expiry date
+DRIVER_DOCUMENT_VALIDITY_DAYS = int(os.environ.get('DRIVER_DOCUMENT_VALIDITY_DAYS', '365'))
+
+# Days of driver GPS history kept before daily partitions are dropped
+DRIVER_LOCATION_RETENTION_DAYS = int(os.environ.get('DRIVER_LOCATION_RETENTION_DAYS', '30'))
+
+# Minimum seconds between driver list reloads caused by location pings
+DRIVER_POSITION_RELOAD_INTERVAL = float(os.environ.get('DRIVER_POSITION_RELOAD_INTERVAL', '10'))
+
+# Rows fetched per round trip when streaming payment exports
+PAYMENT_EXPORT_ITERSIZE = int(os.environ.get('PAYMENT_EXPORT_ITERSIZE', '2000'))
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of PostgreSQL connections shared by every Streamlit session
+    in the process.
+
+    Connections are health checked on checkout once they have been idle for
+    longer than check_after seconds, replaced once they are older than max_age
+    seconds and closed when idle longer than max_idle seconds (down to min_size).
+    """
+
+    def __init__(self, dsn, min_size=1, max_size=10, timeout=10.0, max_age=1800.0,
+                 max_idle=300.0, check_after=30.0):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max(max_size, 1)
+        self.timeout = timeout
+        self.max_age = max_age
+        self.max_idle = max_idle
+        self.check_after = check_after
+
+        self._idle = deque()  # (conn, created_at, last_used_at), most recent on the right
+        self._created_at = {}
+        self._size = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            "checkouts": 0,
+            "misses": 0,
+            "waits": 0,
+            "wait_time": 0.0,
+            "timeouts": 0,
+            "health_check_failures": 0,
+            "expired": 0,
+            "reaped": 0,
+        }
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn, cursor_factory=RealDictCursor)
+        self._created_at[id(conn)] = time.monotonic()
         return conn
-    except Exception as e:
-        st.error(f"Database connection error: {e}")
-        return None
 
-def initialize_database():
-    """Create tables if they don't exist"""
-    conn = get_db_connection()
-    if conn:
+    def _discard(self, conn):
+        self._created_at.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn, idle_for):
+        if conn.closed:
+            return False
+        if idle_for < self.check_after:
+            return True
         try:
             with conn.cursor() as cur:
-                # Create users table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS users (
-                        id SERIAL PRIMARY KEY,
-                        name VARCHAR(100) NOT NULL,
-                        email VARCHAR(100) UNIQUE NOT NULL,
-                        password VARCHAR(100) NOT NULL,
-                        role VARCHAR(20) NOT NULL,
-                        phone VARCHAR(20),
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # Create drivers table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS drivers (
-                        id SERIAL PRIMARY KEY,
-                        user_id INTEGER REFERENCES users(id),
-                        vehicle_model VARCHAR(100),
-                        vehicle_number VARCHAR(50),
-                        vehicle_color VARCHAR(50),
-                        license_number VARCHAR(50),
-                        status VARCHAR(20) DEFAULT 'Inactive',
-                        current_location_area VARCHAR(100),
-                        current_location_lat DECIMAL(10, 7),
-                        current_location_lon DECIMAL(10, 7),
-                        kms_today INTEGER DEFAULT 0,
-                        hours_active DECIMAL(5, 2) DEFAULT 0,
-                        current_ad_displaying INTEGER
-                    )
-                """)
-                
-                # Create campaigns table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS campaigns (
-                        id SERIAL PRIMARY KEY,
-                        name VARCHAR(100) NOT NULL,
-                        advertiser_id INTEGER REFERENCES users(id),
-                        status VARCHAR(20) DEFAULT 'Draft',
-                        ad_type VARCHAR(20),
-                        budget INTEGER,
-                        spent INTEGER DEFAULT 0,
-                        views INTEGER DEFAULT 0,
-                        impressions INTEGER DEFAULT 0,
-                        start_date DATE,
-                        end_date DATE,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # Create campaign_regions table (for many-to-many relation)
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS campaign_regions (
-                        id SERIAL PRIMARY KEY,
-                        campaign_id INTEGER REFERENCES campaigns(id),
-                        region_name VARCHAR(100) NOT NULL
-                    )
-                """)
-                
-                # Create payments table
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS payments (
-                        id SERIAL PRIMARY KEY,
-                        user_id INTEGER REFERENCES users(id),
-                        payment_type VARCHAR(50) NOT NULL,
-                        amount DECIMAL(10, 2) NOT NULL,
-                        status VARCHAR(20) DEFAULT 'pending',
-                        description TEXT,
-                        payment_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # Create locations table (for high viewership locations)
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS locations (
-                        id SERIAL PRIMARY KEY,
-                        location_name VARCHAR(100) NOT NULL,
-                        lat DECIMAL(10, 7) NOT NULL,
-                        lon DECIMAL(10, 7) NOT NULL,
-                        views INTEGER DEFAULT 0,
-                        importance INTEGER DEFAULT 1
-                    )
-                """)
-                
-                conn.commit()
-                st.success("Database initialized successfully")
-                
-                # Check if we need to add demo data
-                cur.execute("SELECT COUNT(*) FROM users")
-                user_count = cur.fetchone()['count']
-                
-                if user_count == 0:
-                    add_demo_data(conn)
-                
-        except Exception as e:
+                cur.execute("SELECT 1")
             conn.rollback()
-            st.error(f"Database initialization error: {e}")
+            return True
+        except Exception:
+            return False
+
+    def _reap_idle(self, now):
+        """Close connections idle for too long, oldest first. Caller holds the lock."""
+        reaped = []
+        while self._idle and self._size > self.min_size:
+            conn, _, last_used = self._idle[0]
+            if now - last_used < self.max_idle:
+                break
+            self._idle.popleft()
+            self._size -= 1
+            self._stats["reaped"] += 1
+            reaped.append(conn)
+        return reaped
+
+    def getconn(self):
+        """Check a connection out of the pool, opening a new one if needed"""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+        with self._cond:
+            self._stats["checkouts"] += 1
+            while True:
+                if self._idle:
+                    conn, created_at, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise psycopg2.OperationalError(
+                        f"Timed out after {self.timeout}s waiting for a database connection"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+            if waited:
+                self._stats["waits"] += 1
+                self._stats["wait_time"] += time.monotonic() - start
+
+        if conn is not None:
+            now = time.monotonic()
+            if now - created_at > self.max_age:
+                self._stats["expired"] += 1
+                self._discard(conn)
+                conn = None
+            elif not self._is_healthy(conn, now - last_used):
+                self._stats["health_check_failures"] += 1
+                self._discard(conn)
+                conn = None
+
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._stats["misses"] += 1
+        return conn
+
+    def putconn(self, conn):
+        """Return a connection to the pool, rolling back any open transaction"""
+        if not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except Exception:
+                self._discard(conn)
+
+        now = time.monotonic()
+        with self._cond:
+            if conn.closed:
+                self._created_at.pop(id(conn), None)
+                self._size -= 1
+                reaped = []
+            else:
+                self._idle.append((conn, self._created_at.get(id(conn), now), now))
+                reaped = self._reap_idle(now)
+            self._cond.notify()
+
+        for stale in reaped:
+            self._discard(stale)
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and always returns it"""
+        conn = self.getconn()
+        try:
+            yield conn
         finally:
-            conn.close()
+            self.putconn(conn)
+
+    def stats(self):
+        """Snapshot of the pool counters for sizing the deployment"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats["size"] = self._size
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._size - len(self._idle)
+        stats["avg_wait_ms"] = (stats["wait_time"] / stats["waits"] * 1000) if stats["waits"] else 0.0
+        return stats
+
+    def close(self):
+        """Close all idle connections"""
+        with self._cond:
+            idle = [conn for conn, _, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+        for conn in idle:
+            self._discard(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_connection_pool():
+    """Get the process-wide connection pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    DATABASE_URL,
+                    min_size=DB_POOL_MIN_SIZE,
+                    max_size=DB_POOL_MAX_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    max_age=DB_POOL_MAX_AGE,
+                    max_idle=DB_POOL_MAX_IDLE,
+                    check_after=DB_POOL_CHECK_AFTER,
+                )
+    return _pool
+
+def get_pool_stats():
+    """Get connection pool metrics (checkouts, misses, waits, wait time, ...)"""
+    return get_connection_pool().stats()
+
+@contextmanager
+def get_db_connection():
+    """Borrow a pooled database connection; yields None if the database is unreachable"""
+    pool = get_connection_pool()
+    try:
+        conn = pool.getconn()
+    except Exception as e:
+        st.error(f"Database connection error: {e}")
+        yield None
+        return
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+_schema_ready = False
+_schema_lock = threading.Lock()
+
+# Apply pending migrations in-process when the schema is behind. Deployments run
+# `python migrations.py` out of band and can turn this off.
+DB_AUTO_MIGRATE = os.environ.get('DB_AUTO_MIGRATE', '1') == '1'
+
+def ensure_schema():
+    """Check the schema version once per process, migrating if it is behind"""
+    global _schema_ready
+    if _schema_ready:
+        return
+    with _schema_lock:
+        if _schema_ready:
+            return
+        import migrations
+        with get_db_connection() as conn:
+            if conn:
+                try:
+                    if migrations.get_schema_version(conn) < migrations.LATEST_VERSION:
+                        if DB_AUTO_MIGRATE:
+                            migrations.migrate(conn)
+                        else:
+                            st.warning("Database schema is out of date. Run `python migrations.py`.")
+                    _schema_ready = True
+                except Exception as e:
+                    conn.rollback()
+                    st.error(f"Database initialization error: {e}")
 
 def add_demo_data(conn):
     """Add demo data to the database"""
@@ -147,7 +309,16 @@ def add_demo_data(conn):
                                     kms_today, hours_active)
                 VALUES (%s, 'Swift Dzire', 'MP-09-AB-1234', 'White', 'DL9876543210',
                        'Active', 'Vijay Nagar', 22.7533, 75.8937, 45, 3)
+                RETURNING id
             """, (driver_id,))
+            demo_driver_id = cur.fetchone()['id']
+            # Licence due soon, so the document expiry alert has a recipient
+            today = datetime.now().date()
+            _insert_driver_documents(cur, demo_driver_id, {
+                "license": {"status": "Verified", "expiry": today + timedelta(days=20)},
+                "insurance": {"status": "Verified", "expiry": today + timedelta(days=180)},
+                "vehicle_registration": {"status": "Verified", "expiry": today + timedelta(days=400)},
+            })
             
             # Add demo campaigns
             cur.execute("""
@@ -199,7 +370,10 @@ def add_demo_data(conn):
                 (%s, 'driver_payment', 2300.00, 'completed', 'Weekly payment for March 15'),
                 (%s, 'advertiser_payment', 12500.00, 'completed', 'Summer Sale Promotion - Initial payment'),
                 (%s, 'advertiser_payment', 18000.00, 'completed', 'Brand Awareness Campaign - Initial payment')
+                RETURNING id
             """, (driver_id, driver_id, advertiser_id, advertiser_id))
+            payment_ids = [row['id'] for row in cur.fetchall()]
+            _apply_payment_rollups(cur, "p.id = ANY(%s)", [payment_ids])
             
             conn.commit()
             st.success("Demo data added successfully")
@@ -210,347 +384,895 @@ def add_demo_data(conn):
 
 def get_users():
     """Get all users from the database"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                cur.execute("SELECT * FROM users")
-                users = cur.fetchall()
-                return users
-        except Exception as e:
-            st.error(f"Error retrieving users: {e}")
-            return []
-        finally:
-            conn.close()
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT * FROM users")
+                    users = cur.fetchall()
+                    return users
+            except Exception as e:
+                st.error(f"Error retrieving users: {e}")
+                return []
     return []
 
 def get_user_by_email(email):
     """Get user by email"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                cur.execute("SELECT * FROM users WHERE email = %s", (email,))
-                user = cur.fetchone()
-                return user
-        except Exception as e:
-            st.error(f"Error retrieving user: {e}")
-            return None
-        finally:
-            conn.close()
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT * FROM users WHERE email = %s", (email,))
+                    user = cur.fetchone()
+                    return user
+            except Exception as e:
+                st.error(f"Error retrieving user: {e}")
+                return None
     return None
 
 def get_drivers():
     """Get all drivers with user information"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    SELECT d.*, u.name, u.email, u.phone 
-                    FROM drivers d
-                    JOIN users u ON d.user_id = u.id
-                """)
-                drivers = cur.fetchall()
-                return drivers
-        except Exception as e:
-            st.error(f"Error retrieving drivers: {e}")
-            return []
-        finally:
-            conn.close()
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT d.*, u.name, u.email, u.phone 
+                        FROM drivers d
+                        JOIN users u ON d.user_id = u.id
+                    """)
+                    drivers = cur.fetchall()
+                    return drivers
+            except Exception as e:
+                st.error(f"Error retrieving drivers: {e}")
+                return []
     return []
 
+def get_driver_positions():
+    """
+    Get the current position of every located driver
+
+    Returns:
+    - List of dicts with id, lat, lon and area, or None if the query failed
+    """
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT id, current_location_lat AS lat, current_location_lon AS lon,
+                               current_location_area AS area
+                        FROM drivers
+                        WHERE current_location_lat IS NOT NULL AND current_location_lon IS NOT NULL
+                    """)
+                    return cur.fetchall()
+            except Exception as e:
+                st.error(f"Error retrieving driver positions: {e}")
+                return None
+    return None
+
 def get_campaigns(advertiser_id=None):
     """Get campaigns with optional advertiser filter"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                if advertiser_id:
-                    cur.execute("""
-                        SELECT c.*, u.name as advertiser 
-                        FROM campaigns c
-                        JOIN users u ON c.advertiser_id = u.id
-                        WHERE c.advertiser_id = %s
-                    """, (advertiser_id,))
-                else:
-                    cur.execute("""
-                        SELECT c.*, u.name as advertiser 
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    # Regions are collected per campaign in the same statement
+                    # so the query count stays constant as campaigns grow
+                    query = """
+                        SELECT c.*, u.name as advertiser,
+                               ARRAY(
+                                   SELECT cr.region_name FROM campaign_regions cr
+                                   WHERE cr.campaign_id = c.id
+                                   ORDER BY cr.id
+                               ) AS regions
                         FROM campaigns c
                         JOIN users u ON c.advertiser_id = u.id
-                    """)
-                campaigns = cur.fetchall()
-                
-                # Get regions for each campaign
-                for campaign in campaigns:
-                    cur.execute("""
-                        SELECT region_name FROM campaign_regions 
-                        WHERE campaign_id = %s
-                    """, (campaign['id'],))
-                    regions = cur.fetchall()
-                    campaign['regions'] = [r['region_name'] for r in regions]
+                    """
+                    params = []
+
+                    if advertiser_id:
+                        query += " WHERE c.advertiser_id = %s"
+                        params.append(advertiser_id)
+
+                    query += " ORDER BY c.id"
+
+                    cur.execute(query, params)
+                    campaigns = cur.fetchall()
                 
-                return campaigns
-        except Exception as e:
-            st.error(f"Error retrieving campaigns: {e}")
-            return []
-        finally:
-            conn.close()
+                    return campaigns
+            except Exception as e:
+                st.error(f"Error retrieving campaigns: {e}")
+                return []
     return []
 
 def get_high_viewership_locations():
     """Get high viewership locations"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                cur.execute("SELECT * FROM locations ORDER BY views DESC")
-                locations = cur.fetchall()
-                return locations
-        except Exception as e:
-            st.error(f"Error retrieving locations: {e}")
-            return []
-        finally:
-            conn.close()
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT * FROM locations ORDER BY views DESC")
+                    locations = cur.fetchall()
+                    return locations
+            except Exception as e:
+                st.error(f"Error retrieving locations: {e}")
+                return []
     return []
 
-def get_payments(user_id=None, payment_type=None):
-    """Get payments with optional filters"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                query = "SELECT p.*, u.name, u.email FROM payments p JOIN users u ON p.user_id = u.id WHERE 1=1"
-                params = []
-                
-                if user_id:
-                    query += " AND p.user_id = %s"
-                    params.append(user_id)
-                
-                if payment_type:
-                    query += " AND p.payment_type = %s"
-                    params.append(payment_type)
-                
-                query += " ORDER BY p.payment_date DESC"
+def _payment_filters(user_id=None, payment_type=None, status=None, date_from=None, date_to=None):
+    """Build the WHERE clause and parameters shared by the payment queries"""
+    where = "WHERE 1=1"
+    params = []
+
+    if user_id:
+        where += " AND p.user_id = %s"
+        params.append(user_id)
+
+    if payment_type:
+        where += " AND p.payment_type = %s"
+        params.append(payment_type)
+
+    if status:
+        where += " AND p.status = %s"
+        params.append(status)
+
+    # Half-open range on the raw column so the composite indexes apply
+    if date_from:
+        where += " AND p.payment_date >= %s"
+        params.append(_day_start(date_from))
+
+    if date_to:
+        where += " AND p.payment_date < %s"
+        params.append(_day_start(date_to) + timedelta(days=1))
+
+    return where, params
+
+def get_payments(user_id=None, payment_type=None, status=None, date_from=None, date_to=None, limit=None):
+    """
+    Get payments with optional filters, newest first
+
+    Parameters:
+    - user_id / payment_type / status: Exact-match filters
+    - date_from / date_to: Inclusive date bounds (date, datetime or YYYY-MM-DD)
+    - limit: Maximum number of rows to return
+    """
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    where, params = _payment_filters(user_id, payment_type, status, date_from, date_to)
+                    query = f"""
+                        SELECT p.*, u.name, u.email FROM payments p JOIN users u ON p.user_id = u.id
+                        {where}
+                        ORDER BY p.payment_date DESC, p.id DESC
+                    """
+
+                    if limit:
+                        query += " LIMIT %s"
+                        params.append(limit)
                 
-                cur.execute(query, params)
-                payments = cur.fetchall()
-                return payments
-        except Exception as e:
-            st.error(f"Error retrieving payments: {e}")
-            return []
-        finally:
-            conn.close()
+                    cur.execute(query, params)
+                    payments = cur.fetchall()
+                    return payments
+            except Exception as e:
+                st.error(f"Error retrieving payments: {e}")
+                return []
     return []
 
-def create_user(user_data):
-    """Create a new user"""
-    conn = get_db_connection()
-    if conn:
+def encode_page_token(payment_date, payment_id):
+    """Opaque token for the keyset position after a payment"""
+    raw = f"{payment_date.isoformat()}|{payment_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+def decode_page_token(token):
+    """Inverse of encode_page_token; returns (payment_date, payment_id)"""
+    raw = base64.urlsafe_b64decode(token.encode()).decode()
+    payment_date, payment_id = raw.rsplit("|", 1)
+    return datetime.fromisoformat(payment_date), int(payment_id)
+
+def get_payments_page(user_id=None, payment_type=None, status=None, date_from=None, date_to=None,
+                      page_size=50, page_token=None):
+    """
+    Get one page of payments, newest first, using keyset pagination on (payment_date, id)
+
+    Parameters:
+    - Filters as in get_payments
+    - page_size: Number of rows per page
+    - page_token: Token returned with the previous page (None for the first page)
+
+    Returns:
+    - (rows, next_page_token); next_page_token is None on the last page
+    """
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    where, params = _payment_filters(user_id, payment_type, status, date_from, date_to)
+                    if page_token:
+                        where += " AND (p.payment_date, p.id) < (%s, %s)"
+                        params.extend(decode_page_token(page_token))
+
+                    # Fetch one extra row to know whether another page exists
+                    cur.execute(f"""
+                        SELECT p.*, u.name, u.email FROM payments p JOIN users u ON p.user_id = u.id
+                        {where}
+                        ORDER BY p.payment_date DESC, p.id DESC
+                        LIMIT %s
+                    """, params + [page_size + 1])
+                    rows = cur.fetchall()
+
+                    next_token = None
+                    if len(rows) > page_size:
+                        rows = rows[:page_size]
+                        next_token = encode_page_token(rows[-1]['payment_date'], rows[-1]['id'])
+                    return rows, next_token
+            except Exception as e:
+                st.error(f"Error retrieving payments: {e}")
+                return [], None
+    return [], None
+
+def iter_payments(user_id=None, payment_type=None, status=None, date_from=None, date_to=None,
+                  itersize=PAYMENT_EXPORT_ITERSIZE):
+    """
+    Stream payments, newest first, through a server-side cursor
+
+    Rows are fetched from PostgreSQL itersize at a time, so exports of any
+    size keep memory flat. The pooled connection is held until the generator
+    is exhausted or closed.
+    """
+    with get_db_connection() as conn:
+        if not conn:
+            return
+        where, params = _payment_filters(user_id, payment_type, status, date_from, date_to)
         try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO users (name, email, password, role, phone)
-                    VALUES (%s, %s, %s, %s, %s)
-                    RETURNING id
-                """, (
-                    user_data['name'], 
-                    user_data['email'], 
-                    user_data['password'], 
-                    user_data['role'], 
-                    user_data.get('phone', '')
-                ))
-                user_id = cur.fetchone()['id']
-                conn.commit()
-                return user_id
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Error creating user: {e}")
-            return None
+            with conn.cursor(name=f"payments_export_{uuid.uuid4().hex}") as cur:
+                cur.itersize = itersize
+                cur.execute(f"""
+                    SELECT p.*, u.name, u.email FROM payments p JOIN users u ON p.user_id = u.id
+                    {where}
+                    ORDER BY p.payment_date DESC, p.id DESC
+                """, params)
+                for row in cur:
+                    yield row
         finally:
-            conn.close()
+            # Named cursors live inside a transaction; end it before the connection goes back
+            conn.rollback()
+
+def _day_start(value):
+    """Midnight of a date, datetime or YYYY-MM-DD string"""
+    if isinstance(value, str):
+        value = datetime.strptime(value[:10], "%Y-%m-%d")
+    elif not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def create_user(user_data):
+    """Create a new user"""
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        INSERT INTO users (name, email, password, role, phone)
+                        VALUES (%s, %s, %s, %s, %s)
+                        RETURNING id
+                    """, (
+                        user_data['name'], 
+                        user_data['email'], 
+                        user_data['password'], 
+                        user_data['role'], 
+                        user_data.get('phone', '')
+                    ))
+                    user_id = cur.fetchone()['id']
+                    conn.commit()
+                    return user_id
+            except Exception as e:
+                conn.rollback()
+                st.error(f"Error creating user: {e}")
+                return None
     return None
 
+def _insert_driver_documents(cur, driver_id, documents=None):
+    """
+    Record a driver's documents for expiry alerts
+
+    Parameters:
+    - cur: Cursor in the caller's transaction
+    - driver_id: Driver the documents belong to
+    - documents: Optional {document_type: {"status", "expiry"}} as in driver records;
+      missing documents are recorded as Pending, expiring DRIVER_DOCUMENT_VALIDITY_DAYS out
+    """
+    documents = documents or {}
+    default_expiry = datetime.now().date() + timedelta(days=DRIVER_DOCUMENT_VALIDITY_DAYS)
+    rows = []
+    for document_type in driver_table.DOCUMENT_TYPES:
+        document = documents.get(document_type) or {}
+        rows.append((
+            driver_id,
+            document_type,
+            document.get('status') or 'Pending',
+            document.get('expiry') or default_expiry,
+        ))
+    execute_values(cur, """
+        INSERT INTO driver_documents (driver_id, document_type, status, expiry_date)
+        VALUES %s
+        ON CONFLICT (driver_id, document_type)
+        DO UPDATE SET status = EXCLUDED.status, expiry_date = EXCLUDED.expiry_date
+    """, rows)
+
 def create_driver(driver_data, user_id):
     """Create a new driver for an existing user"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO drivers (
-                        user_id, vehicle_model, vehicle_number, vehicle_color, 
-                        license_number, status, current_location_area, 
-                        current_location_lat, current_location_lon
-                    )
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    RETURNING id
-                """, (
-                    user_id,
-                    driver_data.get('vehicle_model', ''),
-                    driver_data.get('vehicle_number', ''),
-                    driver_data.get('vehicle_color', ''),
-                    driver_data.get('license_number', ''),
-                    driver_data.get('status', 'Inactive'),
-                    driver_data.get('current_location_area', 'Indore'),
-                    driver_data.get('current_location_lat', 22.7196),
-                    driver_data.get('current_location_lon', 75.8577)
-                ))
-                driver_id = cur.fetchone()['id']
-                conn.commit()
-                return driver_id
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Error creating driver: {e}")
-            return None
-        finally:
-            conn.close()
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        INSERT INTO drivers (
+                            user_id, vehicle_model, vehicle_number, vehicle_color, 
+                            license_number, status, current_location_area, 
+                            current_location_lat, current_location_lon
+                        )
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                        RETURNING id
+                    """, (
+                        user_id,
+                        driver_data.get('vehicle_model', ''),
+                        driver_data.get('vehicle_number', ''),
+                        driver_data.get('vehicle_color', ''),
+                        driver_data.get('license_number', ''),
+                        driver_data.get('status', 'Inactive'),
+                        driver_data.get('current_location_area', 'Indore'),
+                        driver_data.get('current_location_lat', 22.7196),
+                        driver_data.get('current_location_lon', 75.8577)
+                    ))
+                    driver_id = cur.fetchone()['id']
+                    _insert_driver_documents(cur, driver_id, driver_data.get('documents'))
+                    conn.commit()
+                    data_cache.invalidate(data_cache.DRIVERS)
+                    return driver_id
+            except Exception as e:
+                conn.rollback()
+                st.error(f"Error creating driver: {e}")
+                return None
     return None
 
 def create_campaign(campaign_data):
     """Create a new campaign"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO campaigns (
-                        name, advertiser_id, status, ad_type, budget, 
-                        start_date, end_date
-                    )
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    RETURNING id
-                """, (
-                    campaign_data['name'],
-                    campaign_data['advertiser_id'],
-                    campaign_data.get('status', 'Draft'),
-                    campaign_data.get('ad_type', 'image'),
-                    campaign_data.get('budget', 0),
-                    campaign_data.get('start_date'),
-                    campaign_data.get('end_date')
-                ))
-                campaign_id = cur.fetchone()['id']
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        INSERT INTO campaigns (
+                            name, advertiser_id, status, ad_type, budget, 
+                            start_date, end_date
+                        )
+                        VALUES (%s, %s, %s, %s, %s, %s, %s)
+                        RETURNING id
+                    """, (
+                        campaign_data['name'],
+                        campaign_data['advertiser_id'],
+                        campaign_data.get('status', 'Draft'),
+                        campaign_data.get('ad_type', 'image'),
+                        campaign_data.get('budget', 0),
+                        campaign_data.get('start_date'),
+                        campaign_data.get('end_date')
+                    ))
+                    campaign_id = cur.fetchone()['id']
                 
-                # Add regions if provided
-                if 'regions' in campaign_data and campaign_data['regions']:
-                    for region in campaign_data['regions']:
-                        cur.execute("""
-                            INSERT INTO campaign_regions (campaign_id, region_name)
-                            VALUES (%s, %s)
-                        """, (campaign_id, region))
+                    # Add regions if provided
+                    if 'regions' in campaign_data and campaign_data['regions']:
+                        for region in campaign_data['regions']:
+                            cur.execute("""
+                                INSERT INTO campaign_regions (campaign_id, region_name)
+                                VALUES (%s, %s)
+                            """, (campaign_id, region))
                 
-                conn.commit()
-                return campaign_id
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Error creating campaign: {e}")
-            return None
-        finally:
-            conn.close()
+                    conn.commit()
+                    data_cache.invalidate(data_cache.CAMPAIGNS)
+                    return campaign_id
+            except Exception as e:
+                conn.rollback()
+                st.error(f"Error creating campaign: {e}")
+                return None
     return None
 
 def create_payment(payment_data):
-    """Create a new payment record"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    INSERT INTO payments (
-                        user_id, payment_type, amount, status, description
-                    )
-                    VALUES (%s, %s, %s, %s, %s)
-                    RETURNING id
-                """, (
-                    payment_data['user_id'],
-                    payment_data['payment_type'],
-                    payment_data['amount'],
-                    payment_data.get('status', 'pending'),
-                    payment_data.get('description', '')
-                ))
-                payment_id = cur.fetchone()['id']
-                conn.commit()
-                return payment_id
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Error creating payment: {e}")
-            return None
-        finally:
-            conn.close()
+    """
+    Create a new payment record
+
+    A payment_data['idempotency_key'] that was already used returns the
+    original payment instead of inserting a duplicate.
+
+    Returns:
+    - The inserted (or original) payment row, or None on failure
+    """
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    idempotency_key = payment_data.get('idempotency_key')
+                    cur.execute("""
+                        INSERT INTO payments (
+                            payment_ref, user_id, payment_type, amount, status, description,
+                            campaign_id, payment_method, transaction_id, payment_date, idempotency_key
+                        )
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, COALESCE(%s, CURRENT_TIMESTAMP), %s)
+                        ON CONFLICT (idempotency_key) WHERE idempotency_key IS NOT NULL DO NOTHING
+                        RETURNING *
+                    """, (
+                        payment_data.get('payment_ref') or str(uuid.uuid4()),
+                        payment_data['user_id'],
+                        payment_data['payment_type'],
+                        payment_data['amount'],
+                        payment_data.get('status', 'pending'),
+                        payment_data.get('description', ''),
+                        payment_data.get('campaign_id'),
+                        payment_data.get('payment_method'),
+                        payment_data.get('transaction_id'),
+                        payment_data.get('payment_date'),
+                        idempotency_key
+                    ))
+                    payment = cur.fetchone()
+                    if payment is None:
+                        # Duplicate submission: hand back the payment that won
+                        cur.execute("SELECT * FROM payments WHERE idempotency_key = %s", (idempotency_key,))
+                        payment = cur.fetchone()
+                    else:
+                        _apply_payment_rollups(cur, "p.id = %s", [payment['id']])
+                    conn.commit()
+                    return payment
+            except Exception as e:
+                conn.rollback()
+                st.error(f"Error creating payment: {e}")
+                return None
     return None
 
+# Adds the payments matching a WHERE clause to every day/week/month rollup
+# they belong to, per user and type and for the all-users/all-types totals.
+# Rows are upserted in key order so concurrent writers cannot deadlock.
+_PAYMENT_ROLLUP_SQL = """
+    INSERT INTO payment_rollups (
+        period, period_start, user_id, payment_type, total_amount, payment_count, pending_count
+    )
+    SELECT g.period, date_trunc(g.period, p.payment_date)::date, u.user_id, t.payment_type,
+           SUM(p.amount), COUNT(*), COUNT(*) FILTER (WHERE p.status = 'pending')
+    FROM payments p
+    CROSS JOIN (VALUES ('day'), ('week'), ('month')) g(period)
+    CROSS JOIN LATERAL (VALUES (p.user_id), (0)) u(user_id)
+    CROSS JOIN LATERAL (VALUES (p.payment_type), ('all')) t(payment_type)
+    WHERE u.user_id IS NOT NULL AND ({where})
+    GROUP BY 1, 2, 3, 4
+    ORDER BY 1, 3, 4, 2
+    ON CONFLICT (period, user_id, payment_type, period_start) DO UPDATE SET
+        total_amount = payment_rollups.total_amount + EXCLUDED.total_amount,
+        payment_count = payment_rollups.payment_count + EXCLUDED.payment_count,
+        pending_count = payment_rollups.pending_count + EXCLUDED.pending_count
+"""
+
+def _apply_payment_rollups(cur, where_sql, params):
+    """Fold newly inserted payments (selected by where_sql on alias p) into payment_rollups"""
+    cur.execute(_PAYMENT_ROLLUP_SQL.format(where=where_sql), params)
+
+def apply_payout_run_rollups(cur, payout_run_id):
+    """
+    Fold the payments of a payout run into payment_rollups
+
+    Parameters:
+    - cur: Cursor inside the transaction that inserted the run's payments
+    - payout_run_id: Id of the payout_runs row
+    """
+    _apply_payment_rollups(cur, "p.payout_run_id = %s", [payout_run_id])
+
+def get_payment_rollups(period="day", user_id=None, payment_type=None, date_from=None, date_to=None):
+    """
+    Get pre-aggregated payment totals, oldest period first
+
+    Parameters:
+    - period: day, week or month
+    - user_id: Only this user's payments (None for all users)
+    - payment_type: Only this payment type (None for all types)
+    - date_from / date_to: Inclusive bounds on the period start date
+    """
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    query = """
+                        SELECT period_start, total_amount, payment_count, pending_count
+                        FROM payment_rollups
+                        WHERE period = %s AND user_id = %s AND payment_type = %s
+                    """
+                    params = [period, user_id or 0, payment_type or 'all']
+
+                    if date_from:
+                        query += " AND period_start >= %s"
+                        params.append(_day_start(date_from).date())
+
+                    if date_to:
+                        query += " AND period_start <= %s"
+                        params.append(_day_start(date_to).date())
+
+                    query += " ORDER BY period_start"
+
+                    cur.execute(query, params)
+                    return cur.fetchall()
+            except Exception as e:
+                st.error(f"Error retrieving payment rollups: {e}")
+                return []
+    return []
+
+def create_invoice(invoice_data, items):
+    """
+    Create an invoice with its line items
+
+    Parameters:
+    - invoice_data: Dictionary with invoice_id, user_id, user_type, amount, due_date
+    - items: List of dictionaries with description, amount and optional campaign_id
+
+    Returns:
+    - The inserted invoice row, or None on failure
+    """
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        INSERT INTO invoices (invoice_id, user_id, user_type, amount, due_date, status)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                        RETURNING *
+                    """, (
+                        invoice_data['invoice_id'],
+                        invoice_data['user_id'],
+                        invoice_data['user_type'],
+                        invoice_data['amount'],
+                        invoice_data['due_date'],
+                        invoice_data.get('status', 'pending')
+                    ))
+                    invoice = cur.fetchone()
+                    if items:
+                        execute_values(cur, """
+                            INSERT INTO invoice_items (invoice_id, campaign_id, description, amount)
+                            VALUES %s
+                        """, [
+                            (invoice['invoice_id'], item.get('campaign_id'), item.get('description', ''), item.get('amount', 0))
+                            for item in items
+                        ])
+                    conn.commit()
+                    return invoice
+            except Exception as e:
+                conn.rollback()
+                st.error(f"Error creating invoice: {e}")
+                return None
+    return None
+
+def get_invoice(invoice_id):
+    """Get an invoice by id, with its items under 'items' (None if not found)"""
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT * FROM invoices WHERE invoice_id = %s", (invoice_id,))
+                    invoice = cur.fetchone()
+                    if invoice is None:
+                        return None
+                    cur.execute("""
+                        SELECT campaign_id, description, amount FROM invoice_items
+                        WHERE invoice_id = %s ORDER BY id
+                    """, (invoice_id,))
+                    invoice['items'] = cur.fetchall()
+                    return invoice
+            except Exception as e:
+                st.error(f"Error retrieving invoice: {e}")
+                return None
+    return None
+
+def get_invoices(user_id=None, status=None):
+    """Get invoices with optional filters, most recently issued first"""
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    query = "SELECT * FROM invoices WHERE 1=1"
+                    params = []
+
+                    if user_id:
+                        query += " AND user_id = %s"
+                        params.append(user_id)
+
+                    if status:
+                        query += " AND status = %s"
+                        params.append(status)
+
+                    query += " ORDER BY issue_date DESC, invoice_id"
+
+                    cur.execute(query, params)
+                    return cur.fetchall()
+            except Exception as e:
+                st.error(f"Error retrieving invoices: {e}")
+                return []
+    return []
+
 def update_driver_location(driver_id, location_data):
     """Update a driver's location"""
-    conn = get_db_connection()
-    if conn:
+    return update_driver_locations_bulk([{
+        "driver_id": driver_id,
+        "area": location_data.get('area'),
+        "lat": location_data['lat'],
+        "lon": location_data['lon'],
+        "recorded_at": location_data.get('recorded_at'),
+    }])
+
+_location_partitions = set()
+_location_partitions_lock = threading.Lock()
+
+def _location_partition_name(day):
+    return f"driver_locations_p{day.strftime('%Y%m%d')}"
+
+def ensure_location_partitions(cur, days):
+    """
+    Create daily driver_locations partitions that don't exist yet
+
+    Parameters:
+    - cur: Cursor inside the caller's transaction
+    - days: Iterable of dates that need a partition
+
+    Returns:
+    - True if any partition was created
+    """
+    with _location_partitions_lock:
+        missing = sorted(set(days) - _location_partitions)
+    if not missing:
+        return False
+
+    for day in missing:
+        # Also prepare the next day so midnight pings don't pay for DDL
+        for d in (day, day + timedelta(days=1)):
+            cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {_location_partition_name(d)}
+                PARTITION OF driver_locations
+                FOR VALUES FROM (%s) TO (%s)
+            """, (d, d + timedelta(days=1)))
+    with _location_partitions_lock:
+        _location_partitions.update(missing)
+    return True
+
+def update_driver_locations_bulk(pings):
+    """
+    Record a batch of GPS pings and move drivers to their latest position
+
+    All pings are appended to the driver_locations history with one COPY and the
+    current-position columns on drivers are updated in the same transaction.
+
+    Parameters:
+    - pings: List of dicts with driver_id, lat, lon and optional area, recorded_at
+
+    Returns:
+    - True on success, False otherwise
+    """
+    if not pings:
+        return True
+
+    now = datetime.now()
+    # Areas come from the region geofences; the reported area is only a fallback
+    fenced_areas = geofence.classify_positions(
+        [float(ping['lat']) for ping in pings], [float(ping['lon']) for ping in pings]
+    )
+
+    import ad_events
+
+    latest = {}
+    days = set()
+    data = io.StringIO()
+    for ping, fenced_area in zip(pings, fenced_areas):
+        recorded_at = ping.get('recorded_at') or now
+        area = fenced_area or ping.get('area')
+        days.add(recorded_at.date())
+        data.write("\t".join(ad_events._copy_value(value) for value in (
+            int(ping['driver_id']),
+            recorded_at.isoformat(),
+            float(ping['lat']),
+            float(ping['lon']),
+            area,
+        )))
+        data.write("\n")
+        current = latest.get(ping['driver_id'])
+        if current is None or recorded_at >= current[0]:
+            latest[ping['driver_id']] = (recorded_at, area, ping)
+    data.seek(0)
+
+    # Candidate lists are refreshed before taking a connection: a refresh reads campaigns
+    import ad_scheduler
+    ad_scheduler.refresh()
+    driver_ids = sorted(latest)
+
+    with get_db_connection() as conn:
+        if not conn:
+            return False
         try:
             with conn.cursor() as cur:
+                created = ensure_location_partitions(cur, days)
+                cur.copy_expert(
+                    "COPY driver_locations (driver_id, recorded_at, lat, lon, area) FROM STDIN",
+                    data
+                )
+                # Lock the moved cabs (in id order, so concurrent batches don't
+                # deadlock) and read their status and the ad each one is
+                # displaying, so the decision below is consistent with what
+                # this transaction writes
                 cur.execute("""
-                    UPDATE drivers SET 
-                    current_location_area = %s,
-                    current_location_lat = %s,
-                    current_location_lon = %s
-                    WHERE id = %s
-                """, (
-                    location_data['area'],
-                    location_data['lat'],
-                    location_data['lon'],
-                    driver_id
-                ))
+                    SELECT id, status, current_location_area, current_ad_displaying FROM drivers
+                    WHERE id = ANY(%s) ORDER BY id FOR UPDATE
+                """, (driver_ids,))
+                current = {row['id']: row for row in cur.fetchall()}
+                areas = [
+                    latest[driver_id][1] or current.get(driver_id, {}).get('current_location_area')
+                    for driver_id in driver_ids
+                ]
+                ads = [current.get(driver_id, {}).get('current_ad_displaying') for driver_id in driver_ids]
+                # Re-decide ads for Active cabs that moved; a cab keeps its ad while
+                # still eligible. Other cabs keep whatever they were displaying.
+                active = [i for i, driver_id in enumerate(driver_ids)
+                          if current.get(driver_id, {}).get('status') == 'Active']
+                decided = ad_scheduler.decide_ads(
+                    [driver_ids[i] for i in active], [areas[i] for i in active],
+                    [ads[i] for i in active], refresh=False
+                )
+                for i, ad in zip(active, decided):
+                    ads[i] = ad
+                positions = [
+                    (driver_id, area, latest[driver_id][2]['lat'], latest[driver_id][2]['lon'], ad)
+                    for driver_id, area, ad in zip(driver_ids, areas, ads)
+                ]
+                execute_values(cur, """
+                    UPDATE drivers d SET
+                    current_location_area = v.area,
+                    current_location_lat = v.lat,
+                    current_location_lon = v.lon,
+                    current_ad_displaying = v.ad
+                    FROM (VALUES %s) AS v(id, area, lat, lon, ad)
+                    WHERE d.id = v.id
+                """, positions,
+                    template="(%s::integer, %s::varchar, %s::decimal, %s::decimal, %s::integer)",
+                    page_size=len(positions))
                 conn.commit()
-                return True
+            # Live positions are served by the spatial index and position
+            # store; the shared driver list only needs an occasional reload
+            data_cache.expire(data_cache.DRIVERS, within=DRIVER_POSITION_RELOAD_INTERVAL)
+            spatial_index.update_positions(
+                (driver_id, lat, lon) for driver_id, _, lat, lon, _ in positions
+            )
+            position_store.record_positions(
+                (driver_id, lat, lon, area) for driver_id, area, lat, lon, _ in positions
+            )
         except Exception as e:
             conn.rollback()
+            # Forget partitions from the rolled back transaction
+            with _location_partitions_lock:
+                _location_partitions.clear()
             st.error(f"Error updating driver location: {e}")
             return False
-        finally:
-            conn.close()
+
+    if created:
+        # A new day started: a cheap moment to apply the retention policy,
+        # once this batch's pooled connection is back in the pool
+        drop_old_location_partitions()
+    return True
+
+def drop_old_location_partitions(retention_days=None, archive=False):
+    """
+    Apply the driver location retention policy
+
+    Parameters:
+    - retention_days: Days of history to keep (defaults to DRIVER_LOCATION_RETENTION_DAYS)
+    - archive: Detach old partitions as standalone tables instead of dropping them
+
+    Returns:
+    - Names of the partitions removed from driver_locations
+    """
+    if retention_days is None:
+        retention_days = DRIVER_LOCATION_RETENTION_DAYS
+    cutoff = (datetime.now() - timedelta(days=retention_days)).strftime('%Y%m%d')
+
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT c.relname FROM pg_inherits i
+                        JOIN pg_class c ON c.oid = i.inhrelid
+                        WHERE i.inhparent = 'driver_locations'::regclass
+                    """)
+                    # Partition names end in YYYYMMDD, so string order is date order
+                    expired = sorted(
+                        row['relname'] for row in cur.fetchall()
+                        if row['relname'].startswith('driver_locations_p') and row['relname'][-8:] < cutoff
+                    )
+                    for name in expired:
+                        if archive:
+                            cur.execute(f"ALTER TABLE driver_locations DETACH PARTITION {name}")
+                        else:
+                            cur.execute(f"DROP TABLE {name}")
+                    conn.commit()
+                # Days removed here must be created again if a late ping arrives
+                with _location_partitions_lock:
+                    _location_partitions.difference_update(
+                        datetime.strptime(name[-8:], '%Y%m%d').date() for name in expired
+                    )
+                return expired
+            except Exception as e:
+                conn.rollback()
+                st.error(f"Error applying driver location retention: {e}")
+                return []
+    return []
+
+def update_driver_ads(assignments):
+    """
+    Set the campaign each cab is displaying
+
+    Parameters:
+    - assignments: List of (driver_id, campaign_id or None) tuples
+    """
+    if not assignments:
+        return True
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    execute_values(cur, """
+                        UPDATE drivers d SET current_ad_displaying = v.ad
+                        FROM (VALUES %s) AS v(id, ad)
+                        WHERE d.id = v.id
+                    """, sorted(assignments, key=lambda a: a[0]),
+                        template="(%s::integer, %s::integer)", page_size=len(assignments))
+                    conn.commit()
+                    data_cache.invalidate(data_cache.DRIVERS)
+                    return True
+            except Exception as e:
+                conn.rollback()
+                st.error(f"Error updating displayed ads: {e}")
+                return False
     return False
 
 def update_campaign_status(campaign_id, status):
     """Update a campaign's status"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    UPDATE campaigns SET status = %s
-                    WHERE id = %s
-                """, (status, campaign_id))
-                conn.commit()
-                return True
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Error updating campaign status: {e}")
-            return False
-        finally:
-            conn.close()
+    with get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        UPDATE campaigns SET
+                            status = %s,
+                            status_changed_at = CASE WHEN status IS DISTINCT FROM %s
+                                                     THEN CURRENT_TIMESTAMP ELSE status_changed_at END
+                        WHERE id = %s
+                    """, (status, status, campaign_id))
+                    conn.commit()
+                    data_cache.invalidate(data_cache.CAMPAIGNS)
+                    return True
+            except Exception as e:
+                conn.rollback()
+                st.error(f"Error updating campaign status: {e}")
+                return False
     return False
 
 def update_campaign_metrics(campaign_id, views, impressions, spent):
-    """Update a campaign's metrics"""
-    conn = get_db_connection()
-    if conn:
-        try:
-            with conn.cursor() as cur:
-                cur.execute("""
-                    UPDATE campaigns SET 
-                    views = views + %s,
-                    impressions = impressions + %s,
-                    spent = spent + %s
-                    WHERE id = %s
-                """, (views, impressions, spent, campaign_id))
-                conn.commit()
-                return True
-        except Exception as e:
-            conn.rollback()
-            st.error(f"Error updating campaign metrics: {e}")
-            return False
-        finally:
-            conn.close()
-    return False
+    """
+    Record a campaign metrics delta
+
+    The delta is buffered as an ad event and folded into the campaign row by the
+    background rollup in ad_events, so hot campaigns are not locked per call.
+    Spend of campaigns the budget pacer tracks is charged through it and
+    clamped to the budget left; other spend is recorded as reported.
 
-# Initialize the database when the module is imported
-if 'db_initialized' not in st.session_state:
-    initialize_database()
-    st.session_state.db_initialized = True
\ No newline at end of file
+    Returns:
+    - True if the delta was buffered
+    """
+    import ad_events
+    import budget_pacing
+    if spent and spent > 0:
+        charged = budget_pacing.pacer.charge(campaign_id, spent)
+        if charged is not None:
+            spent = charged
+    return ad_events.record_event(campaign_id, "metrics", views, impressions, spent)
@@ -0,0 +1,185 @@
+import argparse
+import io
+import sys
+from datetime import date, datetime, timedelta
+import numpy as np
+import db
+
+# Earnings rules, with the rates of the driver dashboard (utils.generate_mock_drivers)
+HOURLY_RATE = 32  # Rs. per active hour
+INCENTIVE_MIN_KMS = 100  # Drivers above this weekly distance earn an incentive
+INCENTIVE_PER_KM = 5  # Rs. per km beyond INCENTIVE_MIN_KMS
+INCENTIVE_MAX = 500  # Upper bound of the incentive (Rs.)
+# Pings further apart than this (seconds) mean the cab was offline in between
+ACTIVE_PING_GAP = 600
+
+# Active hours and kilometres per driver from the week's GPS history: time and
+# distance between consecutive pings, skipping gaps where the cab was offline
+_WEEK_ACTIVITY_SQL = """
+    SELECT d.user_id,
+           COALESCE(SUM(EXTRACT(EPOCH FROM l.gap)) FILTER (WHERE l.gap <= %(max_gap)s), 0) / 3600
+               AS hours_active,
+           COALESCE(SUM(l.km) FILTER (WHERE l.gap <= %(max_gap)s), 0) AS kms
+    FROM drivers d
+    LEFT JOIN (
+        SELECT driver_id,
+               recorded_at - LAG(recorded_at) OVER w AS gap,
+               SQRT(
+                   POWER((lat - LAG(lat) OVER w) * 110.574, 2)
+                   + POWER((lon - LAG(lon) OVER w) * 111.320 * COS(RADIANS(lat)), 2)
+               ) AS km
+        FROM driver_locations
+        WHERE recorded_at >= %(start)s AND recorded_at < %(end)s
+        WINDOW w AS (PARTITION BY driver_id ORDER BY recorded_at)
+    ) l ON l.driver_id = d.id
+    WHERE d.user_id IS NOT NULL
+    GROUP BY d.id, d.user_id
+    ORDER BY d.id
+"""
+
+_COPY_SQL = """
+    COPY payments (user_id, payment_type, amount, status, description, payment_date, payout_run_id)
+    FROM STDIN
+"""
+
+def compute_earnings(hours_active, kms):
+    """
+    Compute driver earnings for a whole fleet at once
+
+    Base pay is HOURLY_RATE per active hour. Drivers above INCENTIVE_MIN_KMS
+    earn INCENTIVE_PER_KM for every km beyond it, up to INCENTIVE_MAX.
+
+    Parameters:
+    - hours_active: Array of active hours per driver
+    - kms: Array of kilometres driven per driver
+
+    Returns:
+    - (base, incentives, total) arrays, rounded to paise
+    """
+    hours_active = np.asarray(hours_active, dtype=np.float64)
+    kms = np.asarray(kms, dtype=np.float64)
+    base = np.round(hours_active * HOURLY_RATE, 2)
+    incentives = np.round(np.clip((kms - INCENTIVE_MIN_KMS) * INCENTIVE_PER_KM, 0.0, INCENTIVE_MAX), 2)
+    return base, incentives, base + incentives
+
+def week_start_of(day=None):
+    """Monday of the week containing a date (defaults to last week)"""
+    day = day or date.today() - timedelta(days=7)
+    return day - timedelta(days=day.weekday())
+
+def run_weekly_payouts(week_start=None):
+    """
+    Create driver payments for a week in a single transaction
+
+    Active hours and kilometres come from the week's driver_locations
+    history, earnings for every driver are computed with vectorized math
+    and the payments are written with one COPY. The payout_runs header is keyed by
+    week, so running the same week again returns the existing run instead
+    of paying twice.
+
+    Parameters:
+    - week_start: Any date in the week to pay (defaults to last week)
+
+    Returns:
+    - Dict with the run's id, run_key, status, driver_count, total_amount and
+      whether it was created by this call, or None on failure
+    """
+    week_start = week_start_of(week_start)
+    week_end = week_start + timedelta(days=6)
+    run_key = f"weekly-{week_start.isoformat()}"
+
+    with db.get_db_connection() as conn:
+        if not conn:
+            return None
+        try:
+            with conn.cursor() as cur:
+                # A concurrent run of the same week blocks here until the first commits
+                cur.execute("""
+                    INSERT INTO payout_runs (run_key, period_start, period_end)
+                    VALUES (%s, %s, %s)
+                    ON CONFLICT (run_key) DO NOTHING
+                    RETURNING id
+                """, (run_key, week_start, week_end))
+                row = cur.fetchone()
+                if row is None:
+                    conn.rollback()
+                    existing = get_payout_run(run_key)
+                    if existing:
+                        existing["created"] = False
+                    return existing
+                run_id = row['id']
+
+                cur.execute(_WEEK_ACTIVITY_SQL, {
+                    "start": week_start,
+                    "end": week_end + timedelta(days=1),
+                    "max_gap": timedelta(seconds=ACTIVE_PING_GAP),
+                })
+                drivers = cur.fetchall()
+
+                user_ids = np.array([d['user_id'] for d in drivers], dtype=np.int64)
+                _, _, total = compute_earnings(
+                    [float(d['hours_active']) for d in drivers], [float(d['kms']) for d in drivers]
+                )
+                payable = total > 0
+                user_ids, total = user_ids[payable], total[payable]
+
+                paid_at = datetime.now().isoformat(sep=" ")
+                description = f"Weekly payment for {week_start:%B} {week_start.day}"
+                data = io.StringIO()
+                data.writelines(
+                    f"{user_id}\tdriver_payment\t{amount:.2f}\tpending\t{description}\t{paid_at}\t{run_id}\n"
+                    for user_id, amount in zip(user_ids.tolist(), total.tolist())
+                )
+                data.seek(0)
+                cur.copy_expert(_COPY_SQL, data)
+                db.apply_payout_run_rollups(cur, run_id)
+
+                cur.execute("""
+                    UPDATE payout_runs
+                    SET status = 'completed', driver_count = %s, total_amount = %s
+                    WHERE id = %s
+                    RETURNING id, run_key, status, driver_count, total_amount
+                """, (int(payable.sum()), round(float(total.sum()), 2), run_id))
+                run = dict(cur.fetchone())
+            conn.commit()
+            run["created"] = True
+            return run
+        except Exception as e:
+            conn.rollback()
+            print(f"Error running driver payouts: {e}")
+            return None
+
+def get_payout_run(run_key):
+    """Get a payout run header by its key"""
+    with db.get_db_connection() as conn:
+        if conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        SELECT id, run_key, status, driver_count, total_amount
+                        FROM payout_runs WHERE run_key = %s
+                    """, (run_key,))
+                    row = cur.fetchone()
+                    return dict(row) if row else None
+            except Exception as e:
+                print(f"Error retrieving payout run: {e}")
+                return None
+    return None
+
+def main(argv=None):
+    """Command line entry point: python driver_payouts.py [--week YYYY-MM-DD]"""
+    parser = argparse.ArgumentParser(description="Flow Ads Cab weekly driver payouts")
+    parser.add_argument("--week", help="Any date in the week to pay (defaults to last week)")
+    args = parser.parse_args(argv)
+
+    week = datetime.strptime(args.week, "%Y-%m-%d").date() if args.week else None
+    run = run_weekly_payouts(week)
+    if run is None:
+        print("Payout run failed")
+        return 1
+    action = "Created" if run["created"] else "Already ran"
+    print(f"{action} {run['run_key']}: {run['driver_count']} drivers, Rs.{run['total_amount']}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
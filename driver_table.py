@@ -0,0 +1,329 @@
+import sys
+from collections.abc import Mapping
+from datetime import datetime
+from decimal import Decimal
+import numpy as np
+
+# Document types carried by every driver record
+DOCUMENT_TYPES = ("license", "insurance", "vehicle_registration")
+
+# Keys of a driver record, in the order generate_mock_drivers builds them
+DRIVER_KEYS = (
+    "id", "user_id", "name", "phone", "city", "vehicle_model", "vehicle_number", "status",
+    "current_location", "kms_today", "hours_active", "rating", "earnings", "documents",
+    "current_ad_displaying",
+)
+
+_MISSING = -1
+
+
+class _Interned:
+    """Column of repeated strings stored as small integer codes"""
+
+    def __init__(self, values):
+        self.labels = []
+        lookup = {}
+        codes = np.empty(len(values), dtype=np.int16)
+        for i, value in enumerate(values):
+            code = lookup.get(value)
+            if code is None:
+                code = lookup[value] = len(self.labels)
+                self.labels.append(value)
+            codes[i] = code
+        self.codes = codes
+
+    def code(self, value):
+        try:
+            return self.labels.index(value)
+        except ValueError:
+            return None
+
+    def take(self, rows):
+        column = _Interned.__new__(_Interned)
+        column.labels = self.labels
+        column.codes = self.codes[rows]
+        return column
+
+    def __getitem__(self, row):
+        return self.labels[self.codes[row]]
+
+
+class _Text:
+    """Column of free text stored as fixed-width UTF-8 bytes"""
+
+    def __init__(self, values):
+        encoded = [(value or "").encode() for value in values]
+        width = max((len(value) for value in encoded), default=1) or 1
+        self.values = np.array(encoded, dtype=f"S{width}")
+
+    def take(self, rows):
+        column = _Text.__new__(_Text)
+        column.values = self.values[rows]
+        return column
+
+    def __getitem__(self, row):
+        return self.values[row].decode()
+
+
+class _Number:
+    """Column of numbers stored as float64, with each value's type kept for display"""
+
+    # Kind codes: ints, floats, and Decimals as 2 + their number of decimal places
+    _INT = 0
+    _FLOAT = 1
+    _DECIMAL = 2
+
+    def __init__(self, values):
+        values = list(values)
+        self.values = np.fromiter((float(value) for value in values), dtype=np.float64, count=len(values))
+        self.kinds = np.fromiter((self._kind(value) for value in values), dtype=np.int8, count=len(values))
+
+    @classmethod
+    def _kind(cls, value):
+        if isinstance(value, Decimal):
+            return cls._DECIMAL + max(-value.as_tuple().exponent, 0)
+        if isinstance(value, (int, np.integer)):
+            return cls._INT
+        return cls._FLOAT
+
+    def take(self, rows):
+        column = _Number.__new__(_Number)
+        column.values = self.values[rows]
+        column.kinds = self.kinds[rows]
+        return column
+
+    def __getitem__(self, row):
+        value = float(self.values[row])
+        kind = int(self.kinds[row])
+        if kind == self._INT:
+            return int(value)
+        if kind == self._FLOAT:
+            return value
+        return Decimal(repr(value)).quantize(Decimal(1).scaleb(self._DECIMAL - kind))
+
+
+class DriverTable:
+    """
+    Columnar store of driver state.
+
+    Each field is one contiguous NumPy array: free text such as names is kept
+    as fixed-width UTF-8 bytes, repeated strings such as status, area and
+    vehicle model are interned into int16 codes, and hours and earnings keep
+    an int8 type code next to their float64 values so views return the int,
+    float or Decimal the record had. KPIs and filters run as array operations
+    instead of walking nested dicts. The table also behaves like the list of
+    driver dicts it replaces: len(), iteration and indexing yield read-only
+    DriverView mappings with the same keys and nesting.
+    """
+
+    def __init__(self, columns):
+        self._columns = columns
+        self._sorted = {}  # column -> argsort, for id lookups
+
+    @classmethod
+    def from_records(cls, drivers):
+        """Build a table from driver dicts as produced by generate_mock_drivers"""
+        drivers = list(drivers)
+        n = len(drivers)
+
+        def numbers(values, dtype):
+            return np.fromiter(values, dtype=dtype, count=n)
+
+        def optional_ids(key):
+            return numbers((_MISSING if d.get(key) is None else int(d[key]) for d in drivers), np.int64)
+
+        def expiry(document_type):
+            return np.array(
+                [d.get("documents", {}).get(document_type, {}).get("expiry") or "NaT" for d in drivers],
+                dtype="datetime64[D]"
+            )
+
+        columns = {
+            "id": numbers((int(d["id"]) for d in drivers), np.int64),
+            "user_id": optional_ids("user_id"),
+            "name": _Text([d.get("name", "") for d in drivers]),
+            "phone": _Text([d.get("phone", "") for d in drivers]),
+            "city": _Interned([d.get("city", "Indore") for d in drivers]),
+            "vehicle_model": _Interned([d.get("vehicle_model") for d in drivers]),
+            "vehicle_number": _Text([d.get("vehicle_number", "") for d in drivers]),
+            "status": _Interned([d.get("status", "Inactive") for d in drivers]),
+            "area": _Interned([d.get("current_location", {}).get("area") for d in drivers]),
+            "lat": numbers((d.get("current_location", {}).get("lat", np.nan) for d in drivers), np.float64),
+            "lon": numbers((d.get("current_location", {}).get("lon", np.nan) for d in drivers), np.float64),
+            "kms_today": numbers((d.get("kms_today", 0) or 0 for d in drivers), np.int32),
+            "hours_active": _Number(d.get("hours_active", 0) or 0 for d in drivers),
+            "rating": numbers((d.get("rating", np.nan) for d in drivers), np.float64),
+            "earnings_today": _Number(d.get("earnings", {}).get("today", 0) for d in drivers),
+            "earnings_base": _Number(d.get("earnings", {}).get("base", 0) for d in drivers),
+            "earnings_incentives": _Number(d.get("earnings", {}).get("incentives", 0) for d in drivers),
+            "current_ad_displaying": optional_ids("current_ad_displaying"),
+        }
+        for document_type in DOCUMENT_TYPES:
+            columns[f"{document_type}_status"] = _Interned(
+                [d.get("documents", {}).get(document_type, {}).get("status") for d in drivers]
+            )
+            columns[f"{document_type}_expiry"] = expiry(document_type)
+        return cls(columns)
+
+    def __len__(self):
+        return len(self._columns["id"])
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("driver row out of range")
+        return DriverView(self, row)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield DriverView(self, row)
+
+    def column(self, name):
+        """Raw column: a NumPy array, or a list of decoded strings for text columns"""
+        column = self._columns[name]
+        if isinstance(column, _Number):
+            return column.values
+        if isinstance(column, _Interned):
+            return [column.labels[code] for code in column.codes]
+        if isinstance(column, _Text):
+            return [value.decode() for value in column.values]
+        return column
+
+    def status_mask(self, *statuses):
+        """Boolean array of drivers whose status is one of statuses"""
+        column = self._columns["status"]
+        codes = [code for code in (column.code(s) for s in statuses) if code is not None]
+        return np.isin(column.codes, codes)
+
+    def filter(self, mask):
+        """New table with the rows selected by a boolean mask or index array"""
+        rows = np.flatnonzero(mask) if np.asarray(mask).dtype == bool else np.asarray(mask)
+        columns = {}
+        for name, column in self._columns.items():
+            if isinstance(column, (_Interned, _Text, _Number)):
+                columns[name] = column.take(rows)
+            else:
+                columns[name] = column[rows]
+        return DriverTable(columns)
+
+    def rows(self, indices):
+        """Driver views for an iterable of row numbers"""
+        return [DriverView(self, int(row)) for row in indices]
+
+    def count_by_status(self):
+        """Number of drivers per status"""
+        column = self._columns["status"]
+        counts = np.bincount(column.codes, minlength=len(column.labels))
+        return {label: int(count) for label, count in zip(column.labels, counts) if count}
+
+    def kpis(self):
+        """
+        Fleet KPIs computed over the columns
+
+        Returns:
+        - Dictionary with active/inactive counts, counts by status, average
+          distance today of active drivers and today's total earnings
+        """
+        active = self.status_mask("Active")
+        active_count = int(np.count_nonzero(active))
+        active_kms = int(self._columns["kms_today"][active].sum(dtype=np.int64))
+        return {
+            "active": active_count,
+            "inactive": len(self) - active_count,
+            "by_status": self.count_by_status(),
+            "avg_distance_today": active_kms / max(active_count, 1),
+            "earnings_today": float(self._columns["earnings_today"].values.sum()),
+        }
+
+    def row_of(self, column, value):
+        """Row number of the first driver whose id/user_id column equals value, or None"""
+        if value is None:
+            return None
+        values = self._columns[column]
+        order = self._sorted.get(column)
+        if order is None:
+            order = self._sorted[column] = np.argsort(values, kind="stable")
+        i = np.searchsorted(values, value, sorter=order)
+        if i < len(order) and values[order[i]] == value:
+            return int(order[i])
+        return None
+
+    def nbytes(self):
+        """Approximate memory held by the columns (bytes)"""
+        total = 0
+        for column in self._columns.values():
+            if isinstance(column, _Interned):
+                total += column.codes.nbytes + sum(sys.getsizeof(label) for label in column.labels)
+            elif isinstance(column, _Text):
+                total += column.values.nbytes
+            elif isinstance(column, _Number):
+                total += column.values.nbytes + column.kinds.nbytes
+            else:
+                total += column.nbytes
+        return total
+
+
+class DriverView(Mapping):
+    """Read-only dict-like view of one table row, shaped like a driver dict"""
+
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table, row):
+        self._table = table
+        self._row = row
+
+    def __getitem__(self, key):
+        columns = self._table._columns
+        row = self._row
+        if key == "current_location":
+            return {"area": columns["area"][row], "lat": float(columns["lat"][row]), "lon": float(columns["lon"][row])}
+        if key == "earnings":
+            return {
+                "today": columns["earnings_today"][row],
+                "base": columns["earnings_base"][row],
+                "incentives": columns["earnings_incentives"][row],
+            }
+        if key == "documents":
+            return {
+                document_type: {
+                    "status": columns[f"{document_type}_status"][row],
+                    "expiry": _date_str(columns[f"{document_type}_expiry"][row]),
+                }
+                for document_type in DOCUMENT_TYPES
+            }
+        if key in ("user_id", "current_ad_displaying"):
+            value = int(columns[key][row])
+            return None if value == _MISSING else value
+        if key not in DRIVER_KEYS:
+            raise KeyError(key)
+        value = columns[key][row]
+        return value.item() if isinstance(value, np.generic) else value
+
+    def __iter__(self):
+        return iter(DRIVER_KEYS)
+
+    def __len__(self):
+        return len(DRIVER_KEYS)
+
+    def __eq__(self, other):
+        if isinstance(other, DriverView):
+            return self._table is other._table and self._row == other._row
+        return Mapping.__eq__(self, other)
+
+    def __hash__(self):
+        return hash((id(self._table), self._row))
+
+    def __repr__(self):
+        return f"DriverView({dict(self)!r})"
+
+    @property
+    def row(self):
+        """Row number in the table"""
+        return self._row
+
+
+def _date_str(value):
+    if np.isnat(value):
+        return None
+    return value.astype(datetime).strftime("%Y-%m-%d")
@@ -0,0 +1,210 @@
+import json
+import os
+import threading
+import time
+import numpy as np
+import folium
+from folium.plugins import HeatMap
+import spatial_index
+
+# Seconds a clustered layer is reused before positions are re-read
+FLEET_MAP_TTL = float(os.environ.get('FLEET_MAP_TTL', '5'))
+# Below this zoom the map shows a heatmap instead of clusters
+FLEET_HEATMAP_MAX_ZOOM = int(os.environ.get('FLEET_HEATMAP_MAX_ZOOM', '11'))
+# Approximate on-screen size of a cluster cell (pixels)
+CLUSTER_RADIUS_PX = 60
+# Cap on features per layer (keeps the map HTML under ~500 KB); denser views
+# are clustered at a coarser zoom
+MAX_FEATURES = 2500
+
+INDORE_CENTER = (22.7196, 75.8577)
+
+def cell_size_for_zoom(zoom, radius_px=CLUSTER_RADIUS_PX):
+    """Cluster cell size in degrees for a web-mercator zoom level"""
+    return 360.0 / (256 * 2 ** zoom) * radius_px
+
+def cluster_positions(lats, lons, zoom, radius_px=CLUSTER_RADIUS_PX):
+    """
+    Grid-cluster positions for one zoom level
+
+    Parameters:
+    - lats, lons: NumPy arrays of positions
+    - zoom: Map zoom level
+
+    Returns:
+    - (lats, lons, counts, first_index) of cluster centroids; first_index points at
+      one member so single-cab clusters can be labelled
+    """
+    size = cell_size_for_zoom(zoom, radius_px)
+    rows = np.floor(lats / size).astype(np.int64)
+    cols = np.floor(lons / size).astype(np.int64)
+    keys = rows * 4_000_000 + cols
+    unique, first, inverse, counts = np.unique(keys, return_index=True, return_inverse=True, return_counts=True)
+    cluster_lats = np.bincount(inverse, weights=lats, minlength=len(unique)) / counts
+    cluster_lons = np.bincount(inverse, weights=lons, minlength=len(unique)) / counts
+    return cluster_lats, cluster_lons, counts, first
+
+
+class FleetMapLayers:
+    """
+    Server-side clustered fleet layers, cached per zoom level and viewport.
+
+    Positions come from the spatial index snapshot. At each zoom, cabs are
+    bucketed into grid cells roughly CLUSTER_RADIUS_PX wide on screen, so the
+    number of features depends on the viewport, not on the fleet size. Low
+    zoom levels get weighted heatmap points instead of markers.
+    """
+
+    def __init__(self, ttl=FLEET_MAP_TTL):
+        self.ttl = ttl
+        self._cache = {}  # (kind, zoom, bbox) -> (expires_at, payload)
+        self._lock = threading.Lock()
+
+    def _positions(self, bbox):
+        snapshot = spatial_index.get_driver_index().snapshot()
+        if not snapshot:
+            return np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+        ids = np.fromiter((p[0] for p in snapshot), dtype=np.int64, count=len(snapshot))
+        lats = np.fromiter((p[1] for p in snapshot), dtype=np.float64, count=len(snapshot))
+        lons = np.fromiter((p[2] for p in snapshot), dtype=np.float64, count=len(snapshot))
+        if bbox:
+            min_lat, min_lon, max_lat, max_lon = bbox
+            keep = (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+            ids, lats, lons = ids[keep], lats[keep], lons[keep]
+        return ids, lats, lons
+
+    def _cached(self, key, build):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and entry[0] > now:
+                return entry[1]
+        payload = build()
+        with self._lock:
+            self._cache = {k: v for k, v in self._cache.items() if v[0] > now}
+            self._cache[key] = (now + self.ttl, payload)
+        return payload
+
+    def clusters(self, zoom, bbox=None):
+        """
+        Clustered cab positions as a GeoJSON FeatureCollection (dict)
+
+        Each feature has a count property; single cabs also carry driver_id.
+        """
+        bbox = tuple(round(v, 3) for v in bbox) if bbox else None
+        return self._cached(("clusters", zoom, bbox), lambda: self._build_clusters(zoom, bbox))
+
+    def _build_clusters(self, zoom, bbox):
+        ids, lats, lons = self._positions(bbox)
+        if not len(ids):
+            return {"type": "FeatureCollection", "features": []}
+        level = zoom
+        cluster_lats, cluster_lons, counts, first = cluster_positions(lats, lons, level)
+        while len(counts) > MAX_FEATURES and level > 0:
+            level -= 1
+            cluster_lats, cluster_lons, counts, first = cluster_positions(lats, lons, level)
+
+        features = []
+        for lat, lon, count, i in zip(cluster_lats.tolist(), cluster_lons.tolist(), counts.tolist(), first.tolist()):
+            properties = {"count": count}
+            if count == 1:
+                properties["driver_id"] = int(ids[i])
+            features.append({
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [round(lon, 5), round(lat, 5)]},
+                "properties": properties,
+            })
+        return {"type": "FeatureCollection", "features": features}
+
+    def heat_points(self, zoom, bbox=None):
+        """Weighted [lat, lon, count] points for a heatmap, aggregated two zoom levels finer"""
+        bbox = tuple(round(v, 3) for v in bbox) if bbox else None
+        return self._cached(("heat", zoom, bbox), lambda: self._build_heat(zoom, bbox))
+
+    def _build_heat(self, zoom, bbox):
+        _, lats, lons = self._positions(bbox)
+        if not len(lats):
+            return []
+        cluster_lats, cluster_lons, counts, _ = cluster_positions(lats, lons, zoom + 2)
+        return [
+            [round(lat, 4), round(lon, 4), count]
+            for lat, lon, count in zip(cluster_lats.tolist(), cluster_lons.tolist(), counts.tolist())
+        ]
+
+
+layers = FleetMapLayers()
+
+def build_fleet_map(zoom=13, center=INDORE_CENTER, bbox=None):
+    """
+    Build a folium map of the whole fleet
+
+    Parameters:
+    - zoom: Zoom level the map opens at; below FLEET_HEATMAP_MAX_ZOOM a heatmap is drawn
+    - center: (lat, lon) the map opens on
+    - bbox: Optional (min_lat, min_lon, max_lat, max_lon) to limit the cabs drawn
+    """
+    m = folium.Map(location=list(center), zoom_start=zoom)
+    if zoom < FLEET_HEATMAP_MAX_ZOOM:
+        points = layers.heat_points(zoom, bbox)
+        if points:
+            HeatMap(points, radius=18, blur=12).add_to(m)
+        return m
+
+    collection = layers.clusters(zoom, bbox)
+    if not collection["features"]:
+        # GeoJsonTooltip needs at least one feature to validate its fields
+        return m
+    folium.GeoJson(
+        collection,
+        name="Cabs",
+        marker=folium.CircleMarker(radius=6, fill=True, fill_opacity=0.7, weight=1),
+        style_function=lambda feature: {
+            "radius": 6 if feature["properties"]["count"] == 1
+            else min(8 + 3 * len(str(feature["properties"]["count"])), 24),
+            "color": "#28a745" if feature["properties"]["count"] == 1 else "#0098DA",
+            "fillColor": "#28a745" if feature["properties"]["count"] == 1 else "#0098DA",
+        },
+        tooltip=folium.GeoJsonTooltip(fields=["count"], aliases=["Cabs"]),
+    ).add_to(m)
+    return m
+
+def payload_size(m):
+    """Size in bytes of a map's rendered HTML"""
+    return len(m.get_root().render().encode())
+
+def benchmark(n_drivers=50000, zooms=(10, 12, 13, 14, 16), seed=42):
+    """Payload size and build time for a synthetic fleet spread over Indore"""
+    rng = np.random.default_rng(seed)
+    index = spatial_index.GridSpatialIndex()
+    index.update_many(zip(
+        range(n_drivers),
+        (INDORE_CENTER[0] + (rng.random(n_drivers) - 0.5) * 0.27).tolist(),
+        (INDORE_CENTER[1] + (rng.random(n_drivers) - 0.5) * 0.29).tolist(),
+    ))
+    original, spatial_index.driver_index = spatial_index.driver_index, index
+    next_sync, spatial_index._next_sync = spatial_index._next_sync, float("inf")
+    try:
+        results = {}
+        for zoom in zooms:
+            bench_layers = FleetMapLayers()
+            start = time.perf_counter()
+            if zoom < FLEET_HEATMAP_MAX_ZOOM:
+                features = len(bench_layers.heat_points(zoom))
+            else:
+                features = len(bench_layers.clusters(zoom)["features"])
+            build_ms = (time.perf_counter() - start) * 1000
+            global layers
+            layers, saved = bench_layers, layers
+            try:
+                size = payload_size(build_fleet_map(zoom))
+            finally:
+                layers = saved
+            results[zoom] = {"features": features, "build_ms": round(build_ms, 1), "payload_kb": round(size / 1024, 1)}
+        return results
+    finally:
+        spatial_index.driver_index = original
+        spatial_index._next_sync = next_sync
+
+if __name__ == "__main__":
+    for zoom, result in benchmark().items():
+        print(f"zoom {zoom:>2}: {json.dumps(result)}")
@@ -0,0 +1,179 @@
+import json
+import math
+import os
+import threading
+import numpy as np
+
+# Optional GeoJSON FeatureCollection with surveyed region boundaries
+# (each feature needs properties.name and a Polygon geometry)
+GEOFENCE_FILE = os.environ.get('GEOFENCE_FILE')
+
+# Grid cell size (degrees) for the bounding-box index
+GEOFENCE_CELL_SIZE = 0.01
+
+# Approximate centre and radius (degrees) of the Indore regions used by campaigns.
+# Used to build default hexagonal fences when no GEOFENCE_FILE is configured.
+DEFAULT_REGIONS = {
+    "Vijay Nagar": (22.7533, 75.8937, 0.0090),
+    "LIG": (22.7360, 75.8880, 0.0050),
+    "New Palasia": (22.7275, 75.8800, 0.0030),
+    "Palasia": (22.7244, 75.8839, 0.0030),
+    "South Tukoganj": (22.7205, 75.8725, 0.0030),
+    "Geeta Bhawan": (22.7150, 75.8870, 0.0035),
+    "MG Road": (22.7196, 75.8600, 0.0025),
+    "Rajwada": (22.7185, 75.8545, 0.0025),
+    "AB Road": (22.7089, 75.8800, 0.0035),
+    "Navlakha": (22.7010, 75.8790, 0.0030),
+    "Sapna Sangeeta": (22.7005, 75.8700, 0.0035),
+    "Bhawarkuan": (22.6930, 75.8680, 0.0040),
+}
+
+def _hexagon(lat, lon, radius):
+    # Stretch longitude so the fence is roughly round on the ground
+    lon_radius = radius / math.cos(math.radians(lat))
+    return [
+        (lat + radius * math.sin(math.radians(a)), lon + lon_radius * math.cos(math.radians(a)))
+        for a in range(0, 360, 60)
+    ]
+
+def _polygon_area(points):
+    area = 0.0
+    for (y1, x1), (y2, x2) in zip(points, points[1:] + points[:1]):
+        area += x1 * y2 - x2 * y1
+    return abs(area) / 2
+
+
+class GeofenceIndex:
+    """
+    Point-in-polygon index over named region polygons.
+
+    Region bounding boxes are bucketed into a uniform grid, so a lookup only
+    runs the exact ray-casting test against the few regions whose box covers
+    the point's cell. Where fences overlap, the smallest region wins.
+    """
+
+    def __init__(self, regions, cell_size=GEOFENCE_CELL_SIZE):
+        """
+        Parameters:
+        - regions: Dict of region name -> list of (lat, lon) polygon vertices
+        """
+        self.cell_size = cell_size
+        # Largest first, so smaller (more specific) regions overwrite them in classify()
+        ordered = sorted(regions.items(), key=lambda item: _polygon_area(list(item[1])), reverse=True)
+        self.names = [name for name, _ in ordered]
+        self._polygons = [np.asarray(points, dtype=np.float64) for _, points in ordered]
+        self._bboxes = np.array([
+            (p[:, 0].min(), p[:, 1].min(), p[:, 0].max(), p[:, 1].max()) for p in self._polygons
+        ]) if self._polygons else np.empty((0, 4))
+
+        self._grid = {}
+        for i, (min_lat, min_lon, max_lat, max_lon) in enumerate(self._bboxes):
+            for row in range(self._cell(min_lat), self._cell(max_lat) + 1):
+                for col in range(self._cell(min_lon), self._cell(max_lon) + 1):
+                    self._grid.setdefault((row, col), []).append(i)
+
+    def _cell(self, value):
+        return math.floor(value / self.cell_size)
+
+    def _contains(self, i, lat, lon):
+        polygon = self._polygons[i]
+        inside = False
+        n = len(polygon)
+        for a in range(n):
+            y1, x1 = polygon[a]
+            y2, x2 = polygon[(a + 1) % n]
+            if (y1 > lat) != (y2 > lat) and lon < (x2 - x1) * (lat - y1) / (y2 - y1) + x1:
+                inside = not inside
+        return inside
+
+    def locate(self, lat, lon):
+        """Get the name of the region containing a point, or None"""
+        candidates = self._grid.get((self._cell(lat), self._cell(lon)), ())
+        # Candidates are in area-descending order; the last match is the smallest region
+        match = None
+        for i in candidates:
+            min_lat, min_lon, max_lat, max_lon = self._bboxes[i]
+            if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon and self._contains(i, lat, lon):
+                match = i
+        return self.names[match] if match is not None else None
+
+    def contains(self, region_name, lat, lon):
+        """Check whether a point lies inside a named region"""
+        if region_name not in self.names:
+            return False
+        return self._contains(self.names.index(region_name), lat, lon)
+
+    def classify(self, lats, lons):
+        """
+        Classify a batch of positions into regions in one vectorized pass
+
+        Parameters:
+        - lats, lons: Array-likes of equal length
+
+        Returns:
+        - NumPy int array of region indexes into self.names (-1 outside every region)
+        """
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        result = np.full(lats.shape, -1, dtype=np.int32)
+
+        for i, polygon in enumerate(self._polygons):
+            min_lat, min_lon, max_lat, max_lon = self._bboxes[i]
+            candidates = np.nonzero(
+                (lats >= min_lat) & (lats <= max_lat) & (lons >= min_lon) & (lons <= max_lon)
+            )[0]
+            if not candidates.size:
+                continue
+
+            y = lats[candidates]
+            x = lons[candidates]
+            inside = np.zeros(candidates.size, dtype=bool)
+            y1, x1 = polygon[:, 0], polygon[:, 1]
+            y2, x2 = np.roll(y1, -1), np.roll(x1, -1)
+            for a in range(len(polygon)):
+                crosses = (y1[a] > y) != (y2[a] > y)
+                if y2[a] != y1[a]:
+                    crosses &= x < (x2[a] - x1[a]) * (y - y1[a]) / (y2[a] - y1[a]) + x1[a]
+                inside ^= crosses
+            result[candidates[inside]] = i
+        return result
+
+    def classify_names(self, lats, lons):
+        """Like classify(), but returns a list of region names (None outside every region)"""
+        return [self.names[i] if i >= 0 else None for i in self.classify(lats, lons)]
+
+
+def load_regions():
+    """Load region polygons from GEOFENCE_FILE, or build the default Indore fences"""
+    if GEOFENCE_FILE:
+        with open(GEOFENCE_FILE) as f:
+            collection = json.load(f)
+        regions = {}
+        for feature in collection.get("features", []):
+            # GeoJSON rings are [lon, lat]; keep the outer ring without the closing point
+            ring = feature["geometry"]["coordinates"][0]
+            if ring and ring[0] == ring[-1]:
+                ring = ring[:-1]
+            regions[feature["properties"]["name"]] = [(lat, lon) for lon, lat in ring]
+        return regions
+    return {name: _hexagon(lat, lon, radius) for name, (lat, lon, radius) in DEFAULT_REGIONS.items()}
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_geofence_index():
+    """Get the process-wide geofence index"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = GeofenceIndex(load_regions())
+    return _index
+
+def locate(lat, lon):
+    """Name of the region containing a point, or None"""
+    return get_geofence_index().locate(lat, lon)
+
+def classify_positions(lats, lons):
+    """Region names for a batch of positions (None outside every region)"""
+    return get_geofence_index().classify_names(lats, lons)
@@ -0,0 +1,125 @@
+import argparse
+import sys
+from datetime import date, datetime, timedelta
+import db
+
+# Days advertisers have to pay a monthly invoice
+INVOICE_DUE_DAYS = 15
+
+# One invoice per advertiser and month with one line per campaign, built from
+# campaign_daily_stats. Invoice ids are deterministic (INV-YYYYMM-<advertiser>),
+# so re-running a month only fills in advertisers that were not invoiced yet.
+_MONTHLY_INVOICES_SQL = """
+    WITH spend AS (
+        SELECT c.advertiser_id, s.campaign_id, c.name, SUM(s.spent) AS amount
+        FROM campaign_daily_stats s
+        JOIN campaigns c ON c.id = s.campaign_id
+        WHERE s.day >= %(start)s AND s.day < %(end)s AND c.advertiser_id IS NOT NULL
+        GROUP BY c.advertiser_id, s.campaign_id, c.name
+        HAVING SUM(s.spent) > 0
+    ), new_invoices AS (
+        INSERT INTO invoices (invoice_id, user_id, user_type, amount, issue_date, due_date, billing_period)
+        SELECT 'INV-' || %(month)s || '-' || advertiser_id, advertiser_id, 'advertiser', SUM(amount),
+               CURRENT_DATE, CURRENT_DATE + %(due_days)s, %(start)s
+        FROM spend
+        GROUP BY advertiser_id
+        ON CONFLICT (invoice_id) DO NOTHING
+        RETURNING invoice_id, user_id, amount
+    ), new_items AS (
+        INSERT INTO invoice_items (invoice_id, campaign_id, description, amount)
+        SELECT n.invoice_id, s.campaign_id, s.name || ' - ad spend ' || %(label)s, s.amount
+        FROM new_invoices n
+        JOIN spend s ON s.advertiser_id = n.user_id
+        ORDER BY n.invoice_id, s.campaign_id
+    )
+    SELECT invoice_id, user_id, amount FROM new_invoices ORDER BY invoice_id
+"""
+
+def month_start_of(day=None):
+    """First day of the month containing a date (defaults to last month)"""
+    day = day or date.today().replace(day=1) - timedelta(days=1)
+    return day.replace(day=1)
+
+def generate_monthly_invoices(month=None, due_days=INVOICE_DUE_DAYS):
+    """
+    Invoice every advertiser for a month of campaign spend in one statement
+
+    Parameters:
+    - month: Any date in the month to bill (defaults to last month)
+    - due_days: Days until the invoices are due
+
+    Returns:
+    - List of created invoices as (invoice_id, user_id, amount) rows, or None on failure
+    """
+    start = month_start_of(month)
+    end = (start + timedelta(days=32)).replace(day=1)
+
+    with db.get_db_connection() as conn:
+        if not conn:
+            return None
+        try:
+            with conn.cursor() as cur:
+                cur.execute(_MONTHLY_INVOICES_SQL, {
+                    "start": start,
+                    "end": end,
+                    "month": start.strftime("%Y%m"),
+                    "label": start.strftime("%b %Y"),
+                    "due_days": due_days,
+                })
+                created = cur.fetchall()
+            conn.commit()
+            return created
+        except Exception as e:
+            conn.rollback()
+            print(f"Error generating invoices: {e}")
+            return None
+
+def mark_overdue_invoices(today=None):
+    """
+    Move pending invoices past their due date to overdue
+
+    Uses the (status, due_date) index, so only the invoices that change are read.
+
+    Returns:
+    - List of invoices marked overdue (invoice_id, user_id, amount, due_date)
+    """
+    with db.get_db_connection() as conn:
+        if not conn:
+            return []
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE invoices SET status = 'overdue'
+                    WHERE status = 'pending' AND due_date < %s
+                    RETURNING invoice_id, user_id, amount, due_date
+                """, (today or date.today(),))
+                overdue = cur.fetchall()
+            conn.commit()
+            return overdue
+        except Exception as e:
+            conn.rollback()
+            print(f"Error marking overdue invoices: {e}")
+            return []
+
+def main(argv=None):
+    """Command line entry point: python invoicing.py [generate|overdue] [--month YYYY-MM]"""
+    parser = argparse.ArgumentParser(description="Flow Ads Cab advertiser invoicing")
+    parser.add_argument("command", nargs="?", default="generate", choices=["generate", "overdue"])
+    parser.add_argument("--month", help="Month to bill (defaults to last month)")
+    args = parser.parse_args(argv)
+
+    if args.command == "overdue":
+        overdue = mark_overdue_invoices()
+        print(f"Marked {len(overdue)} invoices overdue")
+        return 0
+
+    month = datetime.strptime(args.month, "%Y-%m").date() if args.month else None
+    created = generate_monthly_invoices(month)
+    if created is None:
+        print("Invoice generation failed")
+        return 1
+    print(f"Created {len(created)} invoices for {month_start_of(month):%B %Y}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,486 @@
+import argparse
+import sys
+import db
+
+# Advisory lock key so only one process (or autoscale replica) migrates at a time
+MIGRATION_LOCK_ID = 7416001
+
+# Ordered schema migrations: (version, name, statements)
+# Append new entries; never edit one that has already shipped.
+MIGRATIONS = [
+    (1, "initial schema", [
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            password VARCHAR(100) NOT NULL,
+            role VARCHAR(20) NOT NULL,
+            phone VARCHAR(20),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS drivers (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id),
+            vehicle_model VARCHAR(100),
+            vehicle_number VARCHAR(50),
+            vehicle_color VARCHAR(50),
+            license_number VARCHAR(50),
+            status VARCHAR(20) DEFAULT 'Inactive',
+            current_location_area VARCHAR(100),
+            current_location_lat DECIMAL(10, 7),
+            current_location_lon DECIMAL(10, 7),
+            kms_today INTEGER DEFAULT 0,
+            hours_active DECIMAL(5, 2) DEFAULT 0,
+            current_ad_displaying INTEGER
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS campaigns (
+            id SERIAL PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            advertiser_id INTEGER REFERENCES users(id),
+            status VARCHAR(20) DEFAULT 'Draft',
+            ad_type VARCHAR(20),
+            budget INTEGER,
+            spent INTEGER DEFAULT 0,
+            views INTEGER DEFAULT 0,
+            impressions INTEGER DEFAULT 0,
+            start_date DATE,
+            end_date DATE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS campaign_regions (
+            id SERIAL PRIMARY KEY,
+            campaign_id INTEGER REFERENCES campaigns(id),
+            region_name VARCHAR(100) NOT NULL
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_campaign_regions_campaign_id
+        ON campaign_regions (campaign_id)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS payments (
+            id SERIAL PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id),
+            payment_type VARCHAR(50) NOT NULL,
+            amount DECIMAL(10, 2) NOT NULL,
+            status VARCHAR(20) DEFAULT 'pending',
+            description TEXT,
+            payment_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS locations (
+            id SERIAL PRIMARY KEY,
+            location_name VARCHAR(100) NOT NULL,
+            lat DECIMAL(10, 7) NOT NULL,
+            lon DECIMAL(10, 7) NOT NULL,
+            views INTEGER DEFAULT 0,
+            importance INTEGER DEFAULT 1
+        )
+        """,
+    ]),
+    (2, "ad events", [
+        # Append-only event log; no foreign key so ingestion never locks campaign rows.
+        # txid lets the rollup process exactly the transactions that have finished.
+        """
+        CREATE TABLE IF NOT EXISTS ad_events (
+            id BIGSERIAL PRIMARY KEY,
+            campaign_id INTEGER NOT NULL,
+            driver_id INTEGER,
+            event_type VARCHAR(20) NOT NULL,
+            views INTEGER NOT NULL DEFAULT 0,
+            impressions INTEGER NOT NULL DEFAULT 0,
+            spent INTEGER NOT NULL DEFAULT 0,
+            occurred_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            txid BIGINT NOT NULL DEFAULT txid_current()
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_ad_events_txid ON ad_events (txid)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS ad_event_rollup_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            last_xmin BIGINT NOT NULL
+        )
+        """,
+        """
+        INSERT INTO ad_event_rollup_state (id, last_xmin) VALUES (1, 0)
+        ON CONFLICT (id) DO NOTHING
+        """,
+    ]),
+    (3, "driver location history", [
+        # One partition per day, created on demand by db.ensure_location_partitions
+        """
+        CREATE TABLE IF NOT EXISTS driver_locations (
+            driver_id INTEGER NOT NULL,
+            recorded_at TIMESTAMP NOT NULL,
+            lat DECIMAL(10, 7) NOT NULL,
+            lon DECIMAL(10, 7) NOT NULL,
+            area VARCHAR(100)
+        ) PARTITION BY RANGE (recorded_at)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_driver_locations_driver_time
+        ON driver_locations (driver_id, recorded_at)
+        """,
+    ]),
+    (4, "payment system columns", [
+        """
+        ALTER TABLE payments
+            ADD COLUMN IF NOT EXISTS payment_ref VARCHAR(36),
+            ADD COLUMN IF NOT EXISTS campaign_id INTEGER,
+            ADD COLUMN IF NOT EXISTS payment_method VARCHAR(50),
+            ADD COLUMN IF NOT EXISTS transaction_id VARCHAR(50)
+        """,
+        """
+        UPDATE payments SET payment_ref = md5(random()::text || id::text)::uuid::text
+        WHERE payment_ref IS NULL
+        """,
+        """
+        ALTER TABLE payments
+            ALTER COLUMN payment_ref SET DEFAULT md5(random()::text || clock_timestamp()::text)::uuid::text,
+            ALTER COLUMN payment_ref SET NOT NULL
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_payments_payment_ref ON payments (payment_ref)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_payments_user_type_date
+        ON payments (user_id, payment_type, payment_date)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_payments_status_date ON payments (status, payment_date)
+        """,
+    ]),
+    (5, "payment keyset index", [
+        # Matches the (payment_date, id) keyset used by db.get_payments_page
+        """
+        CREATE INDEX IF NOT EXISTS idx_payments_date_id ON payments (payment_date DESC, id DESC)
+        """,
+    ]),
+    (6, "payment rollups", [
+        # Per-period totals maintained by db.create_payment. user_id 0 and
+        # payment_type 'all' hold the totals across users and types.
+        """
+        CREATE TABLE IF NOT EXISTS payment_rollups (
+            period VARCHAR(5) NOT NULL,
+            period_start DATE NOT NULL,
+            user_id INTEGER NOT NULL,
+            payment_type VARCHAR(50) NOT NULL,
+            total_amount DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            payment_count INTEGER NOT NULL DEFAULT 0,
+            pending_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (period, user_id, payment_type, period_start)
+        )
+        """,
+        """
+        INSERT INTO payment_rollups (
+            period, period_start, user_id, payment_type, total_amount, payment_count, pending_count
+        )
+        SELECT g.period, date_trunc(g.period, p.payment_date)::date, u.user_id, t.payment_type,
+               SUM(p.amount), COUNT(*), COUNT(*) FILTER (WHERE p.status = 'pending')
+        FROM payments p
+        CROSS JOIN (VALUES ('day'), ('week'), ('month')) g(period)
+        CROSS JOIN LATERAL (VALUES (p.user_id), (0)) u(user_id)
+        CROSS JOIN LATERAL (VALUES (p.payment_type), ('all')) t(payment_type)
+        WHERE u.user_id IS NOT NULL
+        GROUP BY 1, 2, 3, 4
+        ON CONFLICT DO NOTHING
+        """,
+    ]),
+    (7, "driver payout runs", [
+        # One row per payout batch; run_key makes re-running a week a no-op
+        """
+        CREATE TABLE IF NOT EXISTS payout_runs (
+            id SERIAL PRIMARY KEY,
+            run_key VARCHAR(50) UNIQUE NOT NULL,
+            period_start DATE NOT NULL,
+            period_end DATE NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'running',
+            driver_count INTEGER NOT NULL DEFAULT 0,
+            total_amount DECIMAL(14, 2) NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        ALTER TABLE payments ADD COLUMN IF NOT EXISTS payout_run_id INTEGER REFERENCES payout_runs(id)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_payments_payout_run_id ON payments (payout_run_id)
+        WHERE payout_run_id IS NOT NULL
+        """,
+    ]),
+    (8, "payment idempotency keys", [
+        """
+        ALTER TABLE payments ADD COLUMN IF NOT EXISTS idempotency_key VARCHAR(64)
+        """,
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_payments_idempotency_key ON payments (idempotency_key)
+        WHERE idempotency_key IS NOT NULL
+        """,
+    ]),
+    (9, "invoices and daily campaign spend", [
+        # Per-campaign daily totals, maintained by ad_events.rollup_events
+        """
+        CREATE TABLE IF NOT EXISTS campaign_daily_stats (
+            campaign_id INTEGER NOT NULL,
+            day DATE NOT NULL,
+            views INTEGER NOT NULL DEFAULT 0,
+            impressions INTEGER NOT NULL DEFAULT 0,
+            spent INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (campaign_id, day)
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_campaign_daily_stats_day ON campaign_daily_stats (day)
+        """,
+        # Backfill only what has already been rolled up; newer events arrive with the next rollup
+        """
+        INSERT INTO campaign_daily_stats (campaign_id, day, views, impressions, spent)
+        SELECT campaign_id, occurred_at::date, SUM(views), SUM(impressions), SUM(spent)
+        FROM ad_events
+        WHERE txid < (SELECT last_xmin FROM ad_event_rollup_state WHERE id = 1)
+        GROUP BY 1, 2
+        ON CONFLICT DO NOTHING
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS invoices (
+            invoice_id VARCHAR(40) PRIMARY KEY,
+            user_id INTEGER REFERENCES users(id),
+            user_type VARCHAR(20) NOT NULL,
+            amount DECIMAL(12, 2) NOT NULL,
+            issue_date DATE NOT NULL DEFAULT CURRENT_DATE,
+            due_date DATE NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            billing_period DATE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_invoices_status_due_date ON invoices (status, due_date)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_invoices_user_id ON invoices (user_id)
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS invoice_items (
+            id SERIAL PRIMARY KEY,
+            invoice_id VARCHAR(40) NOT NULL REFERENCES invoices(invoice_id) ON DELETE CASCADE,
+            campaign_id INTEGER,
+            description TEXT,
+            amount DECIMAL(12, 2) NOT NULL
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_invoice_items_invoice_id ON invoice_items (invoice_id)
+        """,
+    ]),
+    (10, "sms outbox", [
+        # Durable queue drained by sms_outbox workers with FOR UPDATE SKIP LOCKED
+        """
+        CREATE TABLE IF NOT EXISTS sms_outbox (
+            id BIGSERIAL PRIMARY KEY,
+            queue VARCHAR(20) NOT NULL DEFAULT 'default',
+            phone VARCHAR(20) NOT NULL,
+            message TEXT NOT NULL,
+            status VARCHAR(10) NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            claimed_at TIMESTAMP,
+            sent_at TIMESTAMP,
+            provider_id VARCHAR(64),
+            last_error TEXT,
+            created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_sms_outbox_queued ON sms_outbox (queue, next_attempt_at)
+        WHERE status = 'queued'
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_sms_outbox_sending ON sms_outbox (claimed_at)
+        WHERE status = 'sending'
+        """,
+    ]),
+    (11, "alert fan-out", [
+        """
+        ALTER TABLE sms_outbox ADD COLUMN IF NOT EXISTS dedup_key VARCHAR(200)
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_sms_outbox_dedup_key ON sms_outbox (dedup_key, created_at)
+        WHERE dedup_key IS NOT NULL
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS driver_documents (
+            id SERIAL PRIMARY KEY,
+            driver_id INTEGER NOT NULL REFERENCES drivers(id),
+            document_type VARCHAR(50) NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'Verified',
+            expiry_date DATE NOT NULL,
+            UNIQUE (driver_id, document_type)
+        )
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_driver_documents_expiry_date ON driver_documents (expiry_date)
+        """,
+        # Existing campaigns count as changed when created, so they do not look freshly activated
+        """
+        ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS status_changed_at TIMESTAMP
+        """,
+        """
+        UPDATE campaigns SET status_changed_at = COALESCE(created_at, CURRENT_TIMESTAMP)
+        WHERE status_changed_at IS NULL
+        """,
+        """
+        ALTER TABLE campaigns ALTER COLUMN status_changed_at SET DEFAULT CURRENT_TIMESTAMP
+        """,
+        """
+        CREATE INDEX IF NOT EXISTS idx_campaigns_status_changed_at ON campaigns (status, status_changed_at)
+        """,
+    ]),
+    (12, "campaign milestones", [
+        # Last viewership milestone announced per campaign (see milestones.py)
+        """
+        CREATE TABLE IF NOT EXISTS campaign_milestones (
+            campaign_id INTEGER PRIMARY KEY,
+            milestone INTEGER NOT NULL,
+            announced_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        # Milestones already passed before tracking started are not announced
+        """
+        INSERT INTO campaign_milestones (campaign_id, milestone)
+        SELECT c.id, m.milestone
+        FROM campaigns c
+        CROSS JOIN LATERAL (
+            SELECT MAX(x) AS milestone
+            FROM unnest(ARRAY[1000, 5000, 10000, 25000, 50000, 100000]) x
+            WHERE x <= c.views
+        ) m
+        WHERE m.milestone IS NOT NULL
+        ON CONFLICT (campaign_id) DO NOTHING
+        """,
+    ]),
+    (13, "driver document backfill", [
+        # Drivers registered before documents were recorded get Pending documents,
+        # with expiry dates staggered over the next year so reminders do not all go out at once
+        """
+        INSERT INTO driver_documents (driver_id, document_type, status, expiry_date)
+        SELECT d.id, t.document_type, 'Pending', CURRENT_DATE + 30 + (d.id * 7 + t.day_offset) % 335
+        FROM drivers d
+        CROSS JOIN (VALUES ('license', 0), ('insurance', 113), ('vehicle_registration', 227))
+            AS t (document_type, day_offset)
+        ON CONFLICT (driver_id, document_type) DO NOTHING
+        """,
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def ensure_migrations_table(cur):
+    """Create the table that records applied migrations"""
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(100) NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+def get_schema_version(conn):
+    """Get the highest applied migration version (0 for a fresh database)"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_migrations') AS tbl")
+        if cur.fetchone()['tbl'] is None:
+            version = 0
+        else:
+            cur.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_migrations")
+            version = cur.fetchone()['version']
+    conn.rollback()
+    return version
+
+def migrate(conn, seed_demo_data=True):
+    """
+    Apply pending migrations under an advisory lock
+
+    Parameters:
+    - conn: Open database connection
+    - seed_demo_data: Add demo data when the users table is empty
+
+    Returns:
+    - List of (version, name) tuples that were applied
+    """
+    applied = []
+    with conn.cursor() as cur:
+        # Session-level lock: held across the per-migration commits and demo seeding
+        cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        try:
+            ensure_migrations_table(cur)
+            conn.commit()
+
+            # Re-read under the lock; another replica may have just migrated
+            cur.execute("SELECT COALESCE(MAX(version), 0) AS version FROM schema_migrations")
+            current = cur.fetchone()['version']
+
+            for version, name, statements in MIGRATIONS:
+                if version <= current:
+                    continue
+                try:
+                    for statement in statements:
+                        cur.execute(statement)
+                    cur.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                        (version, name)
+                    )
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                applied.append((version, name))
+
+            if seed_demo_data:
+                cur.execute("SELECT COUNT(*) FROM users")
+                if cur.fetchone()['count'] == 0:
+                    db.add_demo_data(conn)
+        finally:
+            conn.rollback()
+            cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+    return applied
+
+def main(argv=None):
+    """Command line entry point: python migrations.py [migrate|status]"""
+    parser = argparse.ArgumentParser(description="Flow Ads Cab database migrations")
+    parser.add_argument("command", nargs="?", default="migrate", choices=["migrate", "status"])
+    parser.add_argument("--no-demo-data", action="store_true", help="Do not seed demo data into an empty database")
+    args = parser.parse_args(argv)
+
+    with db.get_db_connection() as conn:
+        if not conn:
+            print("Could not connect to the database (is DATABASE_URL set?)")
+            return 1
+
+        current = get_schema_version(conn)
+        if args.command == "status":
+            print(f"Schema version {current} (latest {LATEST_VERSION})")
+            for version, name, _ in MIGRATIONS:
+                state = "applied" if version <= current else "pending"
+                print(f"  {version:>4}  {state:<8} {name}")
+            return 0
+
+        applied = migrate(conn, seed_demo_data=not args.no_demo_data)
+        for version, name in applied:
+            print(f"Applied migration {version}: {name}")
+        print(f"Schema is at version {get_schema_version(conn)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
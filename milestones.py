@@ -0,0 +1,85 @@
+import threading
+from psycopg2.extras import execute_values
+import db
+from sms_alerts import highest_milestone
+
+# Records a milestone only if it is above the one already announced, so
+# concurrent rollups (or processes) announce each crossing exactly once.
+_ANNOUNCE_SQL = """
+    INSERT INTO campaign_milestones (campaign_id, milestone)
+    VALUES %s
+    ON CONFLICT (campaign_id) DO UPDATE SET
+        milestone = EXCLUDED.milestone,
+        announced_at = CURRENT_TIMESTAMP
+    WHERE campaign_milestones.milestone < EXCLUDED.milestone
+    RETURNING campaign_id, milestone
+"""
+
+
+class MilestoneTracker:
+    """
+    Detects viewership milestone crossings from campaign metric writes.
+
+    It is fed the rows that ad_events.rollup_events updated, so campaigns
+    whose counters did not move cost nothing. Each row's milestone comes
+    from sms_alerts.highest_milestone; only rows above the last milestone known
+    to this process reach the database, where campaign_milestones decides
+    which crossings are new.
+    """
+
+    def __init__(self):
+        self._announced = {}  # campaign_id -> last milestone known to be announced
+        self._lock = threading.Lock()
+
+    def check(self, campaigns):
+        """
+        Record milestones crossed by updated campaigns and alert their advertisers
+
+        Parameters:
+        - campaigns: Rows with id and views (as returned by rollup_events)
+
+        Returns:
+        - List of (campaign_id, milestone) pairs crossed by this write
+        """
+        candidates = []
+        with self._lock:
+            for campaign in campaigns:
+                milestone = highest_milestone(campaign["views"] or 0)
+                if milestone is not None and milestone > self._announced.get(campaign["id"], 0):
+                    candidates.append((campaign["id"], milestone))
+        if not candidates:
+            return []
+
+        with db.get_db_connection() as conn:
+            if not conn:
+                return []
+            try:
+                with conn.cursor() as cur:
+                    rows = execute_values(cur, _ANNOUNCE_SQL, sorted(candidates), fetch=True)
+                    crossed = [(row["campaign_id"], row["milestone"]) for row in rows]
+                    if crossed:
+                        # Queued in the same transaction, so a milestone is never marked announced
+                        # without its alerts
+                        import alert_fanout
+                        alert_fanout.fan_out(
+                            "campaign_milestone", cur=cur,
+                            campaign_ids=[campaign_id for campaign_id, _ in crossed]
+                        )
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"Error recording campaign milestones: {e}")
+                return []
+
+        # Either announced now or already announced earlier (by another process)
+        with self._lock:
+            for campaign_id, milestone in candidates:
+                self._announced[campaign_id] = max(milestone, self._announced.get(campaign_id, 0))
+        return crossed
+
+
+tracker = MilestoneTracker()
+
+def check_milestones(campaigns):
+    """Announce milestones crossed by updated campaign rows; returns (campaign_id, milestone) pairs"""
+    return tracker.check(campaigns)
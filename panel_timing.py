@@ -0,0 +1,79 @@
+import functools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import streamlit as st
+
+# Render times kept per panel for the timing summary
+PANEL_TIMING_SAMPLES = int(os.environ.get('PANEL_TIMING_SAMPLES', '200'))
+
+
+class PanelTimings:
+    """
+    Process-wide render times of dashboard panels.
+
+    Full script reruns are recorded under "script"; each panel records its
+    own render, whether it ran as part of a full rerun or on its own as a
+    fragment rerun.
+    """
+
+    def __init__(self, samples=PANEL_TIMING_SAMPLES):
+        self.samples = samples
+        self._times = {}  # panel -> deque of seconds
+        self._lock = threading.Lock()
+
+    def record(self, panel, seconds):
+        with self._lock:
+            if panel not in self._times:
+                self._times[panel] = deque(maxlen=self.samples)
+            self._times[panel].append(seconds)
+
+    def summary(self):
+        """One row per panel: runs, last, p50 and p95 render time (ms)"""
+        with self._lock:
+            snapshot = {panel: sorted(times) for panel, times in self._times.items()}
+            last = {panel: times[-1] for panel, times in self._times.items()}
+        rows = []
+        for panel, times in sorted(snapshot.items()):
+            rows.append({
+                "panel": panel,
+                "runs": len(times),
+                "last_ms": round(last[panel] * 1000, 1),
+                "p50_ms": round(times[len(times) // 2] * 1000, 1),
+                "p95_ms": round(times[min(len(times) - 1, int(len(times) * 0.95))] * 1000, 1),
+            })
+        return rows
+
+
+timings = PanelTimings()
+
+@contextmanager
+def timed(panel):
+    """Record the time spent in a block under a panel name"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.record(panel, time.perf_counter() - start)
+
+def panel(name, run_every=None):
+    """
+    Decorator turning a render function into a timed Streamlit fragment
+
+    Widgets inside the fragment rerun only that function instead of the
+    whole script; every run is recorded under the given panel name.
+    With run_every (seconds) the fragment also reruns itself on that interval.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return func(*args, **kwargs)
+        return st.fragment(wrapper, run_every=run_every)
+    return decorator
+
+def get_panel_timings():
+    """Render time summary of all panels"""
+    return timings.summary()
@@ -5,6 +5,32 @@ import random
 import plotly.express as px
 import plotly.graph_objects as go
 import uuid
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import db
+
+# Recent idempotency keys remembered per process, so repeated submissions
+# return the original payment without a database round trip
+IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('PAYMENT_IDEMPOTENCY_CACHE_SIZE', '10000'))
+
+_recent_payments = OrderedDict()  # idempotency_key -> payment record
+_recent_lock = threading.Lock()
+
+def _remember_payment(key, record):
+    with _recent_lock:
+        _recent_payments[key] = record
+        _recent_payments.move_to_end(key)
+        while len(_recent_payments) > IDEMPOTENCY_CACHE_SIZE:
+            _recent_payments.popitem(last=False)
+
+def _recent_payment(key):
+    with _recent_lock:
+        record = _recent_payments.get(key)
+        if record is not None:
+            _recent_payments.move_to_end(key)
+        return record
 
 class PaymentSystem:
     """
@@ -13,35 +39,50 @@ class PaymentSystem:
     
     def __init__(self):
         """Initialize the payment system"""
-        # Initialize payment records in session state if not already present
-        if "payment_records" not in st.session_state:
-            st.session_state.payment_records = []
-        
-        # Initialize invoice records in session state
-        if "invoices" not in st.session_state:
-            st.session_state.invoices = []
-            
         # Initialize payment methods in session state
         if "payment_methods" not in st.session_state:
             st.session_state.payment_methods = []
     
-    def add_payment(self, payment_data):
+    def _to_record(self, row):
+        """Convert a payments row into a payment record"""
+        record = dict(row)
+        record["payment_id"] = record.pop("payment_ref")
+        record["timestamp"] = record.pop("payment_date")
+        record["amount"] = float(record["amount"])
+        return record
+    
+    def add_payment(self, payment_data, idempotency_key=None):
         """
         Add a new payment record
         
         Parameters:
         - payment_data: Dictionary containing payment information
+        - idempotency_key: Client-supplied key; repeating it returns the original payment
+
+        Returns:
+        - The stored payment record, or None if it could not be saved
         """
-        # Add payment ID and timestamp
-        payment_data["payment_id"] = str(uuid.uuid4())
-        payment_data["timestamp"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if idempotency_key:
+            record = _recent_payment(idempotency_key)
+            if record is not None:
+                return dict(record)
+            payment_data["idempotency_key"] = idempotency_key
         
-        st.session_state.payment_records.append(payment_data)
-        return payment_data
+        # Add payment ID and timestamp
+        payment_data["payment_ref"] = str(uuid.uuid4())
+        payment_data["payment_date"] = datetime.now()
+        
+        row = db.create_payment(payment_data)
+        if row is None:
+            return None
+        record = self._to_record(row)
+        if idempotency_key:
+            _remember_payment(idempotency_key, dict(record))
+        return record
     
-    def get_payments(self, user_id=None, payment_type=None, date_from=None, date_to=None, status=None):
+    def get_payments(self, user_id=None, payment_type=None, date_from=None, date_to=None, status=None, limit=None):
         """
-        Get payment records with optional filters
+        Get payment records with optional filters, newest first
         
         Parameters:
         - user_id: Filter by user ID
@@ -49,33 +90,54 @@ class PaymentSystem:
         - date_from: Filter by start date (YYYY-MM-DD)
         - date_to: Filter by end date (YYYY-MM-DD)
         - status: Filter by payment status (pending, completed, failed)
+        - limit: Maximum number of records to return
         """
-        if "payment_records" not in st.session_state:
-            st.session_state.payment_records = []  # Initialize if missing
-            
-        payments = st.session_state.payment_records
-        
-        # Apply filters
-        if user_id:
-            payments = [p for p in payments if p.get("user_id") == user_id]
-        
-        if payment_type:
-            payments = [p for p in payments if p.get("payment_type") == payment_type]
-        
-        if date_from:
-            date_from_obj = datetime.strptime(date_from, "%Y-%m-%d")
-            payments = [p for p in payments if datetime.strptime(p.get("timestamp").split()[0], "%Y-%m-%d") >= date_from_obj]
-        
-        if date_to:
-            date_to_obj = datetime.strptime(date_to, "%Y-%m-%d")
-            payments = [p for p in payments if datetime.strptime(p.get("timestamp").split()[0], "%Y-%m-%d") <= date_to_obj]
+        rows = db.get_payments(
+            user_id=user_id,
+            payment_type=payment_type,
+            status=status,
+            date_from=date_from,
+            date_to=date_to,
+            limit=limit
+        )
+        return [self._to_record(row) for row in rows]
+    
+    def get_payments_page(self, user_id=None, payment_type=None, date_from=None, date_to=None, status=None,
+                          page_size=50, page_token=None):
+        """
+        Get one page of payment records, newest first
         
-        if status:
-            payments = [p for p in payments if p.get("status") == status]
+        Parameters:
+        - Filters as in get_payments
+        - page_size: Number of records per page
+        - page_token: Token returned with the previous page (None for the first page)
         
-        return payments
+        Returns:
+        - (records, next_page_token); next_page_token is None on the last page
+        """
+        rows, next_token = db.get_payments_page(
+            user_id=user_id,
+            payment_type=payment_type,
+            status=status,
+            date_from=date_from,
+            date_to=date_to,
+            page_size=page_size,
+            page_token=page_token
+        )
+        return [self._to_record(row) for row in rows], next_token
     
-    def create_driver_payment(self, driver_id, amount, description="Driver payment"):
+    def iter_payments(self, user_id=None, payment_type=None, date_from=None, date_to=None, status=None):
+        """Stream every matching payment record, newest first, for exports"""
+        for row in db.iter_payments(
+            user_id=user_id,
+            payment_type=payment_type,
+            status=status,
+            date_from=date_from,
+            date_to=date_to
+        ):
+            yield self._to_record(row)
+    
+    def create_driver_payment(self, driver_id, amount, description="Driver payment", idempotency_key=None):
         """
         Create a payment for a driver
         
@@ -83,6 +145,7 @@ class PaymentSystem:
         - driver_id: ID of the driver
         - amount: Payment amount
         - description: Payment description
+        - idempotency_key: Optional key that makes retries return the original payment
         """
         payment_data = {
             "user_id": driver_id,
@@ -92,9 +155,10 @@ class PaymentSystem:
             "status": "pending"
         }
         
-        return self.add_payment(payment_data)
+        return self.add_payment(payment_data, idempotency_key)
     
-    def process_advertiser_payment(self, advertiser_id, campaign_id, amount, payment_method="credit_card"):
+    def process_advertiser_payment(self, advertiser_id, campaign_id, amount, payment_method="credit_card",
+                                   idempotency_key=None):
         """
         Process a payment from an advertiser
         
@@ -103,6 +167,7 @@ class PaymentSystem:
         - campaign_id: ID of the campaign
         - amount: Payment amount
         - payment_method: Payment method (credit_card, bank_transfer, upi)
+        - idempotency_key: Optional key that makes retries return the original payment
         """
         payment_data = {
             "user_id": advertiser_id,
@@ -114,7 +179,7 @@ class PaymentSystem:
             "transaction_id": f"TXN-{str(uuid.uuid4())[:8].upper()}"
         }
         
-        return self.add_payment(payment_data)
+        return self.add_payment(payment_data, idempotency_key)
     
     def create_invoice(self, user_id, user_type, amount, items, due_date=None):
         """
@@ -135,14 +200,16 @@ class PaymentSystem:
             "user_id": user_id,
             "user_type": user_type,
             "amount": amount,
-            "items": items,
-            "issue_date": datetime.now().strftime("%Y-%m-%d"),
             "due_date": due_date,
             "status": "pending"
         }
         
-        st.session_state.invoices.append(invoice_data)
-        return invoice_data
+        invoice = db.create_invoice(invoice_data, items)
+        if invoice is None:
+            return None
+        invoice = dict(invoice)
+        invoice["items"] = items
+        return invoice
     
     def get_invoices(self, user_id=None, status=None):
         """
@@ -152,20 +219,7 @@ class PaymentSystem:
         - user_id: Filter by user ID
         - status: Filter by invoice status (pending, paid, overdue)
         """
-        # Initialize invoices in session state if not already present
-        if "invoices" not in st.session_state:
-            st.session_state.invoices = []
-            
-        invoices = st.session_state.invoices
-        
-        # Apply filters
-        if user_id:
-            invoices = [inv for inv in invoices if inv.get("user_id") == user_id]
-        
-        if status:
-            invoices = [inv for inv in invoices if inv.get("status") == status]
-        
-        return invoices
+        return db.get_invoices(user_id=user_id, status=status)
     
     def add_payment_method(self, user_id, method_data):
         """
@@ -209,6 +263,11 @@ class PaymentSystem:
         """
         st.subheader("Payment Details")
         
+        # Resubmitting the same payment (double click, rerun) maps to the same
+        # idempotency key until the user starts a new payment
+        if "payment_form_nonce" not in st.session_state:
+            st.session_state.payment_form_nonce = str(uuid.uuid4())
+        
         with st.form("payment_form"):
             # Payment amount
             if amount is None:
@@ -293,12 +352,25 @@ class PaymentSystem:
                     "status": "completed"  # Assume success for demo
                 }
                 
-                payment = self.add_payment(payment_data)
+                idempotency_key = hashlib.sha256("|".join(str(value) for value in (
+                    st.session_state.payment_form_nonce, user_id, payment_data["payment_type"],
+                    amount, description, payment_data["payment_method"]
+                )).encode()).hexdigest()
+                
+                payment = self.add_payment(payment_data, idempotency_key)
+                if payment is None:
+                    return None
+                st.session_state.payment_form_paid = True
                 
                 # Show success message
                 st.success(f"Payment of ₹{amount:.2f} processed successfully. Transaction ID: {payment['payment_id'][:8]}")
                 return payment
         
+        if st.session_state.get("payment_form_paid") and st.button("Make another payment"):
+            st.session_state.payment_form_nonce = str(uuid.uuid4())
+            st.session_state.payment_form_paid = False
+            st.rerun()
+        
         return None
     
     def display_payment_summary(self, user_id=None, payment_type=None):
@@ -309,41 +381,43 @@ class PaymentSystem:
         - user_id: ID of the user (optional)
         - payment_type: Type of payment (optional)
         """
-        payments = self.get_payments(user_id=user_id, payment_type=payment_type)
+        # Monthly rollups cover the whole history in a handful of rows
+        monthly = db.get_payment_rollups("month", user_id=user_id, payment_type=payment_type)
         
-        if not payments:
+        if not monthly:
             st.info("No payment records found.")
             return
         
         # Create summary statistics
-        total_amount = sum(p.get("amount", 0) for p in payments)
-        completed_payments = [p for p in payments if p.get("status") == "completed"]
-        pending_payments = [p for p in payments if p.get("status") == "pending"]
+        total_count = sum(row["payment_count"] for row in monthly)
+        total_amount = float(sum(row["total_amount"] for row in monthly))
+        pending_count = sum(row["pending_count"] for row in monthly)
         
         # Display summary metrics
         col1, col2, col3 = st.columns(3)
         
         with col1:
-            st.metric("Total Transactions", len(payments))
+            st.metric("Total Transactions", total_count)
         
         with col2:
             st.metric("Total Amount", f"₹{total_amount:.2f}")
         
         with col3:
-            st.metric("Pending Payments", len(pending_payments))
+            st.metric("Pending Payments", pending_count)
         
         # Recent transactions
         st.subheader("Recent Transactions")
         
         # Create a DataFrame for display
+        recent, _ = self.get_payments_page(user_id=user_id, payment_type=payment_type, page_size=10)
         payment_data = []
-        for payment in sorted(payments, key=lambda p: p.get("timestamp", ""), reverse=True)[:10]:
+        for payment in recent:
             payment_data.append({
-                "Date": payment.get("timestamp", "").split()[0],
-                "Description": payment.get("description", "Payment"),
+                "Date": payment["timestamp"].strftime("%Y-%m-%d"),
+                "Description": payment.get("description") or "Payment",
                 "Amount": f"₹{payment.get('amount', 0):.2f}",
                 "Status": payment.get("status", "unknown").title(),
-                "Method": payment.get("payment_method", "unknown").replace("_", " ").title()
+                "Method": (payment.get("payment_method") or "unknown").replace("_", " ").title()
             })
         
         # Display as table
@@ -353,20 +427,19 @@ class PaymentSystem:
         # Payment trend over time
         st.subheader("Payment Trend")
         
-        # Group payments by date
-        payment_by_date = {}
-        for payment in payments:
-            date = payment.get("timestamp", "").split()[0]
-            amount = payment.get("amount", 0)
-            
-            if date in payment_by_date:
-                payment_by_date[date] += amount
-            else:
-                payment_by_date[date] = amount
+        granularity = st.radio(
+            "Group by",
+            ["Daily", "Weekly", "Monthly"],
+            horizontal=True,
+            key=f"payment_trend_period_{user_id}_{payment_type}"
+        )
+        period = {"Daily": "day", "Weekly": "week", "Monthly": "month"}[granularity]
+        rollups = monthly if period == "month" else db.get_payment_rollups(
+            period, user_id=user_id, payment_type=payment_type
+        )
         
-        # Sort dates
-        dates = sorted(payment_by_date.keys())
-        amounts = [payment_by_date[date] for date in dates]
+        dates = [row["period_start"] for row in rollups]
+        amounts = [float(row["total_amount"]) for row in rollups]
         
         # Create line chart
         if dates and amounts:
@@ -385,12 +458,7 @@ class PaymentSystem:
         Parameters:
         - invoice_id: ID of the invoice to display
         """
-        # Find the invoice
-        invoice = None
-        for inv in st.session_state.invoices:
-            if inv.get("invoice_id") == invoice_id:
-                invoice = inv
-                break
+        invoice = db.get_invoice(invoice_id)
         
         if not invoice:
             st.error("Invoice not found.")
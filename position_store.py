@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+from bisect import bisect_right
+
+# Position updates kept for delta queries; older clients get a full snapshot
+POSITION_LOG_SIZE = int(os.environ.get('POSITION_LOG_SIZE', '200000'))
+# Seconds between refreshes of the live fleet views
+LIVE_FLEET_REFRESH = float(os.environ.get('LIVE_FLEET_REFRESH', '5'))
+# Moved cabs marked on the live fleet map per refresh
+LIVE_FLEET_MAX_MARKERS = 500
+# Seconds between full resyncs of the process-wide store from the drivers table
+POSITION_STORE_RESYNC_INTERVAL = float(os.environ.get('POSITION_STORE_RESYNC_INTERVAL', '300'))
+# Seconds to wait before retrying a failed load
+POSITION_STORE_RETRY_INTERVAL = 5
+
+
+class PositionStore:
+    """
+    Versioned in-memory driver positions for live fleet views.
+
+    Every batch of location writes gets the next version number and appends
+    one (version, driver_id) entry per moved driver to a log kept in version
+    order. A client that last saw version v asks for changes_since(v): a
+    binary search finds the first newer entry and only the drivers after it
+    are returned, so a refresh costs O(log n + changed drivers) however large
+    the fleet is. When the log outgrows POSITION_LOG_SIZE its oldest half is
+    dropped, and clients older than that get a full snapshot instead.
+    """
+
+    def __init__(self, log_size=POSITION_LOG_SIZE):
+        self.log_size = log_size
+        self._positions = {}  # driver_id -> (version, lat, lon, area)
+        self._log_versions = []
+        self._log_drivers = []
+        self._version = 0
+        self._floor = 0  # clients below this version need a full snapshot
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._positions)
+
+    @property
+    def version(self):
+        """Version of the latest recorded batch"""
+        return self._version
+
+    def load(self, positions):
+        """
+        Replace all positions without logging them
+
+        Parameters:
+        - positions: Iterable of (driver_id, lat, lon, area)
+        """
+        with self._lock:
+            self._version += 1
+            version = self._version
+            self._positions = {
+                driver_id: (version, float(lat), float(lon), area)
+                for driver_id, lat, lon, area in positions
+            }
+            self._log_versions = []
+            self._log_drivers = []
+            self._floor = version
+
+    def record(self, positions):
+        """
+        Record one batch of moved drivers under a new version
+
+        Parameters:
+        - positions: Iterable of (driver_id, lat, lon, area)
+
+        Returns:
+        - The batch's version number
+        """
+        with self._lock:
+            self._version += 1
+            version = self._version
+            for driver_id, lat, lon, area in positions:
+                if area is None and driver_id in self._positions:
+                    # Like the drivers table, keep the last known area
+                    area = self._positions[driver_id][3]
+                self._positions[driver_id] = (version, float(lat), float(lon), area)
+                self._log_versions.append(version)
+                self._log_drivers.append(driver_id)
+
+            if len(self._log_versions) > self.log_size:
+                cut = len(self._log_versions) // 2
+                # Entries up to this version are gone; keep whole batches together
+                cut = bisect_right(self._log_versions, self._log_versions[cut - 1])
+                self._floor = self._log_versions[cut - 1]
+                del self._log_versions[:cut]
+                del self._log_drivers[:cut]
+            return version
+
+    def get(self, driver_id):
+        """A driver's (version, lat, lon, area), or None"""
+        return self._positions.get(driver_id)
+
+    def changes_since(self, version):
+        """
+        Drivers whose position changed after a version
+
+        Parameters:
+        - version: Version the client last saw (0 for a first request)
+
+        Returns:
+        - Dictionary with version (pass it to the next call), full (True when
+          the client was too far behind and positions is the whole fleet) and
+          positions as a list of (driver_id, lat, lon, area)
+        """
+        with self._lock:
+            current = self._version
+            if version < self._floor:
+                positions = [
+                    (driver_id, lat, lon, area)
+                    for driver_id, (_, lat, lon, area) in self._positions.items()
+                ]
+                return {"version": current, "full": True, "positions": positions}
+
+            start = bisect_right(self._log_versions, version)
+            changed = dict.fromkeys(self._log_drivers[start:])
+            positions = []
+            for driver_id in changed:
+                _, lat, lon, area = self._positions[driver_id]
+                positions.append((driver_id, lat, lon, area))
+        return {"version": current, "full": False, "positions": positions}
+
+
+store = PositionStore()
+_next_sync = 0.0  # time.monotonic() of the next load from the drivers table
+_load_lock = threading.Lock()
+
+def get_position_store():
+    """
+    Get the process-wide position store
+
+    Positions are loaded from the drivers table on first use and resynced
+    every POSITION_STORE_RESYNC_INTERVAL seconds, which picks up writes made
+    by other processes (clients then get one full snapshot). A failed load
+    is retried after POSITION_STORE_RETRY_INTERVAL seconds.
+    """
+    global _next_sync
+    if time.monotonic() >= _next_sync:
+        with _load_lock:
+            if time.monotonic() >= _next_sync:
+                import db
+                positions = db.get_driver_positions()
+                if positions is None:
+                    _next_sync = time.monotonic() + POSITION_STORE_RETRY_INTERVAL
+                else:
+                    store.load((p["id"], p["lat"], p["lon"], p["area"]) for p in positions)
+                    _next_sync = time.monotonic() + POSITION_STORE_RESYNC_INTERVAL
+    return store
+
+def record_positions(positions):
+    """Feed location writes into the store; positions is (driver_id, lat, lon, area)"""
+    store.record(positions)
+
+def changes_since(version):
+    """Delta of driver positions after a version (see PositionStore.changes_since)"""
+    return get_position_store().changes_since(version)
@@ -1,15 +1,22 @@
-import os
+from bisect import bisect_right
 import streamlit as st
-from twilio.rest import Client
+import sms_outbox
 
-# Twilio configuration
-TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID")
-TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN")
-TWILIO_PHONE_NUMBER = os.environ.get("TWILIO_PHONE_NUMBER")
+# Campaign view counts that trigger a milestone alert, ascending
+MILESTONES = [1000, 5000, 10000, 25000, 50000, 100000]
+
+def highest_milestone(views_count):
+    """Highest milestone reached by a view count, or None"""
+    i = bisect_right(MILESTONES, views_count)
+    return MILESTONES[i - 1] if i else None
 
 def send_sms_alert(phone_number, message):
     """
-    Send an SMS alert to a user using Twilio API
+    Queue an SMS alert for delivery
+    
+    The message is written to the SMS outbox and sent by the background
+    workers in sms_outbox (via Twilio when configured, simulated otherwise),
+    so the caller does not wait for the provider.
     
     Parameters:
     - phone_number: Recipient's phone number (in E.164 format, e.g., +919876543210)
@@ -27,42 +34,20 @@ def send_sms_alert(phone_number, message):
         "message": message
     })
     
-    # Check if we have Twilio credentials
-    if TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_PHONE_NUMBER:
-        try:
-            # Initialize Twilio client
-            client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
-            
-            # Send the SMS message
-            message = client.messages.create(
-                body=message,
-                from_=TWILIO_PHONE_NUMBER,
-                to=phone_number
-            )
-            
-            print(f"SMS sent with SID: {message.sid}")
-            
-            return {
-                "status": "success",
-                "message": "SMS alert sent successfully via Twilio",
-                "recipient": phone_number,
-                "sid": message.sid
-            }
-        except Exception as e:
-            print(f"Error sending SMS via Twilio: {str(e)}")
-            return {
-                "status": "error",
-                "message": f"Failed to send SMS: {str(e)}",
-                "recipient": phone_number
-            }
-    else:
-        # Fallback to simulation mode if no Twilio credentials
-        print(f"SMS ALERT to {phone_number}: {message} (SIMULATED - Twilio credentials not configured)")
+    outbox_id = sms_outbox.enqueue_sms(phone_number, message)
+    if outbox_id is None:
         return {
-            "status": "success",
-            "message": "SMS alert sent successfully (simulated - Twilio not configured)",
+            "status": "error",
+            "message": "Failed to queue SMS alert",
             "recipient": phone_number
         }
+    
+    return {
+        "status": "success",
+        "message": "SMS alert queued for delivery",
+        "recipient": phone_number,
+        "outbox_id": outbox_id
+    }
 
 def get_viewership_alert_message(campaign_name, views_count, target=None):
     """
@@ -79,12 +64,7 @@ def get_viewership_alert_message(campaign_name, views_count, target=None):
     if target and views_count >= target:
         return f"Congratulations! Your '{campaign_name}' campaign has reached its target of {target:,} views. Current views: {views_count:,}."
     else:
-        milestones = [1000, 5000, 10000, 25000, 50000, 100000]
-        # Find the highest milestone reached
-        reached_milestone = None
-        for milestone in milestones:
-            if views_count >= milestone:
-                reached_milestone = milestone
+        reached_milestone = highest_milestone(views_count)
         
         if reached_milestone:
             return f"Milestone alert! Your '{campaign_name}' campaign has reached {reached_milestone:,} views. Keep up the good work!"
@@ -0,0 +1,507 @@
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from psycopg2.extras import execute_values
+import db
+
+# Twilio configuration
+TWILIO_ACCOUNT_SID = os.environ.get("TWILIO_ACCOUNT_SID")
+TWILIO_AUTH_TOKEN = os.environ.get("TWILIO_AUTH_TOKEN")
+TWILIO_PHONE_NUMBER = os.environ.get("TWILIO_PHONE_NUMBER")
+
+# "twilio" or "stub"; defaults to Twilio when credentials are configured
+SMS_PROVIDER = os.environ.get("SMS_PROVIDER")
+
+# Worker pool and batching
+SMS_WORKERS = int(os.environ.get('SMS_WORKERS', '4'))
+SMS_BATCH_SIZE = int(os.environ.get('SMS_BATCH_SIZE', '20'))
+SMS_POLL_INTERVAL = float(os.environ.get('SMS_POLL_INTERVAL', '1.0'))
+# Retries back off exponentially from SMS_RETRY_BASE up to SMS_RETRY_MAX seconds
+SMS_MAX_ATTEMPTS = int(os.environ.get('SMS_MAX_ATTEMPTS', '5'))
+SMS_RETRY_BASE = float(os.environ.get('SMS_RETRY_BASE', '5'))
+SMS_RETRY_MAX = float(os.environ.get('SMS_RETRY_MAX', '300'))
+# Messages claimed by a worker that died are requeued after this many seconds
+SMS_LEASE_SECONDS = float(os.environ.get('SMS_LEASE_SECONDS', '120'))
+# Per-recipient token bucket: sustained messages per minute and burst size
+SMS_PER_NUMBER_RATE = float(os.environ.get('SMS_PER_NUMBER_RATE', '6'))
+SMS_PER_NUMBER_BURST = float(os.environ.get('SMS_PER_NUMBER_BURST', '3'))
+
+# Advisory lock key held while a deduplicated batch is checked and inserted
+DEDUP_LOCK_ID = 7416003
+
+_CLAIM_SQL = """
+    UPDATE sms_outbox SET status = 'sending', attempts = attempts + 1, claimed_at = CURRENT_TIMESTAMP
+    WHERE id IN (
+        SELECT id FROM sms_outbox
+        WHERE status = 'queued' AND queue = %s AND next_attempt_at <= CURRENT_TIMESTAMP
+        ORDER BY next_attempt_at
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, phone, message, attempts
+"""
+
+# Claims whose worker died go back in the queue, unless that was the last attempt:
+# a message that keeps killing its worker must not be retried forever
+_RECLAIM_SQL = """
+    UPDATE sms_outbox SET
+        status = CASE WHEN attempts >= %(max_attempts)s THEN 'failed' ELSE 'queued' END,
+        last_error = CASE WHEN attempts >= %(max_attempts)s
+                          THEN 'Claim expired on the last attempt' ELSE last_error END,
+        claimed_at = NULL
+    WHERE status = 'sending' AND queue = %(queue)s
+      AND claimed_at < CURRENT_TIMESTAMP - %(lease)s * INTERVAL '1 second'
+    RETURNING status
+"""
+
+_RESULT_SQL = """
+    UPDATE sms_outbox o SET
+        status = v.status,
+        attempts = o.attempts - v.refund,
+        next_attempt_at = CURRENT_TIMESTAMP + v.delay * INTERVAL '1 second',
+        sent_at = CASE WHEN v.status = 'sent' THEN CURRENT_TIMESTAMP END,
+        provider_id = v.provider_id,
+        last_error = v.error,
+        claimed_at = NULL
+    FROM (VALUES %s) AS v(id, status, delay, provider_id, error, refund)
+    WHERE o.id = v.id AND o.status = 'sending'
+    RETURNING o.status, EXTRACT(EPOCH FROM (o.sent_at - o.created_at)) * 1000 AS queue_ms
+"""
+
+
+class TwilioProvider:
+    """Sends through Twilio with one client shared by all workers"""
+
+    name = "twilio"
+
+    def __init__(self, account_sid=TWILIO_ACCOUNT_SID, auth_token=TWILIO_AUTH_TOKEN,
+                 from_number=TWILIO_PHONE_NUMBER):
+        from twilio.rest import Client
+        self._client = Client(account_sid, auth_token)
+        self.from_number = from_number
+
+    def send(self, phone, message):
+        """Send one message and return the provider's message id"""
+        return self._client.messages.create(body=message, from_=self.from_number, to=phone).sid
+
+
+class StubProvider:
+    """Offline provider that simulates send latency and failures"""
+
+    name = "stub"
+
+    def __init__(self, latency=0.05, failure_rate=0.0, log=True, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.log = log
+        self._rng = random.Random(seed)
+
+    def send(self, phone, message):
+        """Pretend to send one message and return a fake message id"""
+        time.sleep(self.latency)
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            raise RuntimeError("stub provider failure")
+        if self.log:
+            print(f"SMS ALERT to {phone}: {message} (SIMULATED - Twilio credentials not configured)")
+        return f"STUB-{uuid.uuid4().hex[:16]}"
+
+
+def default_provider():
+    """Twilio when configured (or SMS_PROVIDER=twilio), otherwise the stub"""
+    configured = TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN and TWILIO_PHONE_NUMBER
+    if SMS_PROVIDER == "twilio" or (SMS_PROVIDER is None and configured):
+        return TwilioProvider()
+    return StubProvider(latency=0)
+
+
+class NumberRateLimiter:
+    """In-process token bucket per recipient number"""
+
+    def __init__(self, per_minute=SMS_PER_NUMBER_RATE, burst=SMS_PER_NUMBER_BURST):
+        self.rate = per_minute / 60
+        self.burst = burst
+        self._buckets = {}  # phone -> (tokens, updated_at)
+        self._lock = threading.Lock()
+
+    def acquire(self, phone):
+        """
+        Take a token for a number
+
+        Returns:
+        - 0 if the message may be sent now, otherwise seconds until it may
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(phone, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+            if tokens >= 1:
+                self._buckets[phone] = (tokens - 1, now)
+                return 0
+            self._buckets[phone] = (tokens, now)
+            if len(self._buckets) > 100000:
+                self._prune(now)
+            return (1 - tokens) / self.rate
+
+    def _prune(self, now):
+        # Buckets that have refilled completely carry no state worth keeping
+        full_after = self.burst / self.rate
+        self._buckets = {
+            phone: state for phone, state in self._buckets.items() if now - state[1] < full_after
+        }
+
+
+def _percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class SmsOutbox:
+    """
+    Durable SMS queue in the sms_outbox table, drained by a worker pool.
+
+    enqueue() is a single INSERT, so callers never wait on the SMS provider.
+    Workers claim batches with FOR UPDATE SKIP LOCKED (so several processes
+    can drain the same queue), send through one shared provider client and
+    write all results back in one statement. Failed sends are retried with
+    exponential backoff; messages over a number's rate limit are deferred
+    without using up an attempt.
+    """
+
+    def __init__(self, provider=None, queue="default", workers=SMS_WORKERS, batch_size=SMS_BATCH_SIZE,
+                 poll_interval=SMS_POLL_INTERVAL, max_attempts=SMS_MAX_ATTEMPTS, limiter=None):
+        self._provider = provider
+        self.queue = queue
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.limiter = limiter or NumberRateLimiter()
+
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        self._thread_lock = threading.Lock()
+        self._provider_lock = threading.Lock()
+        self._last_reclaim = 0.0
+        self._stats_lock = threading.Lock()
+        self._send_ms = deque(maxlen=1000)
+        self._queue_ms = deque(maxlen=1000)
+        self._stats = {"enqueued": 0, "sent": 0, "failed": 0, "retried": 0, "deferred": 0}
+
+    @property
+    def provider(self):
+        if self._provider is None:
+            with self._provider_lock:
+                if self._provider is None:
+                    self._provider = default_provider()
+        return self._provider
+
+    def enqueue(self, phone, message):
+        """
+        Queue one SMS for delivery
+
+        Returns:
+        - The outbox id, or None if the message could not be queued
+        """
+        ids = self.enqueue_many([(phone, message)])
+        return ids[0] if ids else None
+
+    def enqueue_many(self, messages, dedup_window=None, cur=None):
+        """
+        Queue many SMS in one INSERT
+
+        Parameters:
+        - messages: Iterable of (phone, message) or (phone, message, dedup_key) tuples
+        - dedup_window: Seconds; drop messages whose dedup_key was queued within this window
+        - cur: Optional cursor; the messages join the caller's transaction, errors are
+          raised and the caller commits
+
+        Returns:
+        - List of outbox ids of the messages queued (empty on failure)
+        """
+        rows = []
+        seen = set()
+        for phone, message, *rest in messages:
+            dedup_key = rest[0] if rest else None
+            if dedup_key is not None:
+                if dedup_key in seen:
+                    continue
+                seen.add(dedup_key)
+            rows.append((self.queue, phone, message, dedup_key))
+        if not rows:
+            return []
+
+        if cur is not None:
+            inserted = self._insert(cur, rows, dedup_window)
+        else:
+            with db.get_db_connection() as conn:
+                if not conn:
+                    return []
+                try:
+                    with conn.cursor() as cur:
+                        inserted = self._insert(cur, rows, dedup_window)
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    print(f"Error queueing SMS: {e}")
+                    return []
+
+        with self._stats_lock:
+            self._stats["enqueued"] += len(inserted)
+        if inserted:
+            self._ensure_started()
+            self._wakeup.set()
+        return [row['id'] for row in inserted]
+
+    def _insert(self, cur, rows, dedup_window):
+        query = "INSERT INTO sms_outbox (queue, phone, message, dedup_key) VALUES %s RETURNING id"
+        if dedup_window:
+            query = f"""
+                INSERT INTO sms_outbox (queue, phone, message, dedup_key)
+                SELECT v.queue, v.phone, v.message, v.dedup_key
+                FROM (VALUES %s) AS v(queue, phone, message, dedup_key)
+                WHERE v.dedup_key IS NULL OR NOT EXISTS (
+                    SELECT 1 FROM sms_outbox o
+                    WHERE o.dedup_key = v.dedup_key
+                      AND o.created_at >= CURRENT_TIMESTAMP - INTERVAL '{int(dedup_window)} seconds'
+                )
+                RETURNING id
+            """
+            # Serialize deduplicated batches so two fan-outs cannot both pass the check
+            cur.execute("SELECT pg_advisory_xact_lock(%s)", (DEDUP_LOCK_ID,))
+        return execute_values(
+            cur, query, rows, template="(%s, %s, %s, %s::varchar)", page_size=len(rows), fetch=True
+        )
+
+    def _backoff(self, attempts):
+        delay = min(SMS_RETRY_MAX, SMS_RETRY_BASE * 2 ** (attempts - 1))
+        return delay * random.uniform(0.8, 1.2)
+
+    def process_batch(self):
+        """
+        Claim and send one batch of due messages
+
+        Returns:
+        - Number of messages claimed
+        """
+        with db.get_db_connection() as conn:
+            if not conn:
+                return 0
+            try:
+                with conn.cursor() as cur:
+                    now = time.monotonic()
+                    if now - self._last_reclaim > SMS_LEASE_SECONDS / 2:
+                        self._last_reclaim = now
+                        cur.execute(_RECLAIM_SQL, {
+                            "queue": self.queue, "lease": SMS_LEASE_SECONDS, "max_attempts": self.max_attempts,
+                        })
+                        abandoned = sum(1 for row in cur.fetchall() if row['status'] == 'failed')
+                    else:
+                        abandoned = 0
+                    cur.execute(_CLAIM_SQL, (self.queue, self.batch_size))
+                    claimed = cur.fetchall()
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"Error claiming SMS: {e}")
+                return 0
+        if abandoned:
+            with self._stats_lock:
+                self._stats["failed"] += abandoned
+        if not claimed:
+            return 0
+
+        # (id, status, delay, provider_id, error, refund)
+        results = []
+        send_ms = []
+        for row in claimed:
+            wait = self.limiter.acquire(row['phone'])
+            if wait:
+                results.append((row['id'], 'queued', wait, None, None, 1))
+                continue
+            started = time.perf_counter()
+            try:
+                provider_id = self.provider.send(row['phone'], row['message'])
+                results.append((row['id'], 'sent', 0, provider_id, None, 0))
+            except Exception as e:
+                if row['attempts'] >= self.max_attempts:
+                    results.append((row['id'], 'failed', 0, None, str(e)[:500], 0))
+                else:
+                    results.append((row['id'], 'queued', self._backoff(row['attempts']), None, str(e)[:500], 0))
+            send_ms.append((time.perf_counter() - started) * 1000)
+
+        with db.get_db_connection() as conn:
+            if not conn:
+                return len(claimed)
+            try:
+                with conn.cursor() as cur:
+                    updated = execute_values(
+                        cur, _RESULT_SQL, results,
+                        template="(%s::bigint, %s, %s::float8, %s, %s, %s::int)", fetch=True
+                    )
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                # Rows stay in 'sending' and are requeued once their lease expires
+                print(f"Error recording SMS results: {e}")
+                return len(claimed)
+
+        with self._stats_lock:
+            self._send_ms.extend(send_ms)
+            for row in updated:
+                if row['status'] == 'sent':
+                    self._stats["sent"] += 1
+                    self._queue_ms.append(float(row['queue_ms']))
+                elif row['status'] == 'failed':
+                    self._stats["failed"] += 1
+            self._stats["deferred"] += sum(1 for r in results if r[5])
+            self._stats["retried"] += sum(1 for r in results if r[1] == 'queued' and not r[5])
+        return len(claimed)
+
+    def queue_depth(self):
+        """Messages waiting to be sent (including ones backing off), or None if unavailable"""
+        with db.get_db_connection() as conn:
+            if conn:
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute(
+                            "SELECT COUNT(*) AS depth FROM sms_outbox WHERE status = 'queued' AND queue = %s",
+                            (self.queue,)
+                        )
+                        return cur.fetchone()['depth']
+                except Exception as e:
+                    print(f"Error reading SMS queue depth: {e}")
+        return None
+
+    def stats(self):
+        """Counters plus send latency (provider call) and queue latency (enqueue to sent) percentiles"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+            send_ms = list(self._send_ms)
+            queue_ms = list(self._queue_ms)
+        stats["queue_depth"] = self.queue_depth()
+        stats["send_ms_p50"] = _percentile(send_ms, 50)
+        stats["send_ms_p95"] = _percentile(send_ms, 95)
+        stats["queue_ms_p50"] = _percentile(queue_ms, 50)
+        stats["queue_ms_p95"] = _percentile(queue_ms, 95)
+        return stats
+
+    def start(self):
+        """
+        Start the worker threads if they are not running
+
+        Workers also pick up retries that fall due and messages left behind
+        by other (or crashed) processes, so they should run from startup
+        rather than only after this process enqueues something.
+        """
+        self._ensure_started()
+
+    def _ensure_started(self):
+        if len([t for t in self._threads if t.is_alive()]) < self.workers:
+            with self._thread_lock:
+                self._threads = [t for t in self._threads if t.is_alive()]
+                self._stop.clear()
+                while len(self._threads) < self.workers:
+                    thread = threading.Thread(
+                        target=self._run, name=f"sms-outbox-{self.queue}-{len(self._threads)}", daemon=True
+                    )
+                    thread.start()
+                    self._threads.append(thread)
+
+    def stop(self):
+        """Stop the worker threads after their current batch"""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                claimed = self.process_batch()
+            except Exception as e:
+                print(f"SMS outbox worker error: {e}")
+                claimed = 0
+            if not claimed:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+
+outbox = SmsOutbox()
+
+def start_workers():
+    """Start the process-wide outbox workers (idempotent)"""
+    outbox.start()
+
+def enqueue_sms(phone_number, message):
+    """Queue an SMS on the process-wide outbox; returns the outbox id or None"""
+    return outbox.enqueue(phone_number, message)
+
+def enqueue_sms_batch(messages, dedup_window=None, cur=None):
+    """Queue many (phone, message[, dedup_key]) tuples in one INSERT; returns the outbox ids"""
+    return outbox.enqueue_many(messages, dedup_window, cur=cur)
+
+def get_outbox_stats():
+    """Queue depth, counters and latency percentiles for the process-wide outbox"""
+    return outbox.stats()
+
+
+def load_test(n_messages=2000, workers=8, latency=0.05, failure_rate=0.0, numbers=500):
+    """
+    Push synthetic messages through a separate 'loadtest' queue with the stub provider
+
+    Returns:
+    - Outbox stats plus elapsed seconds and messages per second
+    """
+    test_outbox = SmsOutbox(
+        provider=StubProvider(latency=latency, failure_rate=failure_rate, log=False, seed=42),
+        queue="loadtest",
+        workers=workers,
+        limiter=NumberRateLimiter(per_minute=6000, burst=n_messages),
+    )
+    messages = [
+        (f"+9199{i % numbers:08d}", f"Load test message {i}") for i in range(n_messages)
+    ]
+
+    started = time.perf_counter()
+    test_outbox.enqueue_many(messages)
+    while True:
+        time.sleep(0.1)
+        stats = test_outbox.stats()
+        if stats["sent"] + stats["failed"] >= n_messages:
+            break
+    elapsed = time.perf_counter() - started
+    test_outbox.stop()
+
+    stats["elapsed_s"] = elapsed
+    stats["messages_per_s"] = n_messages / elapsed
+    return stats
+
+def main(argv=None):
+    """Command line entry point: python sms_outbox.py [stats|loadtest]"""
+    parser = argparse.ArgumentParser(description="Flow Ads Cab SMS outbox")
+    parser.add_argument("command", nargs="?", default="stats", choices=["stats", "loadtest"])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub provider latency in seconds")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    if args.command == "loadtest":
+        stats = load_test(args.messages, args.workers, args.latency, args.failure_rate)
+    else:
+        stats = {"queue_depth": outbox.queue_depth()}
+    for name, value in stats.items():
+        print(f"{name:>15}: {value:.3f}" if isinstance(value, float) else f"{name:>15}: {value}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,320 @@
+import heapq
+import math
+import os
+import threading
+import time
+
+# Grid cell size in degrees (~0.005 deg is roughly 550 m around Indore)
+SPATIAL_CELL_SIZE = float(os.environ.get('SPATIAL_CELL_SIZE', '0.005'))
+
+# Seconds between full resyncs of the process-wide index from the drivers table
+SPATIAL_INDEX_RESYNC_INTERVAL = float(os.environ.get('SPATIAL_INDEX_RESYNC_INTERVAL', '300'))
+# Seconds to wait before retrying a failed load
+SPATIAL_INDEX_RETRY_INTERVAL = 5
+
+KM_PER_DEG_LAT = 110.574
+KM_PER_DEG_LON_EQUATOR = 111.320
+
+
+class GridSpatialIndex:
+    """
+    Uniform-grid index over current driver positions.
+
+    Each driver lives in exactly one grid cell, so radius, nearest-neighbour
+    and bounding-box queries only look at the handful of cells around the
+    query point instead of scanning the whole fleet. Distances use an
+    equirectangular projection, which is accurate to well under 1% at city scale.
+    """
+
+    def __init__(self, cell_size=SPATIAL_CELL_SIZE):
+        self.cell_size = cell_size
+        self._cells = {}  # (row, col) -> {driver_id: (lat, lon)}
+        self._positions = {}  # driver_id -> (lat, lon, cell)
+        self._lock = threading.RLock()
+
+    def _cell(self, lat, lon):
+        return (math.floor(lat / self.cell_size), math.floor(lon / self.cell_size))
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, driver_id):
+        return driver_id in self._positions
+
+    def update(self, driver_id, lat, lon):
+        """Insert or move a driver"""
+        lat, lon = float(lat), float(lon)
+        cell = self._cell(lat, lon)
+        with self._lock:
+            previous = self._positions.get(driver_id)
+            if previous and previous[2] != cell:
+                old_cell = self._cells[previous[2]]
+                del old_cell[driver_id]
+                if not old_cell:
+                    del self._cells[previous[2]]
+            self._cells.setdefault(cell, {})[driver_id] = (lat, lon)
+            self._positions[driver_id] = (lat, lon, cell)
+
+    def update_many(self, positions):
+        """Insert or move many drivers; positions is an iterable of (driver_id, lat, lon)"""
+        with self._lock:
+            for driver_id, lat, lon in positions:
+                self.update(driver_id, lat, lon)
+
+    def load(self, positions):
+        """Replace all drivers; positions is an iterable of (driver_id, lat, lon)"""
+        index = GridSpatialIndex(self.cell_size)
+        index.update_many(positions)
+        with self._lock:
+            self._cells = index._cells
+            self._positions = index._positions
+
+    def remove(self, driver_id):
+        """Remove a driver from the index"""
+        with self._lock:
+            previous = self._positions.pop(driver_id, None)
+            if previous:
+                cell = self._cells[previous[2]]
+                del cell[driver_id]
+                if not cell:
+                    del self._cells[previous[2]]
+
+    def clear(self):
+        """Remove all drivers"""
+        with self._lock:
+            self._cells.clear()
+            self._positions.clear()
+
+    def get(self, driver_id):
+        """Get a driver's indexed (lat, lon), or None"""
+        position = self._positions.get(driver_id)
+        return position[:2] if position else None
+
+    def snapshot(self):
+        """Current positions as a list of (driver_id, lat, lon)"""
+        with self._lock:
+            return [(driver_id, lat, lon) for driver_id, (lat, lon, _) in self._positions.items()]
+
+    def _scale(self, lat):
+        return KM_PER_DEG_LON_EQUATOR * math.cos(math.radians(lat))
+
+    def within_radius(self, lat, lon, radius_km):
+        """
+        Find drivers within a radius of a point
+
+        Returns:
+        - List of (driver_id, distance_km) sorted by distance
+        """
+        lon_scale = self._scale(lat)
+        dlat = radius_km / KM_PER_DEG_LAT
+        dlon = radius_km / lon_scale if lon_scale else 180.0
+        row_min, col_min = self._cell(lat - dlat, lon - dlon)
+        row_max, col_max = self._cell(lat + dlat, lon + dlon)
+        limit = radius_km * radius_km
+
+        results = []
+        with self._lock:
+            for row in range(row_min, row_max + 1):
+                for col in range(col_min, col_max + 1):
+                    cell = self._cells.get((row, col))
+                    if not cell:
+                        continue
+                    for driver_id, (dlat_, dlon_) in cell.items():
+                        y = (dlat_ - lat) * KM_PER_DEG_LAT
+                        x = (dlon_ - lon) * lon_scale
+                        d2 = x * x + y * y
+                        if d2 <= limit:
+                            results.append((math.sqrt(d2), driver_id))
+        results.sort()
+        return [(driver_id, distance) for distance, driver_id in results]
+
+    def nearest(self, lat, lon, k=5, max_radius_km=None):
+        """
+        Find the k drivers closest to a point
+
+        Searches rings of cells outward from the query cell and stops once no
+        unvisited cell can hold a closer driver than the current k-th best.
+
+        Returns:
+        - List of (driver_id, distance_km) sorted by distance
+        """
+        if k <= 0:
+            return []
+        lon_scale = self._scale(lat)
+        # Smallest distance covered by one ring of cells in any direction
+        ring_km = self.cell_size * min(KM_PER_DEG_LAT, lon_scale)
+        center_row, center_col = self._cell(lat, lon)
+
+        best = []  # max-heap of (-distance, driver_id)
+        ring = 0
+        with self._lock:
+            max_ring = None
+            if max_radius_km is not None:
+                max_ring = int(max_radius_km / ring_km) + 1
+            while True:
+                if ring == 0:
+                    cells = [(center_row, center_col)]
+                else:
+                    cells = [(center_row - ring, c) for c in range(center_col - ring, center_col + ring + 1)]
+                    cells += [(center_row + ring, c) for c in range(center_col - ring, center_col + ring + 1)]
+                    cells += [(r, center_col - ring) for r in range(center_row - ring + 1, center_row + ring)]
+                    cells += [(r, center_col + ring) for r in range(center_row - ring + 1, center_row + ring)]
+
+                for key in cells:
+                    cell = self._cells.get(key)
+                    if not cell:
+                        continue
+                    for driver_id, (dlat_, dlon_) in cell.items():
+                        y = (dlat_ - lat) * KM_PER_DEG_LAT
+                        x = (dlon_ - lon) * lon_scale
+                        distance = math.sqrt(x * x + y * y)
+                        if max_radius_km is not None and distance > max_radius_km:
+                            continue
+                        if len(best) < k:
+                            heapq.heappush(best, (-distance, driver_id))
+                        elif distance < -best[0][0]:
+                            heapq.heapreplace(best, (-distance, driver_id))
+
+                # Everything outside this ring is at least ring * ring_km away
+                if len(best) == k and -best[0][0] <= ring * ring_km:
+                    break
+                if max_ring is not None and ring >= max_ring:
+                    break
+                if len(best) == len(self._positions):
+                    break
+                ring += 1
+
+        return [(driver_id, -neg) for neg, driver_id in sorted(best, reverse=True)]
+
+    def in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Find the ids of drivers inside a bounding box"""
+        row_min, col_min = self._cell(min_lat, min_lon)
+        row_max, col_max = self._cell(max_lat, max_lon)
+        results = []
+        with self._lock:
+            # Walk whichever is smaller: the cells in the box or the occupied cells
+            if (row_max - row_min + 1) * (col_max - col_min + 1) <= len(self._cells):
+                keys = ((r, c) for r in range(row_min, row_max + 1) for c in range(col_min, col_max + 1))
+            else:
+                keys = [key for key in self._cells if row_min <= key[0] <= row_max and col_min <= key[1] <= col_max]
+            for key in keys:
+                cell = self._cells.get(key)
+                if not cell:
+                    continue
+                for driver_id, (lat, lon) in cell.items():
+                    if min_lat <= lat <= max_lat and min_lon <= lon <= max_lon:
+                        results.append(driver_id)
+        return results
+
+
+driver_index = GridSpatialIndex()
+_next_sync = 0.0  # time.monotonic() of the next load from the drivers table
+_load_lock = threading.Lock()
+
+def get_driver_index():
+    """
+    Get the process-wide driver index
+
+    Positions are loaded from the drivers table on first use and resynced
+    every SPATIAL_INDEX_RESYNC_INTERVAL seconds, which picks up writes made
+    by other processes and drops deleted drivers. A failed load is retried
+    after SPATIAL_INDEX_RETRY_INTERVAL seconds.
+    """
+    global _next_sync
+    if time.monotonic() >= _next_sync:
+        with _load_lock:
+            if time.monotonic() >= _next_sync:
+                import db
+                positions = db.get_driver_positions()
+                if positions is None:
+                    _next_sync = time.monotonic() + SPATIAL_INDEX_RETRY_INTERVAL
+                else:
+                    driver_index.load((p["id"], p["lat"], p["lon"]) for p in positions)
+                    _next_sync = time.monotonic() + SPATIAL_INDEX_RESYNC_INTERVAL
+    return driver_index
+
+def update_positions(positions):
+    """Keep the driver index in sync with location writes; positions is (driver_id, lat, lon)"""
+    driver_index.update_many(positions)
+
+def drivers_near(lat, lon, radius_km=1.0):
+    """Drivers within radius_km of a point as (driver_id, distance_km), closest first"""
+    return get_driver_index().within_radius(lat, lon, radius_km)
+
+def nearest_drivers(lat, lon, k=5):
+    """The k closest drivers to a point as (driver_id, distance_km)"""
+    return get_driver_index().nearest(lat, lon, k)
+
+def drivers_in_bbox(min_lat, min_lon, max_lat, max_lon):
+    """Ids of drivers inside a bounding box"""
+    return get_driver_index().in_bbox(min_lat, min_lon, max_lat, max_lon)
+
+
+def _linear_within_radius(positions, lat, lon, radius_km):
+    lon_scale = KM_PER_DEG_LON_EQUATOR * math.cos(math.radians(lat))
+    results = []
+    for driver_id, dlat, dlon in positions:
+        y = (dlat - lat) * KM_PER_DEG_LAT
+        x = (dlon - lon) * lon_scale
+        distance = math.sqrt(x * x + y * y)
+        if distance <= radius_km:
+            results.append((distance, driver_id))
+    results.sort()
+    return [(driver_id, distance) for distance, driver_id in results]
+
+def _linear_nearest(positions, lat, lon, k):
+    lon_scale = KM_PER_DEG_LON_EQUATOR * math.cos(math.radians(lat))
+    best = heapq.nsmallest(k, (
+        (math.hypot((dlat - lat) * KM_PER_DEG_LAT, (dlon - lon) * lon_scale), driver_id)
+        for driver_id, dlat, dlon in positions
+    ))
+    return [(driver_id, distance) for distance, driver_id in best]
+
+def benchmark(n_drivers=50000, n_queries=500, radius_km=0.5, k=10, seed=42):
+    """Compare grid queries against a linear scan over a synthetic fleet around Indore"""
+    import random
+    import time
+
+    rng = random.Random(seed)
+    # Spread cabs over roughly 30 x 30 km of the city
+    positions = [
+        (i, 22.7196 + (rng.random() - 0.5) * 0.27, 75.8577 + (rng.random() - 0.5) * 0.29)
+        for i in range(n_drivers)
+    ]
+    queries = [
+        (22.7196 + (rng.random() - 0.5) * 0.27, 75.8577 + (rng.random() - 0.5) * 0.29)
+        for _ in range(n_queries)
+    ]
+
+    index = GridSpatialIndex()
+    start = time.perf_counter()
+    index.update_many(positions)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    def per_query_ms(fn):
+        start = time.perf_counter()
+        for lat, lon in queries:
+            fn(lat, lon)
+        return (time.perf_counter() - start) * 1000 / len(queries)
+
+    results = {
+        "drivers": n_drivers,
+        "build_ms": build_ms,
+        "linear_radius_ms": per_query_ms(lambda lat, lon: _linear_within_radius(positions, lat, lon, radius_km)),
+        "grid_radius_ms": per_query_ms(lambda lat, lon: index.within_radius(lat, lon, radius_km)),
+        "linear_knn_ms": per_query_ms(lambda lat, lon: _linear_nearest(positions, lat, lon, k)),
+        "grid_knn_ms": per_query_ms(lambda lat, lon: index.nearest(lat, lon, k)),
+        "grid_bbox_ms": per_query_ms(lambda lat, lon: index.in_bbox(lat - 0.005, lon - 0.005, lat + 0.005, lon + 0.005)),
+    }
+
+    # The grid must agree with the scan
+    for lat, lon in queries[:20]:
+        expected = [d for d, _ in _linear_within_radius(positions, lat, lon, radius_km)]
+        assert [d for d, _ in index.within_radius(lat, lon, radius_km)] == expected
+        expected_knn = [d for d, _ in _linear_nearest(positions, lat, lon, k)]
+        assert [d for d, _ in index.nearest(lat, lon, k)] == expected_knn
+    return results
+
+if __name__ == "__main__":
+    for name, value in benchmark().items():
+        print(f"{name:>18}: {value:.3f}" if isinstance(value, float) else f"{name:>18}: {value}")
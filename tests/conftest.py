@@ -0,0 +1,32 @@
+import os
+import pytest
+
+# Database-backed tests run against the scratch database in DATABASE_URL
+# (migrated on first use, without demo data) and are skipped without one.
+DATABASE_URL = os.environ.get("DATABASE_URL")
+
+
+@pytest.fixture(scope="session")
+def database_url():
+    if not DATABASE_URL:
+        pytest.skip("DATABASE_URL is not set")
+    return DATABASE_URL
+
+
+@pytest.fixture(scope="session")
+def migrated_db(database_url):
+    """The db module with the schema migrated to the latest version"""
+    import db
+    import migrations
+    with db.get_db_connection() as conn:
+        assert conn is not None, "database unreachable"
+        migrations.migrate(conn, seed_demo_data=False)
+    return db
+
+
+@pytest.fixture
+def conn(migrated_db):
+    """A pooled connection; rolled back and returned after the test"""
+    with migrated_db.get_db_connection() as conn:
+        yield conn
+        conn.rollback()
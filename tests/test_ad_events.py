@@ -0,0 +1,35 @@
+import uuid
+import ad_events
+import data_cache
+from data_cache import SharedDataCache
+
+
+def test_rollup_coalesces_campaign_reloads(migrated_db, conn, monkeypatch):
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO users (name, email, password, role) VALUES ('Rollup Ads', %s, 'x', 'advertiser') RETURNING id",
+            (f"rollup-{uuid.uuid4().hex}@example.com",)
+        )
+        cur.execute(
+            "INSERT INTO campaigns (name, advertiser_id, status, budget) VALUES ('Rolled', %s, 'Draft', 100) "
+            "RETURNING id", (cur.fetchone()["id"],)
+        )
+        campaign_id = cur.fetchone()["id"]
+    conn.commit()
+
+    cache = SharedDataCache(ttl=60)
+    monkeypatch.setattr(data_cache, "shared_cache", cache)
+    loads = []
+    cache.get(data_cache.CAMPAIGNS, lambda: loads.append(None))
+
+    for _ in range(3):
+        ad_events.record_view(campaign_id)
+        assert ad_events.event_writer.flush()
+        assert campaign_id in [row["id"] for row in ad_events.rollup_events()]
+        cache.get(data_cache.CAMPAIGNS, lambda: loads.append(None))
+    # Still served from the cache until the reload interval has passed
+    assert len(loads) == 1
+
+    with conn.cursor() as cur:
+        cur.execute("SELECT views FROM campaigns WHERE id = %s", (campaign_id,))
+        assert cur.fetchone()["views"] == 3
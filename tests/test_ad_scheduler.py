@@ -0,0 +1,109 @@
+import uuid
+from datetime import date
+from ad_scheduler import AdScheduler
+
+
+def campaign(campaign_id, regions=(), budget=1000, spent=0, status="Active"):
+    return {
+        "id": campaign_id, "status": status, "budget": budget, "spent": spent,
+        "start_date": None, "end_date": None, "regions": list(regions),
+    }
+
+
+def scheduler(campaigns):
+    scheduler = AdScheduler(seed=1)
+    scheduler.build(campaigns, today=date(2026, 1, 1))
+    return scheduler
+
+
+def test_only_eligible_campaigns_are_drawn():
+    ads = scheduler([
+        campaign(1, ["Vijay Nagar"]),
+        campaign(2, ["Palasia"]),
+        campaign(3),
+        campaign(4, status="Paused"),
+        campaign(5, budget=100, spent=100),
+    ])
+    picks = ads.decide_batch(list(range(200)), ["Vijay Nagar"] * 200, refresh=False)
+    assert set(picks) == {1, 3}
+    # Regions without targeted campaigns draw from the untargeted ones
+    assert ads.decide_batch([9], ["Rajwada"], refresh=False) == [3]
+
+
+def test_current_ad_is_kept_while_eligible():
+    ads = scheduler([campaign(1, ["Vijay Nagar"]), campaign(2, ["Vijay Nagar"])])
+    assert ads.decide_batch([7, 8], ["Vijay Nagar"] * 2, [2, 1], refresh=False) == [2, 1]
+    # Not eligible in the new region: a fresh campaign is drawn from that region
+    ads = scheduler([campaign(1, ["Vijay Nagar"]), campaign(2, ["Vijay Nagar"]), campaign(3, ["Palasia"])])
+    assert ads.decide_batch([7], ["Palasia"], [2], refresh=False) == [3]
+    # Nothing eligible there at all: the cab shows no ad
+    assert ads.decide_batch([7], ["Rajwada"], [2], refresh=False) == [None]
+
+
+def test_failed_campaign_load_keeps_the_last_lists(monkeypatch):
+    import db
+    ads = scheduler([campaign(1, ["Palasia"])])
+    loads = []
+
+    def failing_campaigns():
+        loads.append(None)
+        return []
+
+    monkeypatch.setattr(db, "get_campaigns", failing_campaigns)
+    ads.refresh(force=True)
+    assert ads.candidates("Palasia") == [1]
+    # Retried only after SCHEDULER_RETRY_INTERVAL
+    ads.refresh()
+    assert len(loads) == 1
+
+
+def test_location_write_keeps_the_stored_ad(migrated_db, conn):
+    import ad_scheduler
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO users (name, email, password, role) VALUES ('Sched', %s, 'x', 'driver') RETURNING id",
+            (f"sched-{uuid.uuid4().hex}@example.com",)
+        )
+        user_id = cur.fetchone()["id"]
+        cur.execute(
+            "INSERT INTO campaigns (name, advertiser_id, status, budget) VALUES ('A', %s, 'Active', 1000), "
+            "('B', %s, 'Active', 1000) RETURNING id", (user_id, user_id)
+        )
+        first, second = [row["id"] for row in cur.fetchall()]
+        cur.execute(
+            "INSERT INTO campaign_regions (campaign_id, region_name) VALUES (%s, %s), (%s, %s)",
+            (first, "Test Zone", second, "Test Zone")
+        )
+    conn.commit()
+    driver_id = migrated_db.create_driver({"status": "Active"}, user_id)
+    try:
+        ad_scheduler.ad_scheduler.refresh(force=True)
+        for campaign_id in (first, second):
+            # Another process assigned this ad; the next ping must keep it
+            with conn.cursor() as cur:
+                cur.execute("UPDATE drivers SET current_ad_displaying = %s WHERE id = %s", (campaign_id, driver_id))
+            conn.commit()
+            assert migrated_db.update_driver_locations_bulk(
+                [{"driver_id": driver_id, "lat": 1.5, "lon": 2.5, "area": "Test Zone"}]
+            )
+            with conn.cursor() as cur:
+                cur.execute("SELECT current_ad_displaying FROM drivers WHERE id = %s", (driver_id,))
+                assert cur.fetchone()["current_ad_displaying"] == campaign_id
+
+        # Cabs that are not Active are not assigned an ad
+        with conn.cursor() as cur:
+            cur.execute("UPDATE drivers SET status = 'Inactive', current_ad_displaying = NULL WHERE id = %s",
+                        (driver_id,))
+        conn.commit()
+        assert migrated_db.update_driver_locations_bulk(
+            [{"driver_id": driver_id, "lat": 1.5, "lon": 2.5, "area": "Test Zone"}]
+        )
+        with conn.cursor() as cur:
+            cur.execute("SELECT current_ad_displaying FROM drivers WHERE id = %s", (driver_id,))
+            assert cur.fetchone()["current_ad_displaying"] is None
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE drivers SET current_ad_displaying = NULL WHERE id = %s", (driver_id,))
+            cur.execute("UPDATE campaigns SET status = 'Completed' WHERE id IN (%s, %s)", (first, second))
+        conn.commit()
+        ad_scheduler.ad_scheduler.refresh(force=True)
@@ -0,0 +1,41 @@
+import uuid
+from datetime import date, timedelta
+
+
+def make_driver(db, documents=None):
+    with db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO users (name, email, password, role, phone) VALUES ('Doc Driver', %s, 'x', 'driver', '9000000000') RETURNING id",
+                (f"driver-{uuid.uuid4().hex}@example.com",)
+            )
+            user_id = cur.fetchone()["id"]
+        conn.commit()
+    return db.create_driver({"status": "Active", "documents": documents}, user_id)
+
+
+def test_new_driver_documents_are_recorded(migrated_db, conn):
+    driver_id = make_driver(migrated_db)
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT document_type, status, expiry_date FROM driver_documents WHERE driver_id = %s ORDER BY document_type",
+            (driver_id,)
+        )
+        rows = cur.fetchall()
+    assert [row["document_type"] for row in rows] == ["insurance", "license", "vehicle_registration"]
+    assert {row["status"] for row in rows} == {"Pending"}
+    assert {row["expiry_date"] for row in rows} == {
+        date.today() + timedelta(days=migrated_db.DRIVER_DOCUMENT_VALIDITY_DAYS)
+    }
+
+
+def test_document_expiry_audience_finds_expiring_documents(migrated_db):
+    import alert_fanout
+    driver_id = make_driver(migrated_db, {
+        "license": {"status": "Verified", "expiry": (date.today() + timedelta(days=10)).isoformat()},
+        "insurance": {"status": "Verified", "expiry": (date.today() + timedelta(days=200)).isoformat()},
+    })
+    keys = {row["recipient_key"]: row for row in alert_fanout.get_recipients("document_expiry")}
+    assert f"driver:{driver_id}:license" in keys
+    assert keys[f"driver:{driver_id}:license"]["days_remaining"] == 10
+    assert f"driver:{driver_id}:insurance" not in keys
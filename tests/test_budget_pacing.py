@@ -0,0 +1,132 @@
+import time
+import uuid
+from contextlib import contextmanager
+import pytest
+import ad_events
+import budget_pacing
+from budget_pacing import BudgetPacer
+
+
+def loaded_pacer(budget=10, spent=0, tokens=100):
+    """A pacer tracking campaign 1 without touching the database"""
+    pacer = BudgetPacer(reconcile_interval=3600)
+    pacer._buckets = {1: {
+        "budget": budget, "spent": spent, "reserved": 0, "daily_target": budget, "hourly_target": budget / 24,
+        "capacity": tokens, "tokens": tokens, "refilled_at": time.monotonic(),
+    }}
+    pacer._loaded = True
+    return pacer
+
+
+def test_reserve_refuses_past_budget():
+    pacer = loaded_pacer(budget=3)
+    assert [pacer.reserve(1, 1) for _ in range(4)] == [True, True, True, False]
+    assert pacer.is_exhausted(1)
+
+
+def test_charge_clamps_to_remaining_budget():
+    pacer = loaded_pacer(budget=10, spent=4, tokens=0)
+    # Reported spend is not paced, only capped
+    assert pacer.charge(1, 5) == 5
+    assert pacer.charge(1, 5) == 1
+    assert pacer.charge(1, 5) == 0
+    assert pacer.remaining(1) == 0 and pacer.is_exhausted(1)
+    assert pacer.charge(2, 5) is None
+
+
+def test_failed_load_backs_off(monkeypatch):
+    attempts = []
+
+    @contextmanager
+    def unreachable():
+        attempts.append(None)
+        yield None
+
+    monkeypatch.setattr(budget_pacing.db, "get_db_connection", unreachable)
+    monkeypatch.setattr(ad_events.event_writer, "flush", lambda: 0)
+    pacer = BudgetPacer(reconcile_interval=3600)
+    for _ in range(20):
+        assert not pacer.reserve(1, 1)
+    assert len(attempts) == 1
+
+    pacer._retry_at = 0.0
+    pacer.reserve(1, 1)
+    assert len(attempts) == 2
+
+
+@pytest.fixture
+def campaign(migrated_db):
+    """Factory for committed Active campaigns; they are completed afterwards"""
+    created = []
+
+    def create(budget):
+        with migrated_db.get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "INSERT INTO users (name, email, password, role) VALUES ('Pacing Ads', %s, 'x', 'advertiser') "
+                    "RETURNING id", (f"pacing-{uuid.uuid4().hex}@example.com",)
+                )
+                cur.execute(
+                    "INSERT INTO campaigns (name, advertiser_id, status, budget) VALUES ('Paced', %s, 'Active', %s) "
+                    "RETURNING id", (cur.fetchone()["id"], budget)
+                )
+                created.append(cur.fetchone()["id"])
+            conn.commit()
+        return created[-1]
+
+    yield create
+    with migrated_db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE campaigns SET status = 'Completed' WHERE id = ANY(%s)", (created,))
+        conn.commit()
+
+
+def test_untracked_spend_is_recorded_as_reported(migrated_db, campaign, monkeypatch):
+    # A Draft campaign: the pacer does not track it
+    campaign_id = campaign(3)
+    with migrated_db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("UPDATE campaigns SET status = 'Draft' WHERE id = %s", (campaign_id,))
+        conn.commit()
+    pacer = BudgetPacer(reconcile_interval=3600)
+    monkeypatch.setattr(budget_pacing, "pacer", pacer)
+    recorded = []
+    monkeypatch.setattr(ad_events, "record_event", lambda *args: recorded.append(args) or True)
+
+    assert migrated_db.update_campaign_metrics(campaign_id, views=1, impressions=1, spent=5)
+    assert recorded == [(campaign_id, "metrics", 1, 1, 5)]
+
+
+def campaign_status(db, campaign_id):
+    with db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT status FROM campaigns WHERE id = %s", (campaign_id,))
+            return cur.fetchone()["status"]
+
+
+def test_failed_flush_keeps_reservations(migrated_db, campaign, monkeypatch):
+    campaign_id = campaign(10)
+    pacer = BudgetPacer(reconcile_interval=3600)
+    pacer.reconcile()
+    assert pacer.charge(campaign_id, 4) == 4
+
+    monkeypatch.setattr(ad_events.event_writer, "flush", lambda: None)
+    pacer.reconcile()
+    assert pacer.remaining(campaign_id) == 6
+
+
+def test_reported_spend_completes_campaign(migrated_db, campaign, monkeypatch):
+    campaign_id = campaign(3)
+    pacer = BudgetPacer(reconcile_interval=3600)
+    monkeypatch.setattr(budget_pacing, "pacer", pacer)
+
+    assert migrated_db.update_campaign_metrics(campaign_id, views=10, impressions=10, spent=5)
+    assert pacer.remaining(campaign_id) == 0
+
+    assert pacer.reconcile() == [campaign_id]
+    assert campaign_status(migrated_db, campaign_id) == "Completed"
+    ad_events.rollup_events()
+    with migrated_db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT spent, views FROM campaigns WHERE id = %s", (campaign_id,))
+            assert cur.fetchone() == {"spent": 3, "views": 10}
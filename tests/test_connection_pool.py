@@ -0,0 +1,84 @@
+import threading
+import psycopg2
+import pytest
+from db import ConnectionPool
+
+
+def test_connections_are_reused(database_url):
+    pool = ConnectionPool(database_url, min_size=1, max_size=2)
+    for _ in range(10):
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+    stats = pool.stats()
+    assert stats["checkouts"] == 10
+    assert stats["misses"] == 1
+    assert stats["size"] == 1
+    pool.close()
+
+
+def test_size_never_exceeds_max(database_url):
+    pool = ConnectionPool(database_url, max_size=3, timeout=10)
+    in_use = []
+    peak = [0]
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(5):
+            with pool.connection() as conn:
+                with lock:
+                    in_use.append(conn)
+                    peak[0] = max(peak[0], len(in_use))
+                with conn.cursor() as cur:
+                    cur.execute("SELECT pg_sleep(0.005)")
+                with lock:
+                    in_use.remove(conn)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    stats = pool.stats()
+    assert peak[0] <= 3
+    assert stats["misses"] <= 3
+    assert stats["checkouts"] == 40
+    assert stats["waits"] > 0
+    pool.close()
+
+
+def test_checkout_times_out_when_exhausted(database_url):
+    pool = ConnectionPool(database_url, max_size=1, timeout=0.2)
+    held = pool.getconn()
+    with pytest.raises(psycopg2.OperationalError):
+        pool.getconn()
+    assert pool.stats()["timeouts"] == 1
+    pool.putconn(held)
+    pool.close()
+
+
+def test_broken_idle_connection_is_replaced(database_url):
+    pool = ConnectionPool(database_url, max_size=1, check_after=0)
+    first = pool.getconn()
+    pool.putconn(first)
+    first.close()
+
+    with pool.connection() as conn:
+        assert conn is not first
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+    assert pool.stats()["health_check_failures"] == 1
+    pool.close()
+
+
+def test_connections_older_than_max_age_are_replaced(database_url):
+    pool = ConnectionPool(database_url, max_size=1, max_age=0)
+    first = pool.getconn()
+    pool.putconn(first)
+    second = pool.getconn()
+    assert second is not first
+    assert first.closed
+    assert pool.stats()["expired"] == 1
+    pool.putconn(second)
+    pool.close()
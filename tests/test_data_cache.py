@@ -0,0 +1,77 @@
+import time
+from data_cache import SharedDataCache
+
+
+def counting_loader():
+    calls = []
+
+    def loader():
+        calls.append(None)
+        return len(calls)
+    return loader, calls
+
+
+def test_expire_coalesces_reloads():
+    cache = SharedDataCache(ttl=60)
+    loader, calls = counting_loader()
+    assert cache.get("drivers", loader) == 1
+
+    for _ in range(100):
+        cache.expire("drivers", within=0.2)
+        assert cache.get("drivers", loader) == 1
+    assert len(calls) == 1
+
+    time.sleep(0.25)
+    assert cache.get("drivers", loader) == 2
+    # Reloading clears the stale mark
+    assert cache.get("drivers", loader) == 2
+
+
+def test_invalidate_reloads_immediately():
+    cache = SharedDataCache(ttl=60)
+    loader, calls = counting_loader()
+    cache.get("drivers", loader)
+    version = cache.version("drivers")
+    cache.invalidate("drivers")
+    assert cache.version("drivers") > version
+    assert cache.get("drivers", loader) == 2
+
+
+def test_versioned_memo_recomputes_on_new_version_or_list(monkeypatch):
+    import data_cache
+    cache = SharedDataCache(ttl=60)
+    monkeypatch.setattr(data_cache, "shared_cache", cache)
+    memo = data_cache.VersionedMemo()
+    computed = []
+
+    def total(items):
+        computed.append(None)
+        return sum(items)
+
+    items = cache.get("campaigns", lambda: [1, 2, 3])
+    assert memo.get("total", "campaigns", items, total) == 6
+    assert memo.get("total", "campaigns", items, total) == 6
+    assert len(computed) == 1
+
+    # A session still holding another list is not served the stored value
+    assert memo.get("total", "campaigns", [1], total) == 1
+    cache.invalidate("campaigns")
+    items = cache.get("campaigns", lambda: [4, 5])
+    assert memo.get("total", "campaigns", items, total) == 9
+    assert len(computed) == 3
+
+
+def test_versioned_memo_drops_entries_of_older_versions(monkeypatch):
+    import data_cache
+    cache = SharedDataCache(ttl=60)
+    monkeypatch.setattr(data_cache, "shared_cache", cache)
+    memo = data_cache.VersionedMemo()
+
+    for reload in range(5):
+        cache.invalidate("campaigns")
+        items = cache.get("campaigns", lambda: [reload])
+        for advertiser in range(3):
+            memo.get(("figure", advertiser), "campaigns", items, sum)
+        memo.get("drivers", "drivers", cache.get("drivers", lambda: [1]), sum)
+    # Only the latest version's figures and the drivers entry remain
+    assert len(memo) == 4
@@ -0,0 +1,41 @@
+import uuid
+from datetime import date, datetime, timedelta
+import pytest
+
+
+@pytest.fixture
+def driver_id(migrated_db):
+    with migrated_db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO users (name, email, password, role) VALUES ('Ping Driver', %s, 'x', 'driver') RETURNING id",
+                (f"driver-{uuid.uuid4().hex}@example.com",)
+            )
+            user_id = cur.fetchone()["id"]
+        conn.commit()
+    return migrated_db.create_driver({"status": "Active"}, user_id)
+
+
+def test_copy_escapes_reported_area(migrated_db, driver_id, conn):
+    # Outside every geofence, so the reported area is recorded as sent
+    area = "Back\\slash\tTab\nLine"
+    recorded_at = datetime.now().replace(microsecond=0)
+    assert migrated_db.update_driver_locations_bulk([
+        {"driver_id": driver_id, "lat": 1.5, "lon": 2.5, "area": area, "recorded_at": recorded_at},
+        {"driver_id": driver_id, "lat": 1.5, "lon": 2.5, "area": None, "recorded_at": recorded_at},
+    ])
+    with conn.cursor() as cur:
+        cur.execute("SELECT area FROM driver_locations WHERE driver_id = %s ORDER BY area NULLS LAST", (driver_id,))
+        assert [row["area"] for row in cur.fetchall()] == [area, None]
+
+
+def test_dropped_partitions_are_forgotten(migrated_db, conn):
+    old_day = date.today() - timedelta(days=migrated_db.DRIVER_LOCATION_RETENTION_DAYS + 5)
+    with conn.cursor() as cur:
+        migrated_db.ensure_location_partitions(cur, [old_day])
+    conn.commit()
+    assert old_day in migrated_db._location_partitions
+
+    dropped = migrated_db.drop_old_location_partitions()
+    assert f"driver_locations_p{old_day:%Y%m%d}" in dropped
+    assert old_day not in migrated_db._location_partitions
@@ -0,0 +1,67 @@
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+import numpy as np
+import pytest
+import driver_payouts
+
+
+def test_earnings_are_deterministic():
+    base, incentives, total = driver_payouts.compute_earnings([10, 2.5, 0], [250, 120, 90])
+    assert base.tolist() == [320.0, 80.0, 0.0]
+    # Rs.5 per km beyond 100 km, capped at Rs.500
+    assert incentives.tolist() == [500.0, 100.0, 0.0]
+    assert np.array_equal(total, base + incentives)
+
+
+@pytest.fixture
+def week(migrated_db, conn):
+    """Last week, with any earlier payout run for it removed"""
+    week_start = driver_payouts.week_start_of()
+    run_key = f"weekly-{week_start.isoformat()}"
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM payments WHERE payout_run_id IN (SELECT id FROM payout_runs WHERE run_key = %s)",
+                    (run_key,))
+        cur.execute("DELETE FROM payout_runs WHERE run_key = %s", (run_key,))
+        cur.execute("DELETE FROM driver_locations WHERE recorded_at >= %s AND recorded_at < %s",
+                    (week_start, week_start + timedelta(days=7)))
+    conn.commit()
+    return week_start
+
+
+def test_weekly_payout_uses_recorded_history_and_runs_once(migrated_db, conn, week):
+    with conn.cursor() as cur:
+        cur.execute(
+            "INSERT INTO users (name, email, password, role) VALUES ('Payout Driver', %s, 'x', 'driver') RETURNING id",
+            (f"payout-{uuid.uuid4().hex}@example.com",)
+        )
+        user_id = cur.fetchone()["id"]
+        cur.execute("INSERT INTO drivers (user_id, status) VALUES (%s, 'Active') RETURNING id", (user_id,))
+        driver_id = cur.fetchone()["id"]
+
+        start = datetime.combine(week + timedelta(days=1), datetime.min.time()).replace(hour=9)
+        # Two hours of pings every 5 minutes, then one ping after a long offline gap
+        pings = [(start + timedelta(minutes=5 * i), 22.70 + 0.001 * i) for i in range(25)]
+        pings.append((start + timedelta(hours=6), 22.80))
+        migrated_db.ensure_location_partitions(cur, {recorded_at.date() for recorded_at, _ in pings})
+        for recorded_at, lat in pings:
+            cur.execute(
+                "INSERT INTO driver_locations (driver_id, recorded_at, lat, lon) VALUES (%s, %s, %s, 75.85)",
+                (driver_id, recorded_at, lat)
+            )
+    conn.commit()
+
+    first = driver_payouts.run_weekly_payouts(week)
+    assert first["created"]
+    with conn.cursor() as cur:
+        cur.execute("SELECT amount FROM payments WHERE user_id = %s AND payout_run_id = %s",
+                    (user_id, first["id"]))
+        # 2 active hours at Rs.32; about 2.65 km, far below the incentive threshold
+        assert [row["amount"] for row in cur.fetchall()] == [Decimal("64.00")]
+
+    second = driver_payouts.run_weekly_payouts(week)
+    assert not second["created"]
+    assert second["id"] == first["id"] and second["total_amount"] == first["total_amount"]
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS n FROM payments WHERE payout_run_id = %s", (first["id"],))
+        assert cur.fetchone()["n"] == first["driver_count"]
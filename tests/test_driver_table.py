@@ -0,0 +1,48 @@
+from decimal import Decimal
+import numpy as np
+from driver_table import DriverTable
+
+
+def record(driver_id, status="Active", hours=3, earnings=96, incentives=0, kms=120):
+    return {
+        "id": driver_id, "user_id": driver_id + 100, "name": f"Driver {driver_id}", "phone": "+91",
+        "city": "Indore", "vehicle_model": "Swift Dzire", "vehicle_number": f"MP09 {driver_id}",
+        "status": status, "current_location": {"area": "Palasia", "lat": 22.72, "lon": 75.86},
+        "kms_today": kms, "hours_active": hours, "rating": 4.5,
+        "earnings": {"today": earnings + incentives, "base": earnings, "incentives": incentives},
+        "documents": {"license": {"status": "Verified", "expiry": "2027-01-31"}},
+        "current_ad_displaying": None,
+    }
+
+
+def test_views_match_the_records():
+    records = [record(1), record(2, hours=Decimal("3.00"), earnings=Decimal("96.00"), incentives=Decimal("12.50"))]
+    table = DriverTable.from_records(records)
+    for view, original in zip(table, records):
+        assert view["documents"]["license"] == original["documents"]["license"]
+        assert view["earnings"] == original["earnings"]
+        assert view["current_location"] == original["current_location"]
+        for key in ("id", "user_id", "name", "status", "kms_today", "hours_active", "rating"):
+            assert view[key] == original[key]
+
+
+def test_display_types_are_kept():
+    table = DriverTable.from_records([record(1), record(2, hours=Decimal("3.00"), earnings=Decimal("96.00"))])
+    assert f"{table[0]['hours_active']} hrs" == "3 hrs"
+    assert f"Rs.{table[0]['earnings']['today']}" == "Rs.96"
+    assert f"{table[1]['hours_active']} hrs" == "3.00 hrs"
+    assert f"Rs.{table[1]['earnings']['base']}" == "Rs.96.00"
+
+
+def test_kpis_filter_and_lookup():
+    table = DriverTable.from_records([record(1), record(2, status="Inactive", kms=0), record(3, kms=80)])
+    kpis = table.kpis()
+    assert kpis["active"] == 2 and kpis["inactive"] == 1
+    assert kpis["avg_distance_today"] == 100
+    assert kpis["earnings_today"] == 288.0
+    active = table.filter(table.status_mask("Active"))
+    assert [view["id"] for view in active] == [1, 3]
+    assert active[1]["hours_active"] == 3
+    assert table.row_of("user_id", 102) == 1
+    assert table.row_of("user_id", 999) is None
+    assert isinstance(table.column("hours_active"), np.ndarray)
@@ -0,0 +1,77 @@
+import uuid
+import pytest
+from psycopg2.extras import RealDictCursor, execute_values
+
+
+@pytest.fixture
+def advertiser(migrated_db):
+    """A committed advertiser user; their campaigns are removed afterwards"""
+    with migrated_db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO users (name, email, password, role) VALUES (%s, %s, 'x', 'advertiser') RETURNING id",
+                ("Query Count Ads", f"ads-{uuid.uuid4().hex}@example.com")
+            )
+            advertiser_id = cur.fetchone()["id"]
+        conn.commit()
+    yield advertiser_id
+    with migrated_db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "DELETE FROM campaign_regions WHERE campaign_id IN (SELECT id FROM campaigns WHERE advertiser_id = %s)",
+                (advertiser_id,)
+            )
+            cur.execute("DELETE FROM campaigns WHERE advertiser_id = %s", (advertiser_id,))
+            cur.execute("DELETE FROM users WHERE id = %s", (advertiser_id,))
+        conn.commit()
+
+
+def add_campaigns(db, advertiser_id, count):
+    with db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            ids = execute_values(
+                cur,
+                "INSERT INTO campaigns (name, advertiser_id, status, budget) VALUES %s RETURNING id",
+                [(f"Campaign {i}", advertiser_id, "Active", 1000) for i in range(count)],
+                fetch=True
+            )
+            execute_values(
+                cur,
+                "INSERT INTO campaign_regions (campaign_id, region_name) VALUES %s",
+                [(row["id"], region) for row in ids for region in ("Vijay Nagar", "Palasia")]
+            )
+        conn.commit()
+
+
+def count_queries(monkeypatch, fn, *args):
+    calls = []
+    execute = RealDictCursor.execute
+
+    def counting_execute(self, query, vars=None):
+        calls.append(query)
+        return execute(self, query, vars)
+
+    monkeypatch.setattr(RealDictCursor, "execute", counting_execute)
+    result = fn(*args)
+    monkeypatch.setattr(RealDictCursor, "execute", execute)
+    return len(calls), result
+
+
+def test_query_count_is_constant_in_campaign_count(migrated_db, advertiser, monkeypatch):
+    n = 20
+    add_campaigns(migrated_db, advertiser, n)
+    small_queries, small = count_queries(monkeypatch, migrated_db.get_campaigns, advertiser)
+
+    add_campaigns(migrated_db, advertiser, 9 * n)
+    large_queries, large = count_queries(monkeypatch, migrated_db.get_campaigns, advertiser)
+
+    assert len(small) == n
+    assert len(large) == 10 * n
+    assert small_queries == large_queries
+
+
+def test_regions_are_attached_to_each_campaign(migrated_db, advertiser):
+    add_campaigns(migrated_db, advertiser, 3)
+    campaigns = migrated_db.get_campaigns(advertiser)
+    assert [c["regions"] for c in campaigns] == [["Vijay Nagar", "Palasia"]] * 3
+    assert all(c["advertiser"] == "Query Count Ads" for c in campaigns)
@@ -0,0 +1,53 @@
+import uuid
+import pytest
+import alert_fanout
+from milestones import MilestoneTracker
+
+
+@pytest.fixture
+def campaign_id(migrated_db):
+    with migrated_db.get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                "INSERT INTO users (name, email, password, role, phone) VALUES ('Milestone Advertiser', %s, 'x', 'advertiser', '9000000001') RETURNING id",
+                (f"advertiser-{uuid.uuid4().hex}@example.com",)
+            )
+            user_id = cur.fetchone()["id"]
+            cur.execute(
+                "INSERT INTO campaigns (name, advertiser_id, status, budget, views) VALUES ('Milestones', %s, 'Active', 1000, 1500) RETURNING id",
+                (user_id,)
+            )
+            campaign_id = cur.fetchone()["id"]
+        conn.commit()
+    return campaign_id
+
+
+def announced(conn, campaign_id):
+    with conn.cursor() as cur:
+        cur.execute("SELECT milestone FROM campaign_milestones WHERE campaign_id = %s", (campaign_id,))
+        row = cur.fetchone()
+        cur.execute("SELECT COUNT(*) AS n FROM sms_outbox WHERE dedup_key = %s",
+                    (f"campaign_milestone:campaign:{campaign_id}:1000",))
+        queued = cur.fetchone()["n"]
+    conn.rollback()
+    return (row["milestone"] if row else None), queued
+
+
+def test_milestone_is_marked_with_its_alert(campaign_id, conn):
+    assert MilestoneTracker().check([{"id": campaign_id, "views": 1500}]) == [(campaign_id, 1000)]
+    assert announced(conn, campaign_id) == (1000, 1)
+
+
+def test_failed_enqueue_leaves_the_milestone_unannounced(campaign_id, conn, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("outbox unavailable")
+
+    tracker = MilestoneTracker()
+    monkeypatch.setattr(alert_fanout, "fan_out", fail)
+    assert tracker.check([{"id": campaign_id, "views": 1500}]) == []
+    assert announced(conn, campaign_id) == (None, 0)
+
+    # The next rollup retries the crossing
+    monkeypatch.undo()
+    assert tracker.check([{"id": campaign_id, "views": 1500}]) == [(campaign_id, 1000)]
+    assert announced(conn, campaign_id) == (1000, 1)
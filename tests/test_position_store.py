@@ -0,0 +1,57 @@
+import random
+import position_store
+from position_store import PositionStore
+
+
+def apply(session, delta):
+    """What a client keeping its own copy of the fleet does with a delta"""
+    if delta["full"]:
+        session.clear()
+    for driver_id, lat, lon, area in delta["positions"]:
+        session[driver_id] = (lat, lon, area)
+
+
+def test_deltas_rebuild_the_fleet():
+    store = PositionStore(log_size=50)
+    store.load([(i, 22.7, 75.8, "Palasia") for i in range(20)])
+    rng = random.Random(3)
+    session, version = {}, 0
+    for _ in range(40):
+        store.record([(rng.randrange(30), rng.random(), rng.random(), None) for _ in range(5)])
+        if rng.random() < 0.5:
+            delta = store.changes_since(version)
+            apply(session, delta)
+            version = delta["version"]
+    apply(session, store.changes_since(version))
+    assert session == {driver_id: (lat, lon, area) for driver_id, (_, lat, lon, area) in store._positions.items()}
+
+
+def test_only_moved_drivers_are_returned():
+    store = PositionStore()
+    store.load([(1, 22.7, 75.8, "Palasia"), (2, 22.71, 75.81, "Rajwada")])
+    assert store.changes_since(0)["full"]
+    version = store.version
+    store.record([(2, 22.72, 75.82, None)])
+    delta = store.changes_since(version)
+    # The last known area is kept when a ping has none
+    assert delta == {"version": version + 1, "full": False, "positions": [(2, 22.72, 75.82, "Rajwada")]}
+
+
+def test_failed_load_is_retried_later(monkeypatch):
+    import db
+    calls = []
+
+    def failing_positions():
+        calls.append(None)
+        return None
+
+    monkeypatch.setattr(db, "get_driver_positions", failing_positions)
+    monkeypatch.setattr(position_store, "store", PositionStore())
+    monkeypatch.setattr(position_store, "_next_sync", 0.0)
+    position_store.get_position_store()
+    position_store.get_position_store()
+    assert len(calls) == 1
+
+    monkeypatch.setattr(position_store, "_next_sync", 0.0)
+    monkeypatch.setattr(db, "get_driver_positions", lambda: [{"id": 5, "lat": 22.7, "lon": 75.8, "area": "Palasia"}])
+    assert position_store.get_position_store().get(5)[1:] == (22.7, 75.8, "Palasia")
@@ -0,0 +1,54 @@
+import time
+import uuid
+import pytest
+from sms_outbox import NumberRateLimiter, SmsOutbox, StubProvider
+
+
+@pytest.fixture
+def outbox(migrated_db):
+    outbox = SmsOutbox(
+        provider=StubProvider(latency=0, log=False), queue=f"t{uuid.uuid4().hex[:12]}", workers=1,
+        poll_interval=0.05, max_attempts=3, limiter=NumberRateLimiter(per_minute=6000, burst=100),
+    )
+    yield outbox
+    outbox.stop()
+
+
+def insert(conn, outbox, status="queued", attempts=0, claimed_seconds_ago=None):
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO sms_outbox (queue, phone, message, status, attempts, claimed_at)
+            VALUES (%s, '+919800000000', 'hello', %s, %s,
+                    CURRENT_TIMESTAMP - %s * INTERVAL '1 second')
+            RETURNING id
+        """, (outbox.queue, status, attempts, claimed_seconds_ago))
+        row_id = cur.fetchone()["id"]
+    conn.commit()
+    return row_id
+
+
+def statuses(conn, ids):
+    with conn.cursor() as cur:
+        cur.execute("SELECT id, status FROM sms_outbox WHERE id = ANY(%s)", (ids,))
+        return {row["id"]: row["status"] for row in cur.fetchall()}
+
+
+def test_expired_claims_are_retried_until_max_attempts(outbox, conn):
+    lease = 10_000
+    retry = insert(conn, outbox, "sending", attempts=1, claimed_seconds_ago=lease)
+    exhausted = insert(conn, outbox, "sending", attempts=3, claimed_seconds_ago=lease)
+    fresh = insert(conn, outbox, "sending", attempts=1, claimed_seconds_ago=0)
+
+    outbox.process_batch()
+    assert statuses(conn, [retry, exhausted, fresh]) == {retry: "sent", exhausted: "failed", fresh: "sending"}
+    assert outbox.stats()["failed"] == 1
+
+
+def test_started_workers_drain_rows_queued_elsewhere(outbox, conn):
+    # Queued by another process: nothing was enqueued through this outbox
+    row_id = insert(conn, outbox)
+    outbox.start()
+    deadline = time.monotonic() + 10
+    while statuses(conn, [row_id])[row_id] != "sent" and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert statuses(conn, [row_id])[row_id] == "sent"
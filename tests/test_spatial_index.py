@@ -0,0 +1,81 @@
+import random
+import spatial_index
+from spatial_index import GridSpatialIndex, _linear_nearest, _linear_within_radius
+
+
+def fleet(n=2000, seed=7):
+    rng = random.Random(seed)
+    return [
+        (i, 22.7196 + (rng.random() - 0.5) * 0.27, 75.8577 + (rng.random() - 0.5) * 0.29)
+        for i in range(n)
+    ]
+
+
+def test_queries_match_linear_scan():
+    positions = fleet()
+    index = GridSpatialIndex()
+    index.update_many(positions)
+    rng = random.Random(11)
+    for _ in range(50):
+        lat = 22.7196 + (rng.random() - 0.5) * 0.27
+        lon = 75.8577 + (rng.random() - 0.5) * 0.29
+        assert [d for d, _ in index.within_radius(lat, lon, 0.7)] == \
+            [d for d, _ in _linear_within_radius(positions, lat, lon, 0.7)]
+        assert [d for d, _ in index.nearest(lat, lon, 8)] == \
+            [d for d, _ in _linear_nearest(positions, lat, lon, 8)]
+        box = (lat - 0.01, lon - 0.01, lat + 0.01, lon + 0.01)
+        assert sorted(index.in_bbox(*box)) == sorted(
+            d for d, plat, plon in positions if box[0] <= plat <= box[2] and box[1] <= plon <= box[3]
+        )
+
+
+def test_moves_and_removals_update_cells():
+    index = GridSpatialIndex()
+    index.update(1, 22.70, 75.85)
+    index.update(1, 22.80, 75.95)
+    assert index.in_bbox(22.69, 75.84, 22.71, 75.86) == []
+    assert index.nearest(22.80, 75.95, 1)[0][0] == 1
+    index.remove(1)
+    assert len(index) == 0 and index.nearest(22.80, 75.95, 1) == []
+
+
+def test_load_replaces_positions():
+    index = GridSpatialIndex()
+    index.update_many([(1, 22.70, 75.85), (2, 22.71, 75.86)])
+    index.load([(2, 22.72, 75.87)])
+    assert 1 not in index
+    assert index.get(2) == (22.72, 75.87)
+
+
+def test_failed_load_is_retried_later(monkeypatch):
+    import db
+    calls = []
+
+    def failing_positions():
+        calls.append(None)
+        return None
+
+    monkeypatch.setattr(db, "get_driver_positions", failing_positions)
+    monkeypatch.setattr(spatial_index, "driver_index", GridSpatialIndex())
+    monkeypatch.setattr(spatial_index, "_next_sync", 0.0)
+    spatial_index.get_driver_index()
+    spatial_index.get_driver_index()
+    assert len(calls) == 1
+
+    # Due again: the next call retries and a successful load is kept
+    monkeypatch.setattr(spatial_index, "_next_sync", 0.0)
+    monkeypatch.setattr(db, "get_driver_positions", lambda: [{"id": 5, "lat": 22.7, "lon": 75.8, "area": None}])
+    assert spatial_index.get_driver_index().get(5) == (22.7, 75.8)
+    # and not reloaded again before the resync interval
+    monkeypatch.setattr(db, "get_driver_positions", failing_positions)
+    assert spatial_index.get_driver_index().get(5) == (22.7, 75.8)
+    assert len(calls) == 1
+
+
+def test_fleet_map_renders_without_cabs(monkeypatch):
+    import fleet_map
+    monkeypatch.setattr(spatial_index, "driver_index", GridSpatialIndex())
+    monkeypatch.setattr(spatial_index, "_next_sync", float("inf"))
+    monkeypatch.setattr(fleet_map, "layers", fleet_map.FleetMapLayers())
+    for zoom in (10, 14):
+        assert fleet_map.payload_size(fleet_map.build_fleet_map(zoom)) > 0
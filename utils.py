@@ -4,6 +4,8 @@ import numpy as np
 from datetime import datetime, timedelta
 import random
 import base64
+import data_cache
+from driver_table import DriverTable
 
 def load_css():
     """Load custom CSS for styling"""
@@ -115,6 +117,16 @@ def load_css():
 
 def initialize_session_state():
     """Initialize session state variables if they don't already exist"""
+    # Schema check and outbox workers start once per process, not once per session
+    try:
+        import db
+        db.ensure_schema()
+        if db.DATABASE_URL:
+            import sms_outbox
+            sms_outbox.start_workers()
+    except Exception as e:
+        st.warning(f"Unable to verify database schema: {e}")
+
     if "logged_in" not in st.session_state:
         st.session_state.logged_in = False
     
@@ -127,17 +139,16 @@ def initialize_session_state():
     if "user_email" not in st.session_state:
         st.session_state.user_email = None
     
-    if "active_campaigns" not in st.session_state:
-        st.session_state.active_campaigns = generate_mock_campaigns()
-        
-    if "drivers" not in st.session_state:
-        st.session_state.drivers = generate_mock_drivers()
+    # Campaigns, drivers and locations come from the process-wide cache, so every
+    # session references the same (read-only) lists and sees invalidations on rerun
+    st.session_state.active_campaigns = data_cache.get_cached(data_cache.CAMPAIGNS, generate_mock_campaigns)
+    st.session_state.drivers = data_cache.get_cached(data_cache.DRIVERS, generate_mock_drivers)
+    st.session_state.high_viewership_locations = data_cache.get_cached(
+        data_cache.LOCATIONS, generate_high_viewership_locations
+    )
         
     if "ad_templates" not in st.session_state:
         st.session_state.ad_templates = generate_mock_templates()
-        
-    if "high_viewership_locations" not in st.session_state:
-        st.session_state.high_viewership_locations = generate_high_viewership_locations()
     
     if "notifications" not in st.session_state:
         st.session_state.notifications = generate_mock_notifications()
@@ -158,6 +169,24 @@ def initialize_session_state():
         st.session_state.faqs = []
         st.session_state.payment_methods = []
 
+def get_session_user_id():
+    """
+    Database id of the logged-in user, or None for demo/unknown accounts
+
+    Resolved from the session email once per login and kept in session state.
+    """
+    if "user_id" not in st.session_state:
+        user_id = None
+        if st.session_state.get("user_email"):
+            try:
+                import db
+                user = db.get_user_by_email(st.session_state.user_email)
+                user_id = user["id"] if user else None
+            except Exception:
+                user_id = None
+        st.session_state.user_id = user_id
+    return st.session_state.user_id
+
 def generate_mock_campaigns():
     """Generate sample campaign data for demonstration"""
     # First try to get campaigns from the database
@@ -178,6 +207,7 @@ def generate_mock_campaigns():
                 campaigns.append({
                     "id": campaign["id"],
                     "name": campaign["name"],
+                    "advertiser_id": campaign["advertiser_id"],
                     "advertiser": campaign["advertiser"],
                     "status": campaign["status"],
                     "ad_type": campaign["ad_type"],
@@ -260,7 +290,7 @@ def generate_mock_campaigns():
     return campaigns
 
 def generate_mock_drivers():
-    """Generate sample driver data for demonstration"""
+    """Generate sample driver data for demonstration, as a columnar DriverTable"""
     # Try to get drivers from the database
     try:
         import db
@@ -289,6 +319,7 @@ def generate_mock_drivers():
                 # Add calculated data
                 drivers.append({
                     "id": driver["id"],
+                    "user_id": driver["user_id"],
                     "name": driver["name"],
                     "phone": driver.get("phone", ""),
                     "city": "Indore",
@@ -315,7 +346,7 @@ def generate_mock_drivers():
                     },
                     "current_ad_displaying": driver.get("current_ad_displaying", 1)
                 })
-            return drivers
+            return DriverTable.from_records(drivers)
     except Exception as e:
         st.warning(f"Unable to get drivers from database: {e}. Using mock data.")
     
@@ -368,7 +399,7 @@ def generate_mock_drivers():
             },
             "current_ad_displaying": random.randint(1, 4)
         })
-    return drivers
+    return DriverTable.from_records(drivers)
 
 def generate_mock_templates():
     """Generate sample ad templates for the platform"""